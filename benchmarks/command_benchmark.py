@@ -0,0 +1,304 @@
+"""
+Benchmark of every registered command, and of saving and loading the books, on
+synthetic books of growing size.
+
+For each size level the books are generated from the seed, every command is run
+with realistic random arguments for `--repeat` calls or `--min-time` seconds, and
+the latency percentiles, the memory held by the books and the scaling exponent of
+each command between the smallest and the largest level are reported. `--json`
+writes everything to a file, so that runs on different commits can be compared.
+
+Usage:
+    python benchmarks/command_benchmark.py [--contacts 1000,10000,100000]
+        [--notes 1000,10000,100000] [--storage memory|pickle|binary|sharded]
+        [--commands find_contact,add_note] [--json PATH]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import zip_longest
+
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'src')))
+
+import command_registry as command_service  # noqa: E402
+from binary_snapshot import BinarySaver  # noqa: E402
+from memory import book_memory  # noqa: E402
+from metrics import Histogram  # noqa: E402
+from repository import AddressBook, NotesBook, Saver  # noqa: E402
+from sharded_storage import ShardedSaver  # noqa: E402
+from datagen import (STREETS, TAGS, WORDS, contact_name, make_birthday, make_contacts,  # noqa: E402
+                     make_notes, make_phone, make_text)
+
+
+class MemorySaver(Saver):
+    """Keeps a book in memory only, so that commands are timed without I/O"""
+
+    def __init__(self, data):
+        super().__init__(None)
+        self.__data = data
+
+    def load(self):
+        return self.__data
+
+    def save(self, data):
+        pass
+
+
+class Context:
+    """The state the argument generators draw from"""
+
+    def __init__(self, contacts, notes, extra, rng):
+        self.contacts = contacts
+        self.notes = notes
+        self.rng = rng
+        # Values added beyond the book size for the delete commands to remove
+        self.deletable_contacts = [contact_name(contacts + i) for i in range(extra)]
+        self.deletable_notes = [f"note{notes + i}" for i in range(extra)]
+        self.added = contacts + extra
+
+    def name(self):
+        return contact_name(self.rng.randrange(self.contacts))
+
+    def new_name(self):
+        self.added += 1
+        return contact_name(self.added)
+
+    def record(self):
+        name = self.name()
+        return name, command_service._addressbook.find_by_name(name)
+
+    def key(self):
+        return f"note{self.rng.randrange(self.notes)}"
+
+    def new_key(self):
+        self.added += 1
+        return f"note{self.notes + self.added}"
+
+    def tagged(self):
+        key = self.key()
+        tags = command_service._notesbook.find_by_key(key).tags
+        return [key, self.rng.choice(tags) if tags else "missing"]
+
+    def find_value(self):
+        name, record = self.record()
+        return self.rng.choice([name, record.phones[0].value, record.email.value])
+
+
+def update_phone_args(context):
+    name, record = context.record()
+    return [name, record.phones[0].value, make_phone(context.rng)]
+
+
+COMMAND_ARGS = {
+    "add_contact": lambda c: [c.new_name(), make_phone(c.rng), "bench@example.com",
+                              "12 Main St", make_birthday(c.rng)],
+    "add_phone": lambda c: [c.name(), make_phone(c.rng)],
+    "update_phone": update_phone_args,
+    "update_email": lambda c: [c.name(), f"bench{c.rng.randrange(1000)}@example.com"],
+    "update_address": lambda c: [c.name(), f"{c.rng.randrange(1, 200)} Oak Ave"],
+    "update_birthday": lambda c: [c.name(), make_birthday(c.rng)],
+    "show_birthday": lambda c: [c.name()],
+    "show_upcoming_birthday": lambda c: [],
+    "list_addressbook": lambda c: [],
+    "delete": lambda c: [c.deletable_contacts.pop() if c.deletable_contacts else c.new_name()],
+    "find_contact": lambda c: [c.find_value()],
+    "query_contacts": lambda c: ["domain=example.com", "AND", f"month={c.rng.randrange(1, 13)}",
+                                 "AND", f"phone^=+380{c.rng.randrange(10, 100)}"],
+    "find_by_address": lambda c: [str(c.rng.randrange(1, 200)), *c.rng.choice(STREETS).split()],
+    "mem_stats": lambda c: ["1000"],
+    "add_note": lambda c: [c.new_key(), *make_text(c.rng, 40).split()],
+    "list_notesbook": lambda c: [],
+    "delete_note": lambda c: [c.deletable_notes.pop() if c.deletable_notes else c.new_key()],
+    "update_note": lambda c: [c.key(), *make_text(c.rng, 40).split()],
+    "add_tag": lambda c: [c.key(), f"bench{c.rng.randrange(1000)}"],
+    "delete_tag": lambda c: c.tagged(),
+    "find_note_by_tag": lambda c: [c.rng.choice(TAGS)],
+    "find_in_notes_text": lambda c: [c.rng.choice(WORDS)],
+    "search_notes": lambda c: c.rng.sample(WORDS, 2),
+    "notes_between": lambda c: ["01.01.2024", f"{c.rng.randrange(1, 29):02}.01.2024"],
+    "latest_notes": lambda c: ["10"],
+}
+
+
+def create_savers(storage, directory, contacts, notes):
+    """Get the savers of both books, already holding the generated data"""
+    if storage == "memory":
+        return MemorySaver(contacts), MemorySaver(notes)
+    if storage == "pickle":
+        savers = (Saver(os.path.join(directory, "addressbook.pkl")),
+                  Saver(os.path.join(directory, "notesbook.pkl")))
+    elif storage == "binary":
+        savers = (BinarySaver(os.path.join(directory, "addressbook.snap")),
+                  Saver(os.path.join(directory, "notesbook.pkl")))
+    elif storage == "sharded":
+        savers = (Saver(os.path.join(directory, "addressbook.pkl")),
+                  ShardedSaver(os.path.join(directory, "notesbook"), blobs=True))
+    else:
+        raise ValueError(f"Unknown storage: {storage}")
+    savers[0].save(contacts)
+    savers[1].save(notes)
+    return savers
+
+
+def time_calls(call, repeat, min_time):
+    """Run a call until it was made `repeat` times or `min_time` seconds passed"""
+    histogram = Histogram()
+    started = time.perf_counter()
+    while histogram.count < repeat:
+        arguments = call.prepare()
+        start = time.perf_counter()
+        call.run(arguments)
+        histogram.record(time.perf_counter() - start)
+        if time.perf_counter() - started > min_time:
+            break
+    return histogram.to_dict()
+
+
+class CommandCall:
+    def __init__(self, executor, command, context):
+        self.executor = executor
+        self.command = command
+        self.context = context
+
+    def prepare(self):
+        return COMMAND_ARGS.get(self.command, lambda c: [])(self.context)
+
+    def run(self, arguments):
+        self.executor(self.command, *arguments)
+
+
+class SaverCall:
+    def __init__(self, saver, data, operation):
+        self.saver = saver
+        self.data = data
+        self.operation = operation
+
+    def prepare(self):
+        return None
+
+    def run(self, arguments):
+        if self.operation == "save":
+            self.saver.save(self.data)
+        else:
+            self.saver.load()
+
+
+def run_level(contacts_count, notes_count, args, commands):
+    rng = random.Random(args.seed)
+    contacts = make_contacts(contacts_count + args.repeat, rng)
+    notes = make_notes(notes_count + args.repeat, rng)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, data in (("addressbook", contacts), ("notesbook", notes)):
+            saver = Saver(os.path.join(directory, f"{name}-plain.pkl"))
+            for operation in ("save", "load"):
+                result = time_calls(SaverCall(saver, data, operation),
+                                    args.repeat, args.min_time)
+                result["command"] = f"saver.{operation}:{name}"
+                results.append(result)
+
+        savers = create_savers(args.storage, directory, contacts, notes)
+        command_service._addressbook = AddressBook(savers[0])
+        command_service._notesbook = NotesBook(savers[1])
+        executor = command_service.create_command_executor()
+        memory = {"addressbook": book_memory(command_service._addressbook, 1000)["total"],
+                  "notesbook": book_memory(command_service._notesbook, 1000)["total"]}
+        context = Context(contacts_count, notes_count, args.repeat, random.Random(args.seed))
+        for command in commands:
+            result = time_calls(CommandCall(executor, command, context),
+                                args.repeat, args.min_time)
+            result["command"] = command
+            results.append(result)
+        command_service._addressbook.close()
+        command_service._notesbook.close()
+    for result in results:
+        result["contacts"] = contacts_count
+        result["notes"] = notes_count
+    return results, memory
+
+
+def scaling(results):
+    """The log-log slope of the mean latency against the number of values"""
+    by_command = {}
+    for result in results:
+        by_command.setdefault(result["command"], []).append(result)
+    exponents = {}
+    for command, points in by_command.items():
+        first, last = points[0], points[-1]
+        sizes = (first["contacts"] + first["notes"], last["contacts"] + last["notes"])
+        if sizes[0] == sizes[1] or not first["mean"] or not last["mean"]:
+            continue
+        exponents[command] = math.log(last["mean"] / first["mean"]) / math.log(sizes[1] / sizes[0])
+    return exponents
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def sizes(value):
+    return [int(size) for size in value.split(",") if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=sizes, default=[1000, 10000, 100000])
+    parser.add_argument("--notes", type=sizes, default=[1000, 10000, 100000])
+    parser.add_argument("--storage", default="memory",
+                        choices=["memory", "pickle", "binary", "sharded"])
+    parser.add_argument("--commands", help="comma-separated commands, all by default")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--min-time", type=float, default=2.0,
+                        help="stop repeating a command after this many seconds")
+    parser.add_argument("--seed", type=int, default=8)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    commands = args.commands.split(",") if args.commands else command_service.get_commands()
+    levels = list(zip_longest(args.contacts, args.notes))
+    levels = [(contacts if contacts is not None else args.contacts[-1],
+               notes if notes is not None else args.notes[-1]) for contacts, notes in levels]
+    results = []
+    memory = []
+    for contacts_count, notes_count in levels:
+        level_results, level_memory = run_level(contacts_count, notes_count, args, commands)
+        results += level_results
+        memory.append(dict(level_memory, contacts=contacts_count, notes=notes_count))
+        print(f"contacts {contacts_count}, notes {notes_count}, memory "
+              f"{level_memory['addressbook'] + level_memory['notesbook']:,} B")
+        for result in level_results:
+            print(f"  {result['command']:28} {result['count']:>5} calls "
+                  f"p50 {result['p50'] * 1000:9.3f} ms p95 {result['p95'] * 1000:9.3f} ms "
+                  f"p99 {result['p99'] * 1000:9.3f} ms")
+    exponents = scaling(results)
+    if len(levels) > 1:
+        print("scaling exponents (1 is linear in the number of values):")
+        for command, exponent in sorted(exponents.items(), key=lambda item: -item[1]):
+            print(f"  {command:28} {exponent:6.2f}")
+    if args.json:
+        report = {
+            "meta": {"commit": git_commit(), "python": platform.python_version(),
+                     "platform": platform.platform(), "time": time.time(),
+                     "seed": args.seed, "storage": args.storage},
+            "results": results,
+            "memory": memory,
+            "scaling": exponents,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
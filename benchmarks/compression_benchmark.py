@@ -0,0 +1,71 @@
+"""
+Benchmark of the save/load time against the file size for every compression
+supported by `Saver`.
+
+Usage:
+    python benchmarks/compression_benchmark.py [--contacts N] [--notes N] [--json PATH]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'src')))
+
+from compression import COMPRESSIONS  # noqa: E402
+from repository import Saver  # noqa: E402
+from datagen import make_contacts, make_notes  # noqa: E402
+
+
+def measure(data, compression, path, repeat):
+    saver = Saver(path, compression)
+    save_times, load_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        saver.save(data)
+        save_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        saver.load()
+        load_times.append(time.perf_counter() - start)
+    return {
+        "compression": compression or "none",
+        "bytes": os.path.getsize(path),
+        "save_seconds": min(save_times),
+        "load_seconds": min(load_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=20000)
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=8)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    books = {"addressbook": make_contacts(args.contacts, rng),
+             "notesbook": make_notes(args.notes, rng)}
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for book, data in books.items():
+            for compression in COMPRESSIONS:
+                result = measure(data, compression,
+                                 os.path.join(directory, f"{book}.pkl"), args.repeat)
+                result["book"] = book
+                results.append(result)
+                print(f"{book:12} {result['compression']:5} {result['bytes']:>12,} B "
+                      f"save {result['save_seconds'] * 1000:8.1f} ms "
+                      f"load {result['load_seconds'] * 1000:8.1f} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Reproducible synthetic books for the benchmarks. The same seed always gives the
+same contacts and notes, and every generated value passes the validation of the
+commands, so the data can be fed to the command executor as well.
+"""
+import os
+import string
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'src')))
+
+from models import Note, Record  # noqa: E402
+
+WORDS = ["meeting", "call", "project", "deadline", "birthday", "gift", "review",
+         "budget", "travel", "doctor", "school", "report", "shopping", "plan"]
+TAGS = WORDS + [f"tag{i}" for i in range(50)]
+STREETS = ["Main St", "Oak Ave", "Park Rd", "Shevchenka St", "Lake Dr", "Hill St"]
+
+
+def contact_name(number):
+    """Letters only, as names may not contain digits: 0 -> Contacta, 26 -> Contactba"""
+    letters = ""
+    while True:
+        number, digit = divmod(number, 26)
+        letters += string.ascii_lowercase[digit]
+        if not number:
+            break
+    return f"Contact{letters}"
+
+
+def make_phone(rng):
+    return f"+380{rng.randrange(10 ** 9):09d}"
+
+
+def make_birthday(rng):
+    return f"{rng.randrange(1, 29):02d}.{rng.randrange(1, 13):02d}.19{rng.randrange(50, 99)}"
+
+
+def make_contact(number, rng):
+    name = contact_name(number)
+    record = Record(name)
+    for _ in range(rng.choice((1, 1, 1, 2, 3))):
+        record.add_phone(make_phone(rng))
+    record.email = f"{name.lower()}@example.com"
+    record.address = f"{rng.randrange(1, 200)} {rng.choice(STREETS)}"
+    record.birthday = make_birthday(rng)
+    return record
+
+
+def make_contacts(count, rng):
+    contacts = {}
+    for number in range(count):
+        record = make_contact(number, rng)
+        contacts[record.name.value] = record
+    return contacts
+
+
+def make_text(rng, words=60):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_note(number, rng, words=60):
+    key = f"note{number}"
+    created = datetime(2024, 1, 1) + timedelta(minutes=number)
+    note = Note(key, make_text(rng, rng.randrange(words // 2, words * 2)), created)
+    note.tags = rng.sample(TAGS, rng.randrange(0, 4))
+    return note
+
+
+def make_notes(count, rng, words=60):
+    notes = {}
+    for number in range(count):
+        note = make_note(number, rng, words)
+        notes[note.key] = note
+    return notes
@@ -0,0 +1,270 @@
+"""
+Load test of the command executor: many workers run a weighted mix of commands
+against the same books for a fixed time, and the sustained throughput, the tail
+latency of each command, the lock contention and the error rates are reported,
+with the first traceback of every command that failed.
+
+Threads share one executor and one pair of books in memory or in pickle files, the
+way a single assistant process serving several users would. Processes each run
+their own executor over `SharedSaver` files in a common directory, the way several
+assistant processes sharing the storage would. Everything runs locally.
+
+Usage:
+    python benchmarks/load_benchmark.py [--workers 8] [--mode threads|processes]
+        [--duration 10] [--mix find_contact=40,add_contact=10,...] [--json PATH]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'src')))
+
+from colorama import Fore  # noqa: E402
+import command_registry as command_service  # noqa: E402
+from constants import Messages  # noqa: E402
+from metrics import Histogram  # noqa: E402
+from repository import AddressBook, NotesBook, Saver  # noqa: E402
+from shared_storage import SharedSaver  # noqa: E402
+from command_benchmark import COMMAND_ARGS, Context, MemorySaver  # noqa: E402
+from datagen import make_contacts, make_notes  # noqa: E402
+
+DEFAULT_MIX = ("find_contact=40,add_contact=10,update_phone=5,update_email=5,"
+               "update_address=5,show_birthday=5,list_addressbook=1,add_note=8,"
+               "update_note=5,add_tag=4,find_note_by_tag=6,find_in_notes_text=5,"
+               "list_notesbook=1")
+# The answers of the commands that refuse the input
+REJECTIONS = {value for value in vars(Messages).values()
+              if isinstance(value, str) and value.startswith(Fore.RED)}
+# New names and keys of different workers never collide
+WORKER_RANGE = 10 ** 7
+
+
+class TimedLock:
+    """A lock wrapper counting how often and how long threads wait for it"""
+
+    def __init__(self, lock):
+        self.lock = lock
+        # Guards the counters, which threads waiting for the lock also update
+        self.counters_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            with self.counters_lock:
+                self.acquisitions += 1
+            return True
+        if not blocking:
+            with self.counters_lock:
+                self.acquisitions += 1
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        waited = time.perf_counter() - start
+        with self.counters_lock:
+            self.acquisitions += 1
+            self.contended += 1
+            self.wait_time += waited
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        command, _, weight = item.partition("=")
+        mix[command.strip()] = float(weight or 1)
+    unknown = set(mix) - set(command_service.get_commands())
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown commands: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def run_worker(worker, executor, args, deadline):
+    """Run the mix until the deadline and get the per-command statistics"""
+    rng = random.Random(args.seed * 1000 + worker)
+    context = Context(args.contacts, args.notes, 0, rng)
+    context.added = args.contacts + (worker + 1) * WORKER_RANGE
+    commands, weights = zip(*args.mix.items())
+    stats = {}
+    while time.perf_counter() < deadline:
+        command = rng.choices(commands, weights)[0]
+        arguments = COMMAND_ARGS.get(command, lambda c: [])(context)
+        entry = stats.setdefault(command, {"latency": Histogram(), "errors": 0,
+                                           "rejected": 0, "traceback": None})
+        start = time.perf_counter()
+        try:
+            result = executor(command, *arguments)
+        except Exception:
+            entry["errors"] += 1
+            if entry["traceback"] is None:
+                entry["traceback"] = traceback.format_exc()
+            result = None
+        entry["latency"].record(time.perf_counter() - start)
+        if isinstance(result, str) and result in REJECTIONS:
+            entry["rejected"] += 1
+    return stats
+
+
+def process_worker(worker, args, directory, deadline_in, queue):
+    savers = (SharedSaver(os.path.join(directory, "addressbook.pkl")),
+              SharedSaver(os.path.join(directory, "notesbook.pkl")))
+    command_service._addressbook = AddressBook(savers[0])
+    command_service._notesbook = NotesBook(savers[1])
+    executor = command_service.create_command_executor()
+    stats = run_worker(worker, executor, args, time.perf_counter() + deadline_in)
+    locks = {"acquisitions": sum(saver.lock.acquisitions for saver in savers),
+             "contended": sum(saver.lock.contended for saver in savers),
+             "wait_time": sum(saver.lock.wait_time for saver in savers)}
+    queue.put((stats, locks))
+
+
+def run_threads(args, directory, contacts, notes):
+    if args.storage == "memory":
+        savers = (MemorySaver(contacts), MemorySaver(notes))
+    else:
+        savers = (Saver(os.path.join(directory, "addressbook.pkl")),
+                  Saver(os.path.join(directory, "notesbook.pkl")))
+        savers[0].save(contacts)
+        savers[1].save(notes)
+    command_service._addressbook = AddressBook(savers[0])
+    command_service._notesbook = NotesBook(savers[1])
+    books = (command_service._addressbook, command_service._notesbook)
+    for book in books:
+        book._lock = TimedLock(book._lock)
+    executor = command_service.create_command_executor()
+    results = [None] * args.workers
+    deadline = time.perf_counter() + args.duration
+
+    def work(worker):
+        results[worker] = run_worker(worker, executor, args, deadline)
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    locks = {"acquisitions": sum(book._lock.acquisitions for book in books),
+             "contended": sum(book._lock.contended for book in books),
+             "wait_time": sum(book._lock.wait_time for book in books)}
+    return results, [locks]
+
+
+def run_processes(args, directory, contacts, notes):
+    SharedSaver(os.path.join(directory, "addressbook.pkl")).save(contacts)
+    SharedSaver(os.path.join(directory, "notesbook.pkl")).save(notes)
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [context.Process(target=process_worker,
+                                 args=(worker, args, directory, args.duration, queue))
+                 for worker in range(args.workers)]
+    for process in processes:
+        process.start()
+    outcomes = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return [stats for stats, _ in outcomes], [locks for _, locks in outcomes]
+
+
+def summarize(results, locks, elapsed):
+    commands = {}
+    for stats in results:
+        for command, entry in stats.items():
+            total = commands.setdefault(command, {"latency": Histogram(), "errors": 0,
+                                                  "rejected": 0, "traceback": None})
+            total["latency"].merge(entry["latency"])
+            total["errors"] += entry["errors"]
+            total["rejected"] += entry["rejected"]
+            total["traceback"] = total["traceback"] or entry["traceback"]
+    calls = sum(entry["latency"].count for entry in commands.values())
+    summary = {
+        "calls": calls,
+        "seconds": elapsed,
+        "throughput": calls / elapsed,
+        "error_rate": sum(entry["errors"] for entry in commands.values()) / max(calls, 1),
+        "rejection_rate": sum(entry["rejected"] for entry in commands.values()) / max(calls, 1),
+        "locks": {key: sum(lock[key] for lock in locks)
+                  for key in ("acquisitions", "contended", "wait_time")},
+        "commands": {},
+    }
+    overall = Histogram()
+    for command, entry in sorted(commands.items()):
+        overall.merge(entry["latency"])
+        summary["commands"][command] = dict(entry["latency"].to_dict(),
+                                            errors=entry["errors"],
+                                            rejected=entry["rejected"],
+                                            traceback=entry["traceback"])
+    summary["latency"] = overall.to_dict()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--mode", default="threads", choices=["threads", "processes"])
+    parser.add_argument("--storage", default="memory", choices=["memory", "pickle"],
+                        help="the storage of the threads; processes always share files")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="comma-separated command=weight pairs")
+    parser.add_argument("--contacts", type=int, default=10000)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=8)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    contacts = make_contacts(args.contacts, rng)
+    notes = make_notes(args.notes, rng)
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        if args.mode == "threads":
+            results, locks = run_threads(args, directory, contacts, notes)
+        else:
+            results, locks = run_processes(args, directory, contacts, notes)
+        # Processes start their clocks once they are up, after the slow spawn
+        elapsed = time.perf_counter() - start if args.mode == "threads" else args.duration
+        summary = summarize(results, locks, elapsed)
+
+    latency = summary["latency"]
+    print(f"{args.workers} {args.mode}: {summary['calls']} calls in {summary['seconds']:.1f} s, "
+          f"{summary['throughput']:.0f} calls/s")
+    print(f"latency p50 {latency['p50'] * 1000:.3f} ms, p95 {latency['p95'] * 1000:.3f} ms, "
+          f"p99 {latency['p99'] * 1000:.3f} ms, max {latency['max'] * 1000:.3f} ms")
+    locks = summary["locks"]
+    print(f"locks: {locks['acquisitions']} acquisitions, {locks['contended']} contended, "
+          f"{locks['wait_time'] * 1000:.1f} ms waiting")
+    print(f"errors {summary['error_rate']:.2%}, rejected input {summary['rejection_rate']:.2%}")
+    for command, stats in summary["commands"].items():
+        print(f"  {command:24} {stats['count']:>7} calls p50 {stats['p50'] * 1000:8.3f} ms "
+              f"p99 {stats['p99'] * 1000:8.3f} ms errors {stats['errors']} "
+              f"rejected {stats['rejected']}")
+    for command, stats in summary["commands"].items():
+        if stats["traceback"]:
+            print(f"\nFirst error of {command}:\n{stats['traceback']}", end="")
+    if args.json:
+        summary["meta"] = {"workers": args.workers, "mode": args.mode, "storage": args.storage,
+                           "mix": args.mix, "seed": args.seed}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of validating and normalizing the fields of many contacts one value per
+call against doing it column by column with `Validation.validate_batch`. The
+baseline matches the pattern strings with `re.match` on every call, as the
+validation did before its patterns were compiled once.
+
+Usage:
+    python benchmarks/validation_benchmark.py [--contacts N] [--json PATH]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'src')))
+
+from validation import Validation, normalize_phone  # noqa: E402
+from datagen import make_contacts  # noqa: E402
+
+# How a value is normalized one at a time, after it was validated
+NORMALIZE = {
+    "name": lambda value: value,
+    "phone": normalize_phone,
+    "email": str.lower,
+    "address": lambda value: value,
+    "birthday": lambda value: datetime.strptime(value, "%d.%m.%Y").date(),
+}
+
+
+def columns_of(contacts):
+    records = list(contacts.values())
+    return {
+        "name": [record.name.value for record in records],
+        "phone": [phone.value for record in records for phone in record.phones],
+        "email": [record.email.value for record in records if record.email],
+        "address": [record.address.value for record in records if record.address],
+        "birthday": [record.birthday.value for record in records if record.birthday],
+    }
+
+
+def best(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=8)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    validator = Validation()
+    columns = columns_of(make_contacts(args.contacts, random.Random(args.seed)))
+    results = []
+    for kind, values in columns.items():
+        pattern = getattr(Validation, f"{kind.capitalize()}Pattern")
+        validate = getattr(validator, f"validate_{kind}")
+        normalize = NORMALIZE[kind]
+        baseline = best(lambda: [normalize(value) if re.match(pattern, value) else None
+                                 for value in values], args.repeat)
+        single = best(lambda: [normalize(value) if validate(value) else None
+                               for value in values], args.repeat)
+        batch = best(lambda: validator.validate_batch(kind, values), args.repeat)
+        results.append({"kind": kind, "values": len(values),
+                        "baseline_seconds": baseline, "single_seconds": single,
+                        "batch_seconds": batch})
+        print(f"{kind:8} {len(values):>9,} values  re.match {baseline * 1000:8.1f} ms  "
+              f"compiled {single * 1000:8.1f} ms  batch {batch * 1000:8.1f} ms  "
+              f"({baseline / batch:.1f}x baseline, {single / batch:.1f}x compiled)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+This module provides counters over the values of a book that are kept up to date
+on every change, so that questions like "how many contacts per email domain" are
+answered without reading the book.
+"""
+
+from collections import Counter
+from indexes import FIELDS, MONTHS
+
+# The values each contact record is counted by
+CONTACT_AGGREGATES = {
+    "domain": FIELDS["domain"],
+    "month": FIELDS["month"],
+    "phones": lambda record: [len(record.phones)],
+}
+
+# The values each note is counted by
+NOTE_AGGREGATES = {
+    "tag": lambda note: list(dict.fromkeys(note.tags)),
+}
+
+
+class Aggregates:
+    """
+    One Counter per aggregate of a book.
+
+    Like the indexes of the books, the counters are built from the data on first
+    use and then maintained on every change. The values counted for each key are
+    kept, so that a value changed in place can still be uncounted.
+    """
+
+    def __init__(self, aggregates):
+        """
+        Initialize the Aggregates without building them.
+
+        :param aggregates: A mapping of aggregate names to functions giving the
+            list of values a value of the book is counted under.
+        """
+        self.__aggregates = aggregates
+        self.__counters = None
+        self.__values = {}
+
+    def build(self, data):
+        """
+        Build the counters if they were not built yet.
+
+        :param data: The mapping of keys to values to count.
+        """
+        if self.__counters is not None:
+            return
+        self.__counters = {name: Counter() for name in self.__aggregates}
+        for key, value in data.items():
+            self.__add(key, value)
+
+    def update(self, key, value):
+        """
+        Recount a key after its value was set or deleted.
+
+        :param key: The key of the value.
+        :param value: The new value, or None if it was deleted.
+        """
+        if self.__counters is None:
+            return
+        for name, counted in self.__values.pop(key, {}).items():
+            counter = self.__counters[name]
+            counter.subtract(counted)
+            for item in counted:
+                if counter[item] <= 0:
+                    del counter[item]
+        if value is not None:
+            self.__add(key, value)
+
+    def clear(self):
+        """
+        Drop the counters, e.g. after the whole data was replaced.
+        """
+        self.__counters = None
+        self.__values = {}
+
+    def counters(self):
+        """
+        Get the counts of all aggregates.
+
+        :return: A dict of aggregate names to copies of their Counters.
+        """
+        return {name: Counter(counter) for name, counter in self.__counters.items()}
+
+    def __add(self, key, value):
+        values = {}
+        for name, values_of in self.__aggregates.items():
+            counted = values_of(value)
+            if counted:
+                self.__counters[name].update(counted)
+                values[name] = counted
+        self.__values[key] = values
+
+
+def summary_report(contacts, notes, top=5):
+    """
+    Get a human readable summary of the counts of both books.
+
+    :param contacts: The summary of the address book.
+    :param notes: The summary of the notes book.
+    :param top: The number of most common email domains and tags to list.
+    :return: A string with the counts.
+    """
+    def counts(counter, label=str):
+        return ", ".join(f"{label(value)}: {count}" for value, count in counter) or "none"
+
+    months = sorted(contacts["month"].items())
+    phones = sorted(contacts["phones"].items())
+    return "\n".join([
+        f"contacts: {contacts['total']}",
+        f"  email domains: {counts(contacts['domain'].most_common(top))}",
+        f"  birthdays per month: {counts(months, lambda month: MONTHS[month - 1].capitalize())}",
+        f"  phones per contact: {counts(phones)}",
+        f"notes: {notes['total']}",
+        f"  tags: {counts(notes['tag'].most_common(top))}",
+    ])
@@ -0,0 +1,434 @@
+"""
+This module provides a binary snapshot format for address books that is used
+through a memory map instead of being unpickled.
+
+A snapshot file consists of:
+- a fixed header with the number of records and the offsets of the sections,
+- a key table sorted by key, with the place of each key and of its record,
+- the records, each a list of (field kind, string) references,
+- a string heap holding every distinct string once,
+- sorted phone, email and birthday indexes of (string, record number) entries.
+
+`MappedRecords` opens a snapshot in O(1) and decodes records only on access,
+`OverlayData` keeps the changes made on top of it, and `BinarySaver` persists a
+book as a snapshot plus a journal of the changes made since the snapshot.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+from collections.abc import Mapping, MutableMapping
+from compression import detect, reader, writer
+from indexes import record_matches
+from models import Record
+from repository import Saver, Snapshot
+
+MAGIC = b"ABSNAP\x00\x01"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQQQQQQQQQQ")
+KEY_ENTRY = struct.Struct("<QIQ")
+FIELD_COUNT = struct.Struct("<H")
+FIELD_ENTRY = struct.Struct("<BQI")
+INDEX_ENTRY = struct.Struct("<QII")
+
+NAME, PHONE, EMAIL, ADDRESS, BIRTHDAY = range(5)
+INDEXED_FIELDS = ("phone", "email", "birthday")
+
+
+def write_snapshot(path, data):
+    """
+    Write the records of a book to a binary snapshot file.
+
+    :param path: The path to the snapshot file.
+    :param data: A mapping of keys to contact records.
+    :return: The size of the snapshot file in bytes.
+    """
+    heap = bytearray()
+    strings = {}
+
+    def intern(text):
+        if text not in strings:
+            encoded = text.encode("utf-8")
+            strings[text] = (len(heap), len(encoded))
+            heap.extend(encoded)
+        return strings[text]
+
+    keys = sorted(data, key=lambda key: key.encode("utf-8"))
+    key_table = bytearray()
+    records = bytearray()
+    indexes = {field: [] for field in INDEXED_FIELDS}
+    for number, key in enumerate(keys):
+        record = data[key]
+        fields = [(NAME, record.name.value)]
+        fields += [(PHONE, phone.value) for phone in record.phones]
+        for kind, field in ((EMAIL, record.email), (ADDRESS, record.address),
+                            (BIRTHDAY, record.birthday)):
+            if field:
+                fields.append((kind, field.value))
+        key_offset, key_length = intern(key)
+        key_table += KEY_ENTRY.pack(key_offset, key_length, len(records))
+        records += FIELD_COUNT.pack(len(fields))
+        for kind, value in fields:
+            records += FIELD_ENTRY.pack(kind, *intern(value))
+        for field in INDEXED_FIELDS:
+            if field == "phone":
+                indexes[field] += [(phone.value, number) for phone in record.phones]
+            elif getattr(record, field):
+                indexes[field].append((getattr(record, field).value, number))
+
+    sections = []
+    offset = HEADER.size
+    for section in (key_table, records, heap):
+        sections.append(offset)
+        offset += len(section)
+    index_sections = []
+    for field in INDEXED_FIELDS:
+        entries = sorted(indexes[field], key=lambda entry: entry[0].encode("utf-8"))
+        encoded = b"".join(INDEX_ENTRY.pack(*intern(value), number)
+                           for value, number in entries)
+        index_sections.append((offset, len(entries), encoded))
+        offset += len(encoded)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(keys), *sections,
+                            *[value for section in index_sections
+                              for value in section[:2]]))
+        f.write(key_table)
+        f.write(records)
+        f.write(heap)
+        for _, _, encoded in index_sections:
+            f.write(encoded)
+    os.replace(temp_path, path)
+    return offset
+
+
+class MappedRecords(Mapping):
+    """
+    A read-only mapping of keys to contact records over a memory-mapped snapshot.
+
+    Opening reads only the header. Lookups by key and by indexed field values are
+    binary searches over the mapped sections, and records are decoded on access.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the MappedRecords over a snapshot file.
+
+        :param path: The path to the snapshot file.
+        """
+        with open(path, "rb") as f:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.__count, self.__keys, self.__records, self.__heap,
+         *indexes) = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not an address book snapshot")
+        self.__indexes = dict(zip(INDEXED_FIELDS, zip(indexes[::2], indexes[1::2])))
+
+    def __len__(self):
+        return self.__count
+
+    def __iter__(self):
+        for number in range(self.__count):
+            yield self.__key(number)
+
+    def __contains__(self, key):
+        return self.__find(key) is not None
+
+    def __getitem__(self, key):
+        number = self.__find(key)
+        if number is None:
+            raise KeyError(key)
+        return self.__decode(number)
+
+    def find_keys(self, field_name, value):
+        """
+        Find the keys of the records that have the value in an indexed field.
+
+        :param field_name: The field to search by ('phone', 'email' or 'birthday').
+        :param value: The value to search for.
+        :return: A list of keys, or None if the field is not indexed.
+        """
+        if field_name not in self.__indexes:
+            return None
+        offset, count = self.__indexes[field_name]
+        target = value.encode("utf-8")
+
+        def entry(position):
+            return INDEX_ENTRY.unpack_from(self.__map, offset + position * INDEX_ENTRY.size)
+
+        position = self.__bisect(count, target,
+                                 lambda position: self.__string(*entry(position)[:2]))
+        keys = []
+        while position < count:
+            value_offset, value_length, number = entry(position)
+            if self.__string(value_offset, value_length) != target:
+                break
+            keys.append(self.__key(number))
+            position += 1
+        return keys
+
+    def __string(self, offset, length):
+        start = self.__heap + offset
+        return self.__map[start:start + length]
+
+    def __key(self, number):
+        key_offset, key_length, _ = KEY_ENTRY.unpack_from(
+            self.__map, self.__keys + number * KEY_ENTRY.size)
+        return self.__string(key_offset, key_length).decode("utf-8")
+
+    def __bisect(self, count, target, value_at):
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if value_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __find(self, key):
+        target = key.encode("utf-8")
+
+        def key_at(number):
+            key_offset, key_length, _ = KEY_ENTRY.unpack_from(
+                self.__map, self.__keys + number * KEY_ENTRY.size)
+            return self.__string(key_offset, key_length)
+
+        number = self.__bisect(self.__count, target, key_at)
+        if number < self.__count and key_at(number) == target:
+            return number
+        return None
+
+    def __decode(self, number):
+        _, _, offset = KEY_ENTRY.unpack_from(
+            self.__map, self.__keys + number * KEY_ENTRY.size)
+        offset += self.__records
+        count, = FIELD_COUNT.unpack_from(self.__map, offset)
+        offset += FIELD_COUNT.size
+        record = None
+        for _ in range(count):
+            kind, value_offset, value_length = FIELD_ENTRY.unpack_from(self.__map, offset)
+            offset += FIELD_ENTRY.size
+            value = self.__string(value_offset, value_length).decode("utf-8")
+            if kind == NAME:
+                record = Record(value)
+            elif kind == PHONE:
+                record.add_phone(value)
+            elif kind == EMAIL:
+                record.email = value
+            elif kind == ADDRESS:
+                record.address = value
+            elif kind == BIRTHDAY:
+                record.birthday = value
+        return record
+
+
+class OverlayData(MutableMapping):
+    """
+    A mutable mapping that keeps the changes made on top of a read-only base
+    mapping, such as MappedRecords, without touching or copying the base.
+    """
+
+    def __init__(self, base, changes=None, deleted=None):
+        """
+        Initialize the OverlayData over a base mapping.
+
+        :param base: The read-only mapping with the original data.
+        :param changes: The values set on top of the base.
+        :param deleted: The keys of the base that are deleted.
+        """
+        self.__base = base
+        self.__changes = changes if changes is not None else {}
+        self.__deleted = deleted if deleted is not None else set()
+
+    def __getitem__(self, key):
+        if key in self.__changes:
+            return self.__changes[key]
+        if key in self.__deleted:
+            raise KeyError(key)
+        return self.__base[key]
+
+    def __setitem__(self, key, value):
+        self.__changes[key] = value
+        self.__deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.__changes.pop(key, None)
+        if key in self.__base:
+            self.__deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self.__changes:
+            return True
+        return key not in self.__deleted and key in self.__base
+
+    def __iter__(self):
+        # Bound once, so that a rebase does not change the data under the iteration
+        base, changes, deleted = self.__base, self.__changes, self.__deleted
+        for key in base:
+            if key not in deleted and key not in changes:
+                yield key
+        yield from changes
+
+    def __len__(self):
+        base, changes, deleted = self.__base, self.__changes, self.__deleted
+        added = sum(1 for key in changes if key not in base)
+        return len(base) - len(deleted) + added
+
+    def rebase(self, base):
+        """
+        Replace the base with a mapping that holds the same data, e.g. a new
+        snapshot of it, and drop the changes kept on top of the old base.
+
+        :param base: The read-only mapping with the current data.
+        """
+        # The base goes first, so that readers never see the changes missing
+        self.__base = base
+        self.__changes = {}
+        self.__deleted = set()
+
+    def resident(self):
+        """
+        Get the values held in memory, i.e. set on top of the base.
+
+        :return: A dict of keys to values.
+        """
+        return self.__changes
+
+    def copy(self):
+        """
+        Return a copy sharing the base. Only the changes are copied.
+
+        :return: A new OverlayData.
+        """
+        return OverlayData(self.__base, dict(self.__changes), set(self.__deleted))
+
+    def find_keys(self, field_name, value):
+        """
+        Find the keys of the records that have the value in an indexed field.
+
+        :param field_name: The field to search by.
+        :param value: The value to search for.
+        :return: A list of keys, or None if the base has no index for the field.
+        """
+        find_keys = getattr(self.__base, "find_keys", None)
+        keys = find_keys(field_name, value) if find_keys else None
+        if keys is None:
+            return None
+        keys = [key for key in keys
+                if key not in self.__deleted and key not in self.__changes]
+        keys += [key for key, record in self.__changes.items()
+                 if record_matches(record, field_name, value)]
+        return keys
+
+
+class BinarySaver(Saver):
+    """
+    A Saver that keeps an address book as a binary snapshot and a journal.
+
+    Loading maps the snapshot and replays the journal on top of it, so opening a
+    book costs as much as the journal, not the book. Every change is appended to
+    the journal; once the journal grows long, a new snapshot is written. Data
+    saved by a plain Saver to `legacy_path` is picked up on the first load and
+    written as a snapshot on the first save.
+    """
+
+    def __init__(self, path, legacy_path=None, compact_every=1000, compression=None):
+        """
+        Initialize the BinarySaver with a file path.
+
+        :param path: The path to the snapshot file.
+        :param legacy_path: The path to a single-file pickle to migrate from.
+        :param compact_every: The number of journal entries that triggers a new snapshot.
+        :param compression: None, 'gzip' or 'lzma' to compress the journal. The
+            snapshot itself is never compressed, so that it can be mapped.
+        """
+        super().__init__(legacy_path, compression)
+        self.__path = path
+        self.__legacy_path = legacy_path
+        self.__journal_path = path + ".journal"
+        self.__compact_every = compact_every
+        self.__entries = 0
+        self.__migrate = False
+
+    def load(self):
+        """
+        Map the snapshot and apply the journal on top of it.
+
+        :return: An OverlayData over the snapshot.
+        """
+        if os.path.exists(self.__path):
+            base = MappedRecords(self.__path)
+        else:
+            base = super().load() if self.__legacy_path else {}
+            self.__migrate = bool(base)
+        data = OverlayData(base)
+        self.__entries = 0
+        try:
+            f = open(self.__journal_path, "rb")
+        except OSError:
+            return data
+        with f, reader(f) as stream:
+            while True:
+                try:
+                    key, value = pickle.load(stream)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                self.__entries += 1
+                if value is None:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+        return data
+
+    def save(self, data):
+        """
+        Write the whole data as a new snapshot and clear the journal. The book
+        data is rebased on the new snapshot, so the changes no longer stay in memory.
+
+        :param data: The data to be saved.
+        """
+        self._count_written(write_snapshot(self.__path, data))
+        with open(self.__journal_path, "wb"):
+            pass
+        self.__entries = 0
+        self.__migrate = False
+        storage = data._data if isinstance(data, Snapshot) else data
+        if isinstance(storage, OverlayData):
+            storage.rebase(MappedRecords(self.__path))
+
+    def save_change(self, data, key):
+        """
+        Append the change of the value under the key to the journal.
+
+        :param data: The data after the change.
+        :param key: The key of the changed value.
+        """
+        self.save_changes(data, [key])
+
+    def save_changes(self, data, keys):
+        """
+        Append the changes of the values under several keys to the journal.
+
+        :param data: The data after the changes.
+        :param keys: The keys of the changed values.
+        """
+        if self.__migrate or self.__entries + len(keys) >= self.__compact_every:
+            try:
+                self.save(data)
+                return
+            except PermissionError:
+                # Platforms that lock mapped files keep the journal growing instead
+                pass
+        compression = detect(self.__journal_path, self.compression)
+        with open(self.__journal_path, "ab") as f:
+            start = f.tell()
+            with writer(f, compression) as stream:
+                for key in keys:
+                    pickle.dump((key, data.get(key)), stream)
+            self._count_written(f.tell() - start)
+        self.__entries += len(keys)
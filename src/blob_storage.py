@@ -0,0 +1,148 @@
+"""
+This module provides out-of-line storage for large texts. `BlobStore` appends texts
+to a blob file and reads them back through a memory map, and `BlobText` is a lazy
+reference to a text in a store that objects can hold instead of the text itself.
+"""
+
+import mmap
+import os
+import threading
+
+
+class BlobText:
+    """
+    A lazy reference to a text kept in a BlobStore.
+
+    Only the offset and the length of the text are held in memory; the text is
+    decoded from the mapped blob file on every `read`. Pickled without a store-aware
+    pickler, the reference turns into the plain text.
+    """
+
+    __slots__ = ("store", "offset", "length")
+
+    def __init__(self, store, offset, length):
+        """
+        Initialize the BlobText with its place in a store.
+
+        :param store: The BlobStore holding the text.
+        :param offset: The offset of the encoded text in the blob file.
+        :param length: The length of the encoded text in bytes.
+        """
+        self.store = store
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+        """
+        Read the text from the store.
+
+        :return: The text.
+        """
+        return self.store.read(self.offset, self.length)
+
+    def __str__(self):
+        return self.read()
+
+    def __reduce__(self):
+        return str, (self.read(),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class BlobStore:
+    """
+    An append-only file of UTF-8 encoded texts read through a memory map.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the BlobStore with a file path.
+
+        :param path: The path to the blob file. It is created on the first write.
+        """
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__map = None
+        self.__size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    @property
+    def path(self):
+        """
+        Get the path to the blob file.
+
+        :return: The path.
+        """
+        return self.__path
+
+    @property
+    def size(self):
+        """
+        Get the size of the blob file.
+
+        :return: The size in bytes.
+        """
+        return self.__size
+
+    def put(self, text):
+        """
+        Append a text to the blob file.
+
+        :param text: The text to be stored.
+        :return: A BlobText referencing the stored text.
+        """
+        encoded = text.encode("utf-8")
+        with self.__lock:
+            if self.__file is None:
+                self.__file = open(self.__path, "ab")
+            offset = self.__size
+            self.__file.write(encoded)
+            self.__size += len(encoded)
+        return BlobText(self, offset, len(encoded))
+
+    def flush(self):
+        """
+        Flush the appended texts to the blob file.
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.flush()
+
+    def read(self, offset, length):
+        """
+        Read a text from the blob file.
+
+        :param offset: The offset of the encoded text.
+        :param length: The length of the encoded text in bytes.
+        :return: The text.
+        """
+        if length == 0:
+            return ""
+        with self.__lock:
+            if self.__map is None or offset + length > len(self.__map):
+                self.__remap()
+            return self.__map[offset:offset + length].decode("utf-8")
+
+    def close(self):
+        """
+        Close the blob file and its memory map.
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+            if self.__map is not None:
+                self.__map.close()
+                self.__map = None
+
+    def __remap(self):
+        if self.__file is not None:
+            self.__file.flush()
+        if self.__map is not None:
+            self.__map.close()
+        with open(self.__path, "rb") as f:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,133 @@
+"""
+This module provides a bounded LRU cache for the results of read-only commands.
+Every entry remembers the generations of the books its result was computed from,
+so a change to a book invalidates its entries without touching the cache: a
+lookup with newer generations is simply a miss.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from memory import MemoryWalker
+
+MISS = object()
+
+
+def result_size(result):
+    """
+    Estimate the memory held by a cached result.
+
+    :param result: The result of a command.
+    :return: The size in bytes.
+    """
+    if isinstance(result, str):
+        return sys.getsizeof(result)
+    return MemoryWalker().size(result)
+
+
+class ResultCache:
+    """
+    An LRU cache limited both in entries and in bytes.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=16 << 20):
+        """
+        Initialize the ResultCache.
+
+        :param max_entries: The maximum number of entries.
+        :param max_bytes: The maximum estimated size of all results in bytes.
+        """
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def size(self):
+        """
+        Get the estimated size of the cached results.
+
+        :return: The size in bytes.
+        """
+        return self.__bytes
+
+    def get(self, key, generation):
+        """
+        Get a cached result.
+
+        :param key: The key of the result, e.g. the command and its arguments.
+        :param generation: The current generations of the books the result depends on.
+        :return: The result, or MISS if it is not cached or is out of date.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            if entry[0] != generation:
+                self.__remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return MISS
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, generation, result):
+        """
+        Cache a result, evicting the least recently used ones over the limits.
+
+        :param key: The key of the result.
+        :param generation: The generations of the books the result was computed from.
+        :param result: The result.
+        """
+        size = result_size(result)
+        if size > self.__max_bytes or not self.__max_entries:
+            return
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            self.__entries[key] = (generation, result, size)
+            self.__bytes += size
+            while len(self.__entries) > self.__max_entries or self.__bytes > self.__max_bytes:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop all cached results.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def stats(self):
+        """
+        Get the statistics of the cache.
+
+        :return: A dict with the hits, misses, hit ratio, invalidations, evictions,
+            the number of entries and their size.
+        """
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+            }
+
+    def __remove(self, key):
+        _, _, size = self.__entries.pop(key)
+        self.__bytes -= size
@@ -0,0 +1,262 @@
+"""
+This module provides the change feed of the books: an ordered stream of events,
+one per added, updated or deleted value, with the changed fields and a sequence
+number. `ChangeFeed` delivers the events to in-process subscribers, and
+`EventLog` persists them as JSON lines that other processes can read from any
+sequence number on.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+def record_fields(record):
+    """
+    Get the fields of a contact record the change feed reports.
+
+    :param record: The contact record.
+    :return: A dict of field names to JSON-friendly values.
+    """
+    return {
+        "name": record.name.value,
+        "phones": tuple(phone.value for phone in record.phones),
+        "email": record.email.value if record.email else None,
+        "address": record.address.value if record.address else None,
+        "birthday": record.birthday.value if record.birthday else None,
+    }
+
+
+def note_fields(note):
+    """
+    Get the fields of a note the change feed reports.
+
+    :param note: The note.
+    :return: A dict of field names to JSON-friendly values.
+    """
+    def iso(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    return {
+        "key": note.key,
+        "text": note.text,
+        "tags": tuple(note.tags),
+        "created": iso(note.create_date),
+        "modified": iso(note.modify_date),
+    }
+
+
+class ChangeEvent:
+    """
+    A change of a value of a book.
+    """
+
+    def __init__(self, seq, book, op, key, fields, timestamp):
+        """
+        Initialize the ChangeEvent.
+
+        :param seq: The sequence number of the event in the feed.
+        :param book: The name of the changed book.
+        :param op: 'add', 'update' or 'delete'.
+        :param key: The key of the changed value.
+        :param fields: A dict of the changed fields to their new values, all the
+            fields for an added value and none for a deleted one.
+        :param timestamp: The time of the change in seconds since the epoch.
+        """
+        self.seq = seq
+        self.book = book
+        self.op = op
+        self.key = key
+        self.fields = fields
+        self.timestamp = timestamp
+
+    def to_dict(self):
+        """
+        Get the event as a JSON-friendly dict.
+
+        :return: A dict with the attributes of the event.
+        """
+        return {"seq": self.seq, "book": self.book, "op": self.op, "key": self.key,
+                "fields": self.fields, "timestamp": self.timestamp}
+
+    def __repr__(self):
+        return f"ChangeEvent({self.seq}, {self.book!r}, {self.op!r}, {self.key!r})"
+
+
+class ChangeFeed:
+    """
+    An ordered stream of the changes of one or more books.
+
+    Books publish their changes while holding their lock, and the feed numbers
+    and delivers them under its own lock, so subscribers see the events of every
+    book in sequence order. Subscribers are called synchronously and should be
+    quick.
+    """
+
+    def __init__(self, seq=0):
+        """
+        Initialize the ChangeFeed.
+
+        :param seq: The sequence number of the last event already published, e.g.
+            the last one of a persisted log.
+        """
+        self.__seq = seq
+        self.__subscribers = []
+        self.__lock = threading.Lock()
+
+    @property
+    def seq(self):
+        """
+        Get the sequence number of the last published event.
+
+        :return: The sequence number.
+        """
+        return self.__seq
+
+    def subscribe(self, callback):
+        """
+        Call a function with every event published from now on.
+
+        :param callback: A function taking a ChangeEvent.
+        """
+        with self.__lock:
+            self.__subscribers = self.__subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling a subscribed function.
+
+        :param callback: The subscribed function.
+        """
+        with self.__lock:
+            self.__subscribers = [subscriber for subscriber in self.__subscribers
+                                  if subscriber != callback]
+
+    def publish(self, book, op, key, fields):
+        """
+        Number an event and deliver it to the subscribers.
+
+        :param book: The name of the changed book.
+        :param op: 'add', 'update' or 'delete'.
+        :param key: The key of the changed value.
+        :param fields: A dict of the changed fields to their new values.
+        :return: The ChangeEvent.
+        """
+        with self.__lock:
+            self.__seq += 1
+            event = ChangeEvent(self.__seq, book, op, key, fields, time.time())
+            for subscriber in self.__subscribers:
+                subscriber(event)
+        return event
+
+
+class EventLog:
+    """
+    A persisted change log: one JSON object per line, in sequence order.
+
+    Readers find the first event after a sequence number with a binary search
+    over the file, so catching up costs the number of new events rather than the
+    length of the log. The log is meant to be written by a single process.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the EventLog.
+
+        :param path: The path to the log file. It is created on the first event.
+        """
+        self.__path = path
+        self.__lock = threading.Lock()
+
+    @property
+    def path(self):
+        """
+        Get the path to the log file.
+
+        :return: The path.
+        """
+        return self.__path
+
+    def last_seq(self):
+        """
+        Get the sequence number of the last event in the log.
+
+        :return: The sequence number, or 0 if the log is empty.
+        """
+        try:
+            f = open(self.__path, "rb")
+        except OSError:
+            return 0
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            block = 4096
+            while True:
+                start = max(0, size - block)
+                f.seek(start)
+                lines = f.read(size - start).splitlines()
+                # The first line may be cut, unless the block starts the file
+                for line in reversed(lines if start == 0 else lines[1:]):
+                    seq = _seq(line)
+                    if seq is not None:
+                        return seq
+                if start == 0:
+                    return 0
+                block *= 2
+
+    def append(self, event):
+        """
+        Write an event at the end of the log. It can be subscribed to a ChangeFeed.
+
+        :param event: The ChangeEvent.
+        """
+        line = json.dumps(event.to_dict(), ensure_ascii=False) + "\n"
+        with self.__lock, open(self.__path, "ab") as f:
+            f.write(line.encode("utf-8"))
+
+    def read(self, since=0):
+        """
+        Read the events after a sequence number.
+
+        :param since: The sequence number of the last event already seen.
+        :return: An iterator of event dicts, see ChangeEvent.to_dict.
+        """
+        try:
+            f = open(self.__path, "rb")
+        except OSError:
+            return
+        with f:
+            f.seek(self.__find(f, since))
+            for line in f:
+                if _seq(line) is None:
+                    # A line still being written
+                    return
+                event = json.loads(line)
+                if event["seq"] > since:
+                    yield event
+
+    @staticmethod
+    def __find(f, since):
+        """
+        Find the offset of the first line with a sequence number after `since`.
+        """
+        low, high = 0, f.seek(0, os.SEEK_END)
+        while low < high:
+            middle = (low + high) // 2
+            f.seek(middle)
+            if middle:
+                f.readline()
+            seq = _seq(f.readline())
+            if seq is not None and seq <= since:
+                low = f.tell()
+            else:
+                high = middle
+        return low
+
+
+def _seq(line):
+    try:
+        return json.loads(line)["seq"]
+    except (ValueError, KeyError, TypeError):
+        return None
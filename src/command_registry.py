@@ -22,16 +22,49 @@ Example:
     command_executor("add", "John", "+38098442123")
     command_executor("list")
 """
-from datetime import datetime
+from datetime import datetime, time
 from models import Note, Record
-from constants import Messages, Paths
-from repository import AddressBook, NotesBook, Saver
+from aggregates import summary_report
+from cache import MISS, ResultCache
+from change_feed import ChangeFeed, EventLog
+from constants import Caching, Completions, Messages, Paths, Reminders, Search
+from memory import memory_report
+from metrics import Metrics, TimedProxy, TimedSaver
+from profiling import Profiler
+from query import QuerySyntaxError
+from repository import AddressBook, NotesBook, create_saver
+from sync import open_books, sync
 from validation import Validation
 
 _command_registry = {}
-_addressbook = AddressBook(Saver(Paths.addressbook_file))
-_notesbook = NotesBook(Saver(Paths.notesbook_file))
+_command_arguments = {}
+_addressbook = AddressBook(create_saver(
+    Paths.addressbook_file, snapshot_path=Paths.addressbook_snapshot))
+_notesbook = NotesBook(create_saver(
+    Paths.notesbook_file, shard_directory=Paths.notesbook_dir))
 _validator = Validation()
+_metrics = None
+_profiler = None
+_cache = ResultCache(Caching.result_cache_entries, Caching.result_cache_bytes)
+_change_log = None
+_change_feed = None
+
+
+def birthday_reminders():
+    """
+    Get the reminders of the birthdays that became due since the last call, for
+    the command loop to announce between commands.
+
+    :return: The reminders, or None if no birthday is due.
+    """
+    if not Reminders.enabled:
+        return None
+    due = _addressbook.due_birthdays(Reminders.days)
+    if not due:
+        return None
+    return '\n'.join(f"{Messages.BirthdayReminder} {record.name.value} "
+                     f"{Messages.UpcomingBirthdayMiddlePart} {occurrence.strftime('%d.%m.%Y')}."
+                     for record, occurrence in due)
 
 
 def create_command_executor():
@@ -40,30 +73,159 @@ def create_command_executor():
     """
     def run_command(command_str: str, *args):
         """Executes a command based on the command string."""
-        command_func = _command_registry.get(command_str.lower())
+        name = command_str.lower()
+        command_func = _command_registry.get(name)
         if command_func:
-            return command_func(args)
+            if _profiler is not None and _profiler.selects(name):
+                with _profiler.profile(name):
+                    return measure(name, command_func, args)
+            return measure(name, command_func, args)
         else:
             return Messages.InvalidCommand
+
+    def measure(name, command_func, args):
+        if _metrics is None:
+            return run(command_func, args)
+        with _metrics.command(name):
+            return run(command_func, args)
+
+    def run(command_func, args):
+        # Pick up the changes other processes made to the shared storage
+        _addressbook.refresh()
+        _notesbook.refresh()
+        return command_func(args)
     return run_command
 
 
+def enable_metrics(dump_file=None, dump_interval=60.0):
+    """
+    Starts collecting per-command statistics: the validator, the books and their
+    savers are wrapped so that the time spent in each is recorded.
+    """
+    global _metrics, _validator, _addressbook, _notesbook
+    if _metrics is not None:
+        return _metrics
+    _metrics = Metrics()
+    _validator = TimedProxy(_validator, _metrics, "validation")
+    _addressbook.saver = TimedSaver(_addressbook.saver, _metrics)
+    _notesbook.saver = TimedSaver(_notesbook.saver, _metrics)
+    _addressbook = TimedProxy(_addressbook, _metrics, "repository")
+    _notesbook = TimedProxy(_notesbook, _metrics, "repository")
+    if dump_file:
+        _metrics.start_dumping(dump_file, dump_interval)
+    return _metrics
+
+
+def enable_profiling(directory, commands=(), every=1, cpu=True, memory=False):
+    """
+    Starts profiling the selected commands, or every Nth call of them, with cProfile
+    and/or tracemalloc. A report is written to the directory for each profiled call.
+    """
+    global _profiler
+    _profiler = Profiler(directory, commands, every, cpu, memory)
+    return _profiler
+
+
+def disable_profiling():
+    """stops profiling the commands"""
+    global _profiler
+    _profiler = None
+
+
+def disable_metrics():
+    """stops collecting statistics and unwraps the validator and the books"""
+    global _metrics, _validator, _addressbook, _notesbook
+    if _metrics is None:
+        return
+    _metrics.stop_dumping()
+    _metrics = None
+    _validator = _validator.target
+    _addressbook = _addressbook.target
+    _notesbook = _notesbook.target
+    _addressbook.saver = _addressbook.saver.target
+    _notesbook.saver = _notesbook.saver.target
+
+
 def get_commands():
     """returns the list of the existing commands"""
     return list(_command_registry.keys())
 
 
-def register_command(name):
+def enable_change_log(path):
+    """
+    Starts publishing the changes of both books to a change feed persisted in a
+    log file, which other processes can read from any sequence number on.
+    """
+    global _change_log, _change_feed
+    if _change_log is not None:
+        return _change_log
+    _change_log = EventLog(path)
+    _change_feed = ChangeFeed(_change_log.last_seq())
+    _change_feed.subscribe(_change_log.append)
+    _addressbook.attach_feed(_change_feed, "addressbook")
+    _notesbook.attach_feed(_change_feed, "notesbook")
+    return _change_log
+
+
+def disable_change_log():
+    """
+    Stops writing the changes of the books to the change log.
+    """
+    global _change_log, _change_feed
+    if _change_log is None:
+        return
+    _change_feed.unsubscribe(_change_log.append)
+    _change_log = None
+    _change_feed = None
+
+
+def close():
+    """persists all pending changes of the books and releases their savers"""
+    disable_metrics()
+    _addressbook.close()
+    _notesbook.close()
+
+
+def register_command(name, arguments=()):
     """
-    Decorator to register a command function.
+    Decorator to register a command function. The kinds of its arguments, by
+    position, tell how they are completed: 'name', 'phone', 'note', 'tag', a
+    tuple of fixed choices, or None for no completion.
     """
     def decorator(func):
         # Register the function in the command_registry dictionary
         _command_registry[name.lower()] = func
+        _command_arguments[name.lower()] = arguments
         return func
     return decorator
 
 
+def complete_argument(command, args, prefix):
+    """returns the completions of the argument typed after the given ones"""
+    kinds = _command_arguments.get(command.lower(), ())
+    kind = kinds[len(args)] if len(args) < len(kinds) else None
+    limit = Completions.limit
+    if isinstance(kind, tuple):
+        return [choice for choice in kind if choice.startswith(prefix.lower())][:limit]
+    if kind == "name":
+        return _addressbook.complete("name", prefix, limit)
+    if kind == "note":
+        return _notesbook.complete("key", prefix, limit)
+    if kind == "phone":
+        # The phones of the contact named before, if any
+        record = _addressbook.snapshot().get(args[0]) if args else None
+        if record is None:
+            return _addressbook.complete("phone", prefix, limit)
+        return sorted(phone.value for phone in record.phones
+                      if phone.value.startswith(prefix))[:limit]
+    if kind == "tag":
+        note = _notesbook.snapshot().get(args[0]) if args else None
+        if note is None:
+            return _notesbook.complete("tag", prefix, limit)
+        return sorted({tag for tag in note.tags if tag.startswith(prefix)})[:limit]
+    return []
+
+
 def usage(usage):
     def input_error(func):
         """
@@ -77,6 +239,27 @@ def usage(usage):
         return inner
     return input_error
 
+
+def cached(*books):
+    """
+    Decorator caching the results of a read-only command by its arguments until
+    one of the books it reads changes generation. Only string results are cached,
+    so that a cached result never refers to values of the books.
+    """
+    def decorator(func):
+        def inner(args):
+            current = {"addressbook": _addressbook, "notesbook": _notesbook}
+            generation = tuple(current[book].generation for book in books)
+            key = (func.__name__, tuple(arg.strip() for arg in args))
+            result = _cache.get(key, generation)
+            if result is MISS:
+                result = func(args)
+                if isinstance(result, str):
+                    _cache.put(key, generation, result)
+            return result
+        return inner
+    return decorator
+
 # Define commands using the decorator
 
 
@@ -95,28 +278,25 @@ def add_contact(args):
         return Messages.WrongNameValue
     if not _validator.validate_phone(phone):
         return Messages.WrongPhoneNumber
-    record = _addressbook.find_by_name(name)
+    record = _addressbook.get_record(name)
     if record is not None:
         return Messages.ContactAlreadyExists
     record = Record(name)
     record.add_phone(phone)
-    _addressbook.add_record(name, record)
     if email and _validator.validate_email(email):
         record.email = email
-        _addressbook.update_record(name, record)
 
     if address and _validator.validate_address(address):
         record.address = address
-        _addressbook.update_record(name, record)
 
     if birthday and _validator.validate_birthday(birthday):
         record.birthday = birthday
-        _addressbook.update_record(name, record)
 
+    _addressbook.add_record(name, record)
     return Messages.ContactAdded
 
 
-@register_command('add_phone')
+@register_command('add_phone', ("name",))
 @usage(Messages.AddPhoneUsage)
 def add_phone(args):
     name, phone, *_ = args
@@ -130,7 +310,7 @@ def add_phone(args):
     return Messages.PhoneAdded
 
 
-@register_command('update_phone')
+@register_command('update_phone', ("name", "phone"))
 @usage(Messages.UpdatePhoneUsage)
 def update_phone(args):
     name, old_phone, new_phone, *_ = args
@@ -149,7 +329,7 @@ def update_phone(args):
     return Messages.ContactUpdated
 
 
-@register_command('update_email')
+@register_command('update_email', ("name",))
 @usage(Messages.UpdateEmailUsage)
 def update_email(args):
     name, email, *_ = args
@@ -163,7 +343,7 @@ def update_email(args):
     return Messages.ContactUpdated
 
 
-@register_command('update_address')
+@register_command('update_address', ("name",))
 @usage(Messages.UpdateAddressUsage)
 def update_address(args):
     name, address, *_ = args
@@ -177,20 +357,20 @@ def update_address(args):
     return Messages.ContactUpdated
 
 
-@register_command('update_birthday')
+@register_command('update_birthday', ("name",))
 @usage(Messages.UpdateBirthdayUsage)
 def update_birthday(args):
     name, date, *_ = args
     if not _validator.validate_birthday(date):
         return Messages.BirthdayNotValid
-    record = _addressbook.find_by_name(name)
+    record = _addressbook.get_record(name)
     if record:
         record.birthday = date
         _addressbook.update_record(name, record)
     return Messages.ContactUpdated
 
 
-@register_command('show_birthday')
+@register_command('show_birthday', ("name",))
 @usage(Messages.ShowBirthdayUsage)
 def show_birthday(args):
     name, *_ = args
@@ -220,14 +400,14 @@ def list_contacts(args):
     return contacts_string
 
 
-@register_command('delete')
+@register_command('delete', ("name",))
 @usage(Messages.DeleteUsage)
 def delete_contact(args):
     """
     The command to delete a contact by name
     """
     name, *_ = args
-    record = _addressbook.find_by_name(name)
+    record = _addressbook.get_record(name)
     if record is None:
         return Messages.ContactDoesNotExist
 
@@ -235,16 +415,17 @@ def delete_contact(args):
     return Messages.ContactDeleted
 
 
-@register_command('find_contact')
+@register_command('find_contact', ("name",))
 @usage(Messages.FindUsage)
+@cached("addressbook")
 def find_contact(args):
     """
     The command to find a contact by name, phone, email or birthday
     """
     value, *_ = args
-    record = _addressbook.find_by_name(value)
+    record = _addressbook.get_record(value)
     if record is not None:
-        return record
+        return str(record)
 
     if _validator.validate_phone(value):
         record = _addressbook.find("phone", value)
@@ -258,6 +439,143 @@ def find_contact(args):
     return str(record) if record is not None else Messages.ContactDoesNotExist
 
 
+@register_command('query_contacts')
+@usage(Messages.QueryUsage)
+@cached("addressbook")
+def query_contacts(args):
+    """
+    The command to find the contacts matching a query over their fields, e.g.
+    domain=example.com AND month=mar AND phone^=+38067
+    """
+    if not args:
+        raise ValueError
+    try:
+        records = _addressbook.query(" ".join(args))
+    except QuerySyntaxError as error:
+        return f"{Messages.WrongQuery}: {error}\n{Messages.QueryUsage}"
+    if not records:
+        return Messages.NoContactsMatch
+    return "\n".join(str(record) for record in records)
+
+
+@register_command('find_by_address')
+@usage(Messages.FindByAddressUsage)
+@cached("addressbook")
+def find_by_address(args):
+    """
+    The command to find the contacts whose address has all the given words,
+    e.g. everyone on Main St
+    """
+    if not args:
+        raise ValueError
+    records = _addressbook.find_by_address(" ".join(args))
+    if not records:
+        return Messages.NoContactsMatch
+    return "\n".join(str(record) for record in records)
+
+
+@register_command('show_unsaved')
+def show_unsaved(args):
+    """
+    Command to show how many changes are not persisted yet.
+    """
+    return (f"{Messages.UnsavedChanges}: addressbook {_addressbook.pending_changes}, "
+            f"notesbook {_notesbook.pending_changes}")
+
+
+@register_command('cache_stats')
+def cache_stats(args):
+    """
+    Command to show how well the result cache of the find commands works, and
+    the record caches of the books kept on disk.
+    """
+    stats = _cache.stats()
+    lines = [f"{Messages.CacheStats}: {stats['hits']} hits, {stats['misses']} misses "
+             f"({stats['hit_ratio']:.0%} hit ratio), {stats['invalidations']} invalidated, "
+             f"{stats['evictions']} evicted, {stats['entries']} entries, {stats['bytes']} bytes"]
+    for name, book in (("addressbook", _addressbook), ("notesbook", _notesbook)):
+        # Only books kept on disk have a record cache
+        if hasattr(book.data, "stats"):
+            stats = book.data.stats()
+            lines.append(f"{Messages.RecordCacheStats} ({name}): {stats['hits']} hits, "
+                         f"{stats['misses']} misses ({stats['hit_ratio']:.0%} hit ratio), "
+                         f"{stats['evictions']} evicted, {stats['writebacks']} written back, "
+                         f"{stats['entries']} of {stats['capacity']} entries, "
+                         f"{stats['dirty']} dirty")
+    return '\n'.join(lines)
+
+
+@register_command('stats')
+def stats(args):
+    """
+    Command to show the latency of the commands and the time spent saving.
+    """
+    if _metrics is None:
+        return Messages.StatsDisabled
+    return _metrics.report()
+
+
+@register_command('summary')
+@usage(Messages.SummaryUsage)
+def summary(args):
+    """
+    Command to show the counts kept up to date for both books: contacts per email
+    domain, birthdays per month, phones per contact and notes per tag.
+    """
+    top = int(args[0]) if args else 5
+    return summary_report(_addressbook.summary(), _notesbook.summary(), top)
+
+
+@register_command('changes')
+@usage(Messages.ChangesUsage)
+def changes(args):
+    """
+    Command to list the changes in the change log after a sequence number.
+    """
+    since = int(args[0]) if args else 0
+    if _change_log is None:
+        return Messages.ChangeLogDisabled
+    lines = [f"{event['seq']} {event['op']} {event['book']} {event['key']}"
+             + (f": {', '.join(event['fields'])}" if event["op"] == "update" else "")
+             for event in _change_log.read(since)]
+    return '\n'.join(lines) if lines else Messages.NoChanges
+
+
+@register_command('sync_with')
+@usage(Messages.SyncWithUsage)
+def sync_with(args):
+    """
+    Command to synchronize both books with the replicas stored in a directory.
+    """
+    if len(args) != 1:
+        raise ValueError
+    directory = args[0]
+    replicas = open_books(directory)
+    lines = [f"{Messages.Synced} {directory}"]
+    try:
+        for name, book in (("addressbook", _addressbook), ("notesbook", _notesbook)):
+            result = sync(book, replicas[name])
+            lines.append(f"{name}: {result['to_right']} sent, {result['to_left']} received, "
+                         f"{result['resolved']} resolved, {result['hashes']} hashes compared")
+    finally:
+        for replica in replicas.values():
+            replica.close()
+    return '\n'.join(lines)
+
+
+@register_command('mem_stats')
+@usage(Messages.MemStatsUsage)
+def mem_stats(args):
+    """
+    Command to show the approximate memory held by the books. With a sample size,
+    only that many values of each book are measured.
+    """
+    sample = int(args[0]) if args else None
+    books = {"addressbook": _addressbook, "notesbook": _notesbook}
+    return memory_report({name: getattr(book, "target", book)
+                          for name, book in books.items()}, sample)
+
+
 @register_command("add_note")
 @usage(Messages.AddNoteUsage)
 def add_note(args):
@@ -267,7 +585,7 @@ def add_note(args):
         return Messages.WrongKey
     if not _validator.validate_text(text):
         return Messages.WrongText
-    note = _notesbook.find_by_key(key)
+    note = _notesbook.get_note(key)
     if note is not None:
         return Messages.NoteWithThisKeyAlreadyExists
     note = Note(key, text, datetime.now())
@@ -286,18 +604,18 @@ def list_notesbook(args):
     return notes_string
 
 
-@register_command("delete_note")
+@register_command("delete_note", ("note",))
 @usage(Messages.DeleteNoteUsage)
 def delete_note(args):
     key, *_ = args
-    note = _notesbook.find_by_key(key)
+    note = _notesbook.get_note(key)
     if note is None:
         return Messages.NoteWithThisKeyNotExists
     _notesbook.delete_note(key)
     return Messages.NoteDeleted
 
 
-@register_command("update_note")
+@register_command("update_note", ("note",))
 @usage(Messages.UpdateNoteUsage)
 def update_note(args):
     key, *text_args = args
@@ -314,7 +632,7 @@ def update_note(args):
     return Messages.NoteUpdated
 
 
-@register_command("add_tag")
+@register_command("add_tag", ("note",))
 @usage(Messages.AddTagUsage)
 def add_tag(args):
     key, tag, *_ = args
@@ -330,7 +648,7 @@ def add_tag(args):
     return Messages.TagAdded
 
 
-@register_command("delete_tag")
+@register_command("delete_tag", ("note", "tag"))
 @usage(Messages.DeleteTagUsage)
 def delete_tag(args):
     key, tag, *_ = args
@@ -344,13 +662,14 @@ def delete_tag(args):
     return Messages.TagDeleted
 
 
-@register_command("find_note_by_tag")
+@register_command("find_note_by_tag", ("tag",))
 @usage(Messages.FindNoteByTagUsage)
+@cached("notesbook")
 def find_note_by_tag(args):
     tag, *_ = args
     if not _validator.validate_tag(tag):
         return Messages.WrongTag
-    notes_by_tag = [str(n) for n in _notesbook.get_all() if n.has_tag(tag)]
+    notes_by_tag = [str(n) for n in _notesbook.find_by_tag(tag)]
     notes_by_tag_str = '\n'.join(notes_by_tag)
     if not notes_by_tag_str:
         return Messages.NotesListEmpty
@@ -360,6 +679,7 @@ def find_note_by_tag(args):
 
 @register_command("find_in_notes_text")
 @usage(Messages.FindInNotesTextUsage)
+@cached("notesbook")
 def find_in_notes_text(args):
     text, *_ = args
     if not _validator.validate_text(text):
@@ -371,3 +691,96 @@ def find_in_notes_text(args):
         return Messages.NotesListEmpty
 
     return notes_by_text_str
+
+
+@register_command("search_notes")
+@usage(Messages.SearchNotesUsage)
+@cached("notesbook")
+def search_notes(args):
+    """
+    Command to find the notes most relevant to some words, best first.
+    """
+    if not args:
+        raise ValueError("No words to search for")
+    text = ' '.join(args)
+    if not _validator.validate_text(text):
+        return Messages.WrongText
+    ranked = _notesbook.search(text, Search.note_results)
+    if not ranked:
+        return Messages.NotesListEmpty
+    return '\n'.join(f"{note}\nScore: {score:.2f}" for note, score in ranked)
+
+
+def parse_date(value):
+    """
+    Parse a date given as DD.MM.YYYY or YYYY-MM-DD.
+
+    :param value: The date text.
+    :return: The date.
+    :raise ValueError: If the date is not valid.
+    """
+    for date_format in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Wrong date: {value}")
+
+
+def date_field(args, position):
+    field = args[position].lower() if len(args) > position else None
+    if field not in (None, "created", "modified"):
+        raise ValueError(f"Wrong date field: {field}")
+    return field
+
+
+@register_command("notes_between", (None, None, ("created", "modified")))
+@usage(Messages.NotesBetweenUsage)
+@cached("notesbook")
+def notes_between(args):
+    """
+    Command to list the notes created, or last changed, within a range of days.
+    """
+    start, end = parse_date(args[0]), parse_date(args[1])
+    field = date_field(args, 2) or "created"
+    notes = _notesbook.find_by_date(datetime.combine(start, time.min),
+                                    datetime.combine(end, time.max), field)
+    if not notes:
+        return Messages.NotesListEmpty
+    return '\n'.join(str(note) for note in notes)
+
+
+@register_command("latest_notes", (None, ("modified", "created")))
+@usage(Messages.LatestNotesUsage)
+@cached("notesbook")
+def latest_notes(args):
+    """
+    Command to list the notes changed, or created, most recently.
+    """
+    count = int(args[0]) if args else 10
+    field = date_field(args, 1) or "modified"
+    notes = _notesbook.latest(count, field)
+    if not notes:
+        return Messages.NotesListEmpty
+    return '\n'.join(str(note) for note in notes)
+
+
+@register_command("dedupe", (("apply",),))
+@usage(Messages.DedupeUsage)
+def dedupe(args):
+    """
+    Command to preview the merges of duplicate contacts, or to apply them all at once.
+    """
+    if args and args[0].lower() != "apply":
+        raise ValueError(f"Unknown option: {args[0]}")
+    if args:
+        merged = _addressbook.merge_duplicates()
+        if not merged:
+            return Messages.NoDuplicates
+        return '\n'.join([f"{', '.join(keys)} -> {record.name.value}" for keys, record in merged]
+                         + [f"{Messages.DuplicatesMerged}: {len(merged)}"])
+    clusters = _addressbook.find_duplicates()
+    if not clusters:
+        return Messages.NoDuplicates
+    return '\n'.join([f"{', '.join(keys)} (same {', '.join(sorted(reasons))})"
+                      for keys, reasons in clusters] + [Messages.DuplicatesPreview])
@@ -0,0 +1,47 @@
+"""
+This module provides the completion of the command line: the command names, then
+the arguments of the command by their position, e.g. contact names, their phones,
+note keys and tags. The candidates come from the indexes of the books, so the
+completer is meant to run wrapped in a ThreadedCompleter, off the UI thread.
+"""
+
+from prompt_toolkit.completion import Completer, Completion
+
+
+class CommandCompleter(Completer):
+    """
+    Completes the command name first and then the argument under the cursor.
+    """
+
+    def __init__(self, commands, complete_argument):
+        """
+        Initialize the CommandCompleter.
+
+        :param commands: The names of the commands.
+        :param complete_argument: A function taking the command, the arguments
+            before the cursor and the typed prefix, and returning the completions.
+        """
+        self.__commands = sorted(commands)
+        self.__complete_argument = complete_argument
+
+    def get_completions(self, document, complete_event):
+        """
+        Yield the completions of the word before the cursor.
+
+        :param document: The prompt_toolkit Document being edited.
+        :param complete_event: The CompleteEvent.
+        :return: An iterator of Completions.
+        """
+        text = document.text_before_cursor
+        words = text.split()
+        if text and not text[-1].isspace():
+            prefix = words.pop()
+        else:
+            prefix = ""
+        if not words:
+            candidates = [command for command in self.__commands
+                          if command.startswith(prefix.lower())]
+        else:
+            candidates = self.__complete_argument(words[0], words[1:], prefix)
+        for candidate in candidates:
+            yield Completion(candidate, start_position=-len(prefix))
@@ -0,0 +1,77 @@
+"""
+This module provides streaming compression for the files written by the savers.
+Compressed files are written through gzip (zlib deflate) or lzma streams and are
+recognized on read by the magic bytes at the start of the stream, so plain and
+compressed files can be mixed and a book can switch compression at any time.
+"""
+
+import gzip
+import lzma
+from contextlib import contextmanager
+
+GZIP_MAGIC = b"\x1f\x8b"
+LZMA_MAGIC = b"\xfd7zXZ\x00"
+COMPRESSIONS = (None, "gzip", "lzma")
+
+
+@contextmanager
+def writer(f, compression=None):
+    """
+    Wrap a binary file with a compressing stream. The stream is finished on exit,
+    but the file is left open, so that it can still be synced by the caller.
+
+    :param f: A binary file object opened for writing or appending.
+    :param compression: None, 'gzip' or 'lzma'.
+    :return: A context manager giving a binary file object to write the data to.
+    """
+    if compression is None:
+        yield f
+        return
+    if compression == "gzip":
+        stream = gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6)
+    elif compression == "lzma":
+        stream = lzma.LZMAFile(f, "wb")
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+    try:
+        yield stream
+    finally:
+        stream.close()
+
+
+def reader(f):
+    """
+    Wrap a binary file positioned at the start of a stream with a decompressing
+    reader if the stream is compressed.
+
+    :param f: A buffered binary file object.
+    :return: A binary file object reading the decompressed data.
+    """
+    magic = f.peek(len(LZMA_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if magic.startswith(LZMA_MAGIC):
+        return lzma.LZMAFile(f, "rb")
+    return f
+
+
+def detect(path, default=None):
+    """
+    Get the compression of an existing file, so that appends can keep it.
+
+    :param path: The path to the file.
+    :param default: The compression to report for a missing or empty file.
+    :return: None, 'gzip' or 'lzma'.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(len(LZMA_MAGIC))
+    except OSError:
+        return default
+    if not magic:
+        return default
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(LZMA_MAGIC):
+        return "lzma"
+    return None
@@ -31,6 +31,9 @@ class Messages:
     DeleteUsage = f"{Fore.YELLOW}Usage: delete [NAME]{Style.RESET_ALL}"
     FindUsage = f"{Fore.YELLOW}Usage: find_contact [NAME or PHONE or EMAIL or BIRTHDAY]{
         Style.RESET_ALL}"
+    QueryUsage = f"{Fore.YELLOW}Usage: query_contacts [FIELD][=,!=,^=,~=,<,<=,>,>=][VALUE] "\
+        f"[AND/OR/NOT ...], e.g. domain=example.com AND month=mar AND phone^=+38067{
+        Style.RESET_ALL}"
     AddNoteUsage = f"{Fore.YELLOW}Usage: add_note [KEY] [TEXT]{
         Style.RESET_ALL}"
     DeleteNoteUsage = f"{Fore.YELLOW}Usage: delete_note [KEY]{Style.RESET_ALL}"
@@ -43,6 +46,24 @@ class Messages:
         Fore.YELLOW}Usage: find_note_by_tag [KEY_TAG]{Style.RESET_ALL}"
     FindInNotesTextUsage = f"{
         Fore.YELLOW}Usage: find_in_notes_text [TEXT]{Style.RESET_ALL}"
+    SearchNotesUsage = f"{
+        Fore.YELLOW}Usage: search_notes [WORDS]{Style.RESET_ALL}"
+    NotesBetweenUsage = f"{
+        Fore.YELLOW}Usage: notes_between [FROM] [TO] [created|modified*], dates as DD.MM.YYYY{Style.RESET_ALL}"
+    LatestNotesUsage = f"{
+        Fore.YELLOW}Usage: latest_notes [COUNT*] [modified|created*]{Style.RESET_ALL}"
+    DedupeUsage = f"{
+        Fore.YELLOW}Usage: dedupe [apply*]{Style.RESET_ALL}"
+    SummaryUsage = f"{
+        Fore.YELLOW}Usage: summary [TOP*]{Style.RESET_ALL}"
+    FindByAddressUsage = f"{
+        Fore.YELLOW}Usage: find_by_address [STREET OR CITY]{Style.RESET_ALL}"
+    ChangesUsage = f"{
+        Fore.YELLOW}Usage: changes [SINCE_SEQUENCE_NUMBER*]{Style.RESET_ALL}"
+    SyncWithUsage = f"{
+        Fore.YELLOW}Usage: sync_with DIRECTORY{Style.RESET_ALL}"
+    MemStatsUsage = f"{
+        Fore.YELLOW}Usage: mem_stats [SAMPLE_SIZE*]{Style.RESET_ALL}"
     WrongParameters = f"{Fore.RED}Wrong parameters{Style.RESET_ALL}"
     WrongPhoneNumber = f"{
         Fore.RED}Wrong phone number. Must be 12 numbers starting with 38{Style.RESET_ALL}"
@@ -76,10 +97,20 @@ class Messages:
     BirthdayNotValid = f"{
         Fore.RED}Invalid date format. Use DD.MM.YYYY{Style.RESET_ALL}"
     ContactListEmpty = f"{Fore.YELLOW}Contact list is empty{Style.RESET_ALL}"
+    NoContactsMatch = f"{Fore.YELLOW}No contacts match the query{Style.RESET_ALL}"
+    WrongQuery = f"{Fore.RED}Wrong query{Style.RESET_ALL}"
     NotesListEmpty = f"{Fore.YELLOW}Notes list is empty{Style.RESET_ALL}"
     BirthdayNotSet = f"{Fore.YELLOW}Birthday not set.{Style.RESET_ALL}"
     UpcomingBirthdayMiddlePart = f"{
         Fore.CYAN}has an upcoming birthday on{Style.RESET_ALL}"
+    NoDuplicates = f"{Fore.YELLOW}No duplicate contacts found{Style.RESET_ALL}"
+    DuplicatesPreview = f"{Fore.CYAN}Run 'dedupe apply' to merge them{Style.RESET_ALL}"
+    DuplicatesMerged = f"{Fore.GREEN}Duplicate contacts merged{Style.RESET_ALL}"
+    ChangeLogDisabled = f"{
+        Fore.YELLOW}The change log is disabled. Set ASSISTANT_CHANGE_LOG to a file to keep one{Style.RESET_ALL}"
+    NoChanges = f"{Fore.YELLOW}No changes{Style.RESET_ALL}"
+    Synced = f"{Fore.GREEN}Synchronized with{Style.RESET_ALL}"
+    BirthdayReminder = f"{Fore.MAGENTA}Reminder:{Style.RESET_ALL}"
     NoUpcomingBirthday = f"{
         Fore.YELLOW}You have no contacts with upcoming birthday{Style.RESET_ALL}"
     NoteAdded = f"{Fore.GREEN}{
@@ -105,10 +136,69 @@ class Messages:
     WrongText = f"{Fore.RED}You can't add empty note{Style.RESET_ALL}"
     WrongTag = f"{Fore.RED}Wrong tag for note. Should be on alphanumeric value{
         Style.RESET_ALL}"
+    UnsavedChanges = f"{Fore.CYAN}Unsaved changes{Style.RESET_ALL}"
+    CacheStats = f"{Fore.CYAN}Result cache{Style.RESET_ALL}"
+    RecordCacheStats = f"{Fore.CYAN}Record cache{Style.RESET_ALL}"
+    StatsDisabled = f"{
+        Fore.YELLOW}Statistics are disabled. Set ASSISTANT_STATS=1 to collect them{Style.RESET_ALL}"
     NoCommandEntered = f"{
         Fore.CYAN}No command entered. Press 'Tab' to view the list of available commands{Style.RESET_ALL}"
 
 
 class Paths:
     addressbook_file = str(Path.home()) + os.sep + "addressbook.pkl"
+    addressbook_snapshot = str(Path.home()) + os.sep + "addressbook.snap"
     notesbook_file = str(Path.home()) + os.sep + "notesbook.pkl"
+    notesbook_dir = str(Path.home()) + os.sep + "notesbook"
+
+
+class Persistence:
+    write_behind = os.environ.get("ASSISTANT_WRITE_BEHIND", "0") == "1"
+    write_behind_delay = float(
+        os.environ.get("ASSISTANT_WRITE_BEHIND_DELAY", "1.0"))
+    write_behind_max_pending = int(
+        os.environ.get("ASSISTANT_WRITE_BEHIND_MAX_PENDING", "100"))
+    shared_storage = os.environ.get("ASSISTANT_SHARED_STORAGE", "0") == "1"
+    journal_compact_every = int(
+        os.environ.get("ASSISTANT_JOURNAL_COMPACT_EVERY", "1000"))
+    shards = int(os.environ.get("ASSISTANT_SHARDS", "0"))
+    blobs = os.environ.get("ASSISTANT_BLOBS", "1") == "1"
+    binary_snapshots = os.environ.get("ASSISTANT_BINARY_SNAPSHOTS", "0") == "1"
+    compression = os.environ.get("ASSISTANT_COMPRESSION") or None
+    change_log = os.environ.get("ASSISTANT_CHANGE_LOG") or None
+    disk_storage = os.environ.get("ASSISTANT_DISK_STORAGE", "0") == "1"
+    disk_flush_every = int(os.environ.get("ASSISTANT_DISK_FLUSH_EVERY", "100"))
+
+
+class Diagnostics:
+    stats = os.environ.get("ASSISTANT_STATS", "0") == "1"
+    stats_file = os.environ.get("ASSISTANT_STATS_FILE") or None
+    stats_interval = float(os.environ.get("ASSISTANT_STATS_INTERVAL", "60"))
+    profile_dir = os.environ.get("ASSISTANT_PROFILE_DIR") or None
+    profile_commands = [command for command in os.environ.get(
+        "ASSISTANT_PROFILE_COMMANDS", "").split(",") if command]
+    profile_every = int(os.environ.get("ASSISTANT_PROFILE_EVERY", "1"))
+    profile_cpu = os.environ.get("ASSISTANT_PROFILE_CPU", "1") == "1"
+    profile_memory = os.environ.get("ASSISTANT_PROFILE_MEMORY", "0") == "1"
+
+
+class Caching:
+    result_cache_entries = int(os.environ.get("ASSISTANT_CACHE_ENTRIES", "256"))
+    result_cache_bytes = int(os.environ.get("ASSISTANT_CACHE_BYTES", str(16 << 20)))
+    record_cache_entries = int(os.environ.get("ASSISTANT_RECORD_CACHE", "10000"))
+
+
+class Completions:
+    limit = int(os.environ.get("ASSISTANT_COMPLETIONS", "20"))
+
+
+class Search:
+    note_results = int(os.environ.get("ASSISTANT_SEARCH_RESULTS", "10"))
+
+
+class Reminders:
+    # The schedule is built from every contact before the first prompt, so it is off
+    # by default for the storage modes that avoid reading every contact on start
+    enabled = os.environ.get("ASSISTANT_REMINDERS", "0" if Persistence.binary_snapshots
+                             or Persistence.disk_storage else "1") == "1"
+    days = int(os.environ.get("ASSISTANT_REMINDER_DAYS", "1"))
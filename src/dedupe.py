@@ -0,0 +1,144 @@
+"""
+This module finds duplicate contact records and merges them.
+
+Records are grouped in a single pass by hash keys: their normalized phones, their
+lower-cased email and their name reduced to letters. Near-identical names are
+blocked the same way: every name is also hashed under its variants missing one
+letter, which two names one edit apart always share, so only the names within a
+block are compared instead of every pair of records. Records linked by any key
+end up in the same cluster.
+"""
+
+import re
+from validation import Validation, normalize_phone
+
+_NOT_LETTER = re.compile(r"[^a-z]")
+# Blocks this large come from very short names and are not compared
+MAX_BLOCK = 20
+_validator = Validation()
+
+
+def name_key(name):
+    """
+    Get the key of a name that equal names differing in case or hyphens share.
+
+    :param name: The name.
+    :return: The lower-cased letters of the name.
+    """
+    return _NOT_LETTER.sub("", name.lower())
+
+
+def within_one_edit(first, second):
+    """
+    Check whether two strings differ by at most one inserted, deleted or replaced
+    character.
+
+    :param first: A string.
+    :param second: Another string.
+    :return: True if they are at most one edit apart.
+    """
+    if abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    for position, (a, b) in enumerate(zip(first, second)):
+        if a != b:
+            skip = 1 if len(first) < len(second) else 0
+            return first[position + 1 - skip:] == second[position + 1:]
+    return True
+
+
+def find_clusters(records):
+    """
+    Find the clusters of records that are likely the same contact.
+
+    :param records: A mapping of keys to contact records.
+    :return: A list of (keys, reasons) pairs: the sorted keys of each cluster of
+        two or more records and the set of the kinds of keys that linked them
+        ('phone', 'email', 'name').
+    """
+    parents = {key: key for key in records}
+
+    def find(key):
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    links = []
+    groups = {}
+    names = {}
+    # Most variants belong to a single name, so a block is a key until a second
+    # name shares it
+    blocks = {}
+    # The phones and emails of all records are normalized a column at a time
+    phone_keys, phones, email_keys, emails = [], [], [], []
+    for key, record in records.items():
+        for phone in record.phones:
+            phone_keys.append(key)
+            phones.append(phone.value)
+        if record.email:
+            email_keys.append(key)
+            emails.append(record.email.value)
+    for kind, keys, values in (("phone", phone_keys, phones), ("email", email_keys, emails)):
+        for key, value in zip(keys, _validator.normalize_batch(kind, values)):
+            groups.setdefault((kind, value), []).append(key)
+    for key, record in records.items():
+        name = names[key] = name_key(record.name.value)
+        groups.setdefault(("name", name), []).append(key)
+        for variant in {name} | {name[:i] + name[i + 1:] for i in range(len(name))}:
+            block = blocks.get(variant)
+            if block is None:
+                blocks[variant] = key
+            elif isinstance(block, list):
+                block.append(key)
+            else:
+                blocks[variant] = [block, key]
+    for (kind, _), keys in groups.items():
+        for other in keys[1:]:
+            links.append((keys[0], other, kind))
+    for block in blocks.values():
+        if not isinstance(block, list) or len(block) > MAX_BLOCK:
+            continue
+        for position, key in enumerate(block):
+            for other in block[position + 1:]:
+                if names[key] != names[other] and within_one_edit(names[key], names[other]):
+                    links.append((key, other, "name"))
+
+    for first, second, _ in links:
+        parents[find(first)] = find(second)
+    clusters = {}
+    for key in records:
+        clusters.setdefault(find(key), []).append(key)
+    reasons = {}
+    for first, _, kind in links:
+        reasons.setdefault(find(first), set()).add(kind)
+    return sorted((sorted(keys), reasons[root])
+                  for root, keys in clusters.items() if len(keys) > 1)
+
+
+def merge(records):
+    """
+    Merge the records of a cluster into the most complete of them.
+
+    :param records: The records of the cluster.
+    :return: A new record with the name of the most complete record, the phones
+        of all records without duplicates and the first email, address and
+        birthday set, the most complete record's first.
+    """
+    def completeness(record):
+        return (bool(record.email) + bool(record.address) + bool(record.birthday)
+                + len(record.phones))
+
+    ordered = sorted(records, key=completeness, reverse=True)
+    merged = ordered[0].copy()
+    seen = {normalize_phone(phone.value) for phone in merged.phones}
+    for record in ordered[1:]:
+        for phone in record.phones:
+            if normalize_phone(phone.value) not in seen:
+                seen.add(normalize_phone(phone.value))
+                merged.add_phone(phone.value)
+        for field in ("email", "address", "birthday"):
+            if not getattr(merged, field) and getattr(record, field):
+                setattr(merged, field, getattr(record, field).value)
+    return merged
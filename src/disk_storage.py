@@ -0,0 +1,496 @@
+"""
+This module keeps a book on disk instead of in memory, for books that do not fit
+comfortably in RAM.
+
+The values live in an SQLite table, one pickled value per key. `RecordStore`
+keeps only the most recently used values resident in an LRU cache; changed values
+stay in the cache marked dirty and are written back when they are evicted or
+flushed. `DiskRecords` is the mapping a book holds over the store: scans stream
+through the table page by page instead of loading every value, and copies made
+for live snapshots keep the values the book changes after the copy.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from repository import Saver, Snapshot
+
+# The number of rows read at a time by a scan
+PAGE_SIZE = 500
+# Marks the keys that a copy did not have yet
+_ABSENT = object()
+
+
+class RecordStore:
+    """
+    An SQLite table of pickled values with an LRU cache of the values in use.
+    """
+
+    def __init__(self, path, cache_entries=10000):
+        """
+        Initialize the RecordStore over a database file.
+
+        :param path: The path to the database file. It is created if needed.
+        :param cache_entries: The maximum number of values held in memory.
+        """
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.execute("CREATE TABLE IF NOT EXISTS records "
+                          "(key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self.__lock = threading.RLock()
+        self.__capacity = max(1, cache_entries)
+        self.__cache = OrderedDict()
+        self.__dirty = set()
+        self.__deleted = set()
+        self.__count = self.__db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        self.__views = []
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__writebacks = 0
+
+    def __len__(self):
+        return self.__count
+
+    def get(self, key):
+        """
+        Get a value, reading it from the table into the cache on a miss.
+
+        :param key: The key of the value.
+        :return: The value.
+        :raise KeyError: If there is no value under the key.
+        """
+        with self.__lock:
+            value = self.__cache.get(key)
+            if value is not None:
+                self.__hits += 1
+                self.__cache.move_to_end(key)
+                return value
+            self.__misses += 1
+            value = self.__read(key)
+            if value is None:
+                raise KeyError(key)
+            self.__cache[key] = value
+            self.__evict()
+            return value
+
+    def contains(self, key):
+        """
+        Check whether there is a value under a key, without reading it.
+
+        :param key: The key.
+        :return: True if there is a value under the key.
+        """
+        with self.__lock:
+            if key in self.__cache:
+                return True
+            if key in self.__deleted:
+                return False
+            return self.__db.execute("SELECT 1 FROM records WHERE key = ?",
+                                     (key,)).fetchone() is not None
+
+    def set(self, key, value):
+        """
+        Store a value in the cache, to be written back later.
+
+        :param key: The key of the value.
+        :param value: The value.
+        """
+        with self.__lock:
+            self.__preserve(key)
+            if not self.contains(key):
+                self.__count += 1
+            self.__cache[key] = value
+            self.__cache.move_to_end(key)
+            self.__dirty.add(key)
+            self.__deleted.discard(key)
+            self.__evict()
+
+    def delete(self, key):
+        """
+        Delete a value, to be deleted from the table later.
+
+        :param key: The key of the value.
+        :raise KeyError: If there is no value under the key.
+        """
+        with self.__lock:
+            if not self.contains(key):
+                raise KeyError(key)
+            self.__preserve(key)
+            self.__cache.pop(key, None)
+            self.__dirty.discard(key)
+            self.__deleted.add(key)
+            self.__count -= 1
+
+    def scan(self, values=True):
+        """
+        Iterate over the keys, and the values, a page at a time in key order. The
+        values not in the cache are read without being cached, so that a scan
+        does not evict the values in use.
+
+        :param values: Whether to read the values too.
+        :return: An iterator of (key, value) pairs, with None values if `values`
+            is False.
+        """
+        columns = "key, value" if values else "key, NULL"
+        rows = None
+        while rows is None or len(rows) == PAGE_SIZE:
+            with self.__lock:
+                self.write_back()
+                if rows is None:
+                    rows = self.__db.execute(f"SELECT {columns} FROM records ORDER BY key LIMIT ?",
+                                             (PAGE_SIZE,)).fetchall()
+                elif rows:
+                    rows = self.__db.execute(f"SELECT {columns} FROM records WHERE key > ? "
+                                             "ORDER BY key LIMIT ?",
+                                             (rows[-1][0], PAGE_SIZE)).fetchall()
+                page = [(key, self.__cache.get(key, data)) for key, data in rows]
+            for key, value in page:
+                yield key, pickle.loads(value) if isinstance(value, bytes) else value
+
+    def write_back(self):
+        """
+        Write the dirty values and the deletions to the table, without committing.
+
+        :return: The number of bytes written.
+        """
+        with self.__lock:
+            written = 0
+            if self.__dirty:
+                rows = [(key, pickle.dumps(self.__cache[key])) for key in self.__dirty]
+                self.__db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?)", rows)
+                written = sum(len(data) for _, data in rows)
+                self.__writebacks += len(rows)
+                self.__dirty = set()
+            if self.__deleted:
+                self.__db.executemany("DELETE FROM records WHERE key = ?",
+                                      [(key,) for key in self.__deleted])
+                self.__deleted = set()
+            return written
+
+    def flush(self):
+        """
+        Write back the changes and commit them.
+
+        :return: The number of bytes written.
+        """
+        with self.__lock:
+            written = self.write_back()
+            self.__db.commit()
+            return written
+
+    def close(self):
+        """
+        Flush the changes and close the database.
+        """
+        with self.__lock:
+            self.flush()
+            self.__db.close()
+
+    def resident(self):
+        """
+        Get the values held in memory.
+
+        :return: A dict of keys to values.
+        """
+        with self.__lock:
+            return dict(self.__cache)
+
+    def stats(self):
+        """
+        Get the statistics of the cache.
+
+        :return: A dict with the number of hits, misses, evictions and
+            written back values, the hit ratio, the resident and dirty values and
+            the capacity.
+        """
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "hit_ratio": self.__hits / lookups if lookups else 0.0,
+                "evictions": self.__evictions,
+                "writebacks": self.__writebacks,
+                "entries": len(self.__cache),
+                "dirty": len(self.__dirty),
+                "capacity": self.__capacity,
+            }
+
+    def add_view(self, view):
+        """
+        Keep a copy informed of the values changed from now on.
+
+        :param view: A DiskRecords copy.
+        """
+        self.__views.append(weakref.ref(view))
+
+    def __read(self, key):
+        if key in self.__deleted:
+            return None
+        row = self.__db.execute("SELECT value FROM records WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def __preserve(self, key):
+        if not self.__views:
+            return
+        self.__views = [ref for ref in self.__views if ref() is not None]
+        views = [view for view in (ref() for ref in self.__views)
+                 if view is not None and not view._preserves(key)]
+        if not views:
+            return
+        value = self.__cache.get(key)
+        if value is None:
+            value = self.__read(key)
+        for view in views:
+            view._preserve(key, value if value is not None else _ABSENT)
+
+    def __evict(self):
+        while len(self.__cache) > self.__capacity:
+            key, value = self.__cache.popitem(last=False)
+            self.__evictions += 1
+            if key in self.__dirty:
+                self.__dirty.discard(key)
+                self.__db.execute("INSERT OR REPLACE INTO records VALUES (?, ?)",
+                                  (key, pickle.dumps(value)))
+                self.__writebacks += 1
+
+
+class DiskRecords(MutableMapping):
+    """
+    The mapping of keys to values a book holds over a RecordStore.
+
+    A copy, made by the book while a snapshot still uses the mapping, becomes the
+    mapping the book changes, and the original keeps the values as they were at
+    the time of the copy.
+    """
+
+    def __init__(self, store):
+        """
+        Initialize the DiskRecords over a store.
+
+        :param store: The RecordStore.
+        """
+        self.__store = store
+        self.__preserved = None
+
+    @property
+    def store(self):
+        """
+        Get the store the values are kept in.
+
+        :return: The RecordStore.
+        """
+        return self.__store
+
+    def __getitem__(self, key):
+        if self.__preserved is not None and key in self.__preserved:
+            value = self.__preserved[key]
+            if value is _ABSENT:
+                raise KeyError(key)
+            return value
+        return self.__store.get(key)
+
+    def __setitem__(self, key, value):
+        self.__check_writable()
+        self.__store.set(key, value)
+
+    def __delitem__(self, key):
+        self.__check_writable()
+        self.__store.delete(key)
+
+    def __contains__(self, key):
+        if self.__preserved is not None and key in self.__preserved:
+            return self.__preserved[key] is not _ABSENT
+        return self.__store.contains(key)
+
+    def __iter__(self):
+        for key, _ in self.__scan(values=False):
+            yield key
+
+    def __len__(self):
+        if self.__preserved is None:
+            return len(self.__store)
+        preserved = list(self.__preserved.items())
+        return (len(self.__store) - sum(1 for key, _ in preserved if self.__store.contains(key))
+                + sum(1 for _, value in preserved if value is not _ABSENT))
+
+    def items(self):
+        return _ScannedItems(self)
+
+    def values(self):
+        return _ScannedValues(self)
+
+    def copy(self):
+        """
+        Get the mapping to change from now on. This mapping keeps the values as
+        they are now.
+
+        :return: A new DiskRecords over the same store.
+        """
+        self.__check_writable()
+        self.__preserved = {}
+        self.__store.add_view(self)
+        return DiskRecords(self.__store)
+
+    def resident(self):
+        """
+        Get the values held in memory.
+
+        :return: A dict of keys to values.
+        """
+        return self.__store.resident()
+
+    def stats(self):
+        """
+        Get the statistics of the cache of the store.
+
+        :return: A dict of statistics, see RecordStore.stats.
+        """
+        return self.__store.stats()
+
+    def _preserves(self, key):
+        return self.__preserved is not None and key in self.__preserved
+
+    def _preserve(self, key, value):
+        self.__preserved[key] = value
+
+    def __check_writable(self):
+        if self.__preserved is not None:
+            raise TypeError("A copied DiskRecords cannot be changed")
+
+    def __scan(self, values):
+        if self.__preserved is None:
+            yield from self.__store.scan(values)
+            return
+        preserved = dict(self.__preserved)
+        for key, value in self.__store.scan(values):
+            if key not in preserved:
+                yield key, value
+        for key, value in preserved.items():
+            if value is not _ABSENT:
+                yield key, value
+
+
+class _ScannedItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._DiskRecords__scan(values=True)
+
+
+class _ScannedValues(ValuesView):
+    def __iter__(self):
+        for _, value in self._mapping._DiskRecords__scan(values=True):
+            yield value
+
+
+class DiskSaver(Saver):
+    """
+    A Saver that keeps a book in an SQLite database, holding only the values in use
+    in memory.
+
+    Changes are written back and committed every `flush_every` changes and when
+    the book is flushed or closed. Data saved by a plain Saver to `legacy_path` is
+    imported on the first load. The database is meant for a single process.
+    """
+
+    def __init__(self, path, cache_entries=10000, flush_every=100, legacy_path=None):
+        """
+        Initialize the DiskSaver with a database path.
+
+        :param path: The path to the database file.
+        :param cache_entries: The maximum number of values held in memory.
+        :param flush_every: The number of changes that triggers a commit.
+        :param legacy_path: The path to a single-file pickle to import from.
+        """
+        super().__init__(legacy_path)
+        self.__path = path
+        self.__legacy_path = legacy_path
+        self.__cache_entries = cache_entries
+        self.__flush_every = flush_every
+        self.__store = None
+        self.__pending = 0
+
+    @property
+    def pending(self):
+        """
+        Get the number of changes that are not committed yet.
+
+        :return: The number of uncommitted changes.
+        """
+        return self.__pending
+
+    def load(self):
+        """
+        Open the database, importing the legacy data if the database is empty.
+
+        :return: A DiskRecords over the database.
+        """
+        if self.__store is None:
+            self.__store = RecordStore(self.__path, self.__cache_entries)
+            if not len(self.__store) and self.__legacy_path \
+                    and os.path.exists(self.__legacy_path):
+                for key, value in super().load().items():
+                    self.__store.set(key, value)
+                self._count_written(self.__store.flush())
+        return DiskRecords(self.__store)
+
+    def save(self, data):
+        """
+        Commit the changes of the data. Data that is not kept in the database of the
+        Saver replaces its content.
+
+        :param data: The data to be saved.
+        """
+        if isinstance(data, Snapshot):
+            data = data._data
+        if self.__store is None:
+            self.load()
+        if not isinstance(data, DiskRecords) or data.store is not self.__store:
+            for key in [key for key, _ in self.__store.scan(values=False) if key not in data]:
+                self.__store.delete(key)
+            for key, value in data.items():
+                self.__store.set(key, value)
+        self.flush()
+
+    def save_change(self, data, key):
+        """
+        Count the change of the value under the key. The book keeps the value in the
+        cache of the store until it is written back.
+
+        :param data: The data after the change.
+        :param key: The key of the changed value.
+        """
+        self.save_changes(data, [key])
+
+    def save_changes(self, data, keys):
+        """
+        Count the changes of the values under several keys, and commit once enough
+        changes are waiting.
+
+        :param data: The data after the changes.
+        :param keys: The keys of the changed values.
+        """
+        self.__pending += len(keys)
+        if self.__pending >= self.__flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Write back and commit all pending changes.
+        """
+        if self.__store is not None:
+            self._count_written(self.__store.flush())
+        self.__pending = 0
+
+    def close(self):
+        """
+        Commit all pending changes and close the database.
+        """
+        if self.__store is not None:
+            self._count_written(self.__store.flush())
+            self.__store.close()
+            self.__store = None
+        self.__pending = 0
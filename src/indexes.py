@@ -0,0 +1,414 @@
+"""
+This module provides in-memory secondary indexes over the contact records of an
+address book and the dates of notes. `SortedIndex` keeps (value, key) pairs sorted so that equality,
+prefix and range lookups are binary searches, and `RecordIndexes` maintains one
+such index per queried field, building it on first use and keeping it up to date
+as records are set and deleted.
+"""
+
+import re
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun",
+          "jul", "aug", "sep", "oct", "nov", "dec")
+
+
+def _lower(field):
+    return [field.value.lower()] if field else []
+
+
+_DATE = re.compile(r"(\d{2})\.(\d{2})\.(\d{4})")
+
+
+def _birthday(record):
+    # Reordered as YYYY-MM-DD so that they sort as dates; a stored value that is
+    # not DD.MM.YYYY is not indexed
+    match = _DATE.fullmatch(record.birthday.value) if record.birthday else None
+    return [f"{match[3]}-{match[2]}-{match[1]}"] if match else []
+
+
+# The values each field of a record is indexed and compared by
+FIELDS = {
+    "name": lambda record: _lower(record.name),
+    "phone": lambda record: [phone.value for phone in record.phones],
+    "email": lambda record: _lower(record.email),
+    "domain": lambda record: [email.rsplit("@", 1)[-1] for email in _lower(record.email)],
+    "address": lambda record: _lower(record.address),
+    "birthday": _birthday,
+    "month": lambda record: [int(birthday[5:7]) for birthday in _birthday(record)],
+}
+
+
+# The dates notes are indexed by
+NOTE_DATES = {
+    "created": lambda note: [note.create_date],
+    "modified": lambda note: [note.modify_date],
+}
+
+
+# The keys and tags notes are indexed by, for completion
+NOTE_KEYS = {
+    "key": lambda note: [note.key.lower()],
+    "tag": lambda note: list(dict.fromkeys(note.tags)),
+}
+
+
+def field_values(record, field):
+    """
+    Get the normalized values of a record field.
+
+    :param record: The contact record.
+    :param field: One of FIELDS.
+    :return: A list of values: lower-cased texts, ISO birthdays or month numbers.
+    """
+    return FIELDS[field](record)
+
+
+def record_matches(record, field_name, value):
+    """
+    Check whether a record has the value in the field.
+
+    :param record: The contact record.
+    :param field_name: The field to check (e.g., 'phone').
+    :param value: The value to look for.
+    :return: True if the record has the value, False otherwise.
+    """
+    if field_name == "phone":
+        return record.has_phone(value)
+    field = getattr(record, field_name, None)
+    return bool(field) and field.value == value
+
+
+def normalize(field, value):
+    """
+    Normalize a value given for a field the way the field values are normalized.
+
+    :param field: One of FIELDS.
+    :param value: The value as typed by the user.
+    :return: The normalized value.
+    :raise ValueError: If the value is not valid for the field.
+    """
+    if field == "phone":
+        return value
+    if field == "birthday":
+        for date_format in ("%d.%m.%Y", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(value, date_format).date().isoformat()
+            except ValueError:
+                pass
+        raise ValueError(f"Wrong date: {value}")
+    if field == "month":
+        if re.fullmatch(r"\d{1,2}", value) and 1 <= int(value) <= 12:
+            return int(value)
+        if value[:3].lower() in MONTHS:
+            return MONTHS.index(value[:3].lower()) + 1
+        raise ValueError(f"Wrong month: {value}")
+    return value.lower()
+
+
+class SortedIndex:
+    """
+    A sorted list of (value, key) pairs.
+
+    Inserts and removals are binary searches plus a list shift, lookups are binary
+    searches, and counting the matches of a lookup does not touch the matches.
+    """
+
+    def __init__(self, entries=()):
+        """
+        Initialize the SortedIndex.
+
+        :param entries: The initial (value, key) pairs in any order.
+        """
+        self.__entries = sorted(entries)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def add(self, key, value):
+        """
+        Add a value of a key.
+
+        :param key: The key of the record.
+        :param value: The indexed value.
+        """
+        insort(self.__entries, (value, key))
+
+    def remove(self, key, value):
+        """
+        Remove a value of a key.
+
+        :param key: The key of the record.
+        :param value: The indexed value.
+        """
+        position = bisect_left(self.__entries, (value, key))
+        if position < len(self.__entries) and self.__entries[position] == (value, key):
+            del self.__entries[position]
+
+    def count(self, op, value):
+        """
+        Count the entries matching a lookup.
+
+        :param op: '=', '^=' (prefix), '<', '<=', '>', '>=' or '..' (inclusive range).
+        :param value: The value, or a (low, high) tuple for a range.
+        :return: The number of matching entries.
+        """
+        low, high = self.__span(op, value)
+        return max(0, high - low)
+
+    def keys(self, op, value):
+        """
+        Get the keys of the entries matching a lookup.
+
+        :param op: '=', '^=' (prefix), '<', '<=', '>', '>=' or '..' (inclusive range).
+        :param value: The value, or a (low, high) tuple for a range.
+        :return: A set of keys.
+        """
+        low, high = self.__span(op, value)
+        return {key for _, key in self.__entries[low:high]}
+
+    def entries(self, op, value):
+        """
+        Get the entries matching a lookup in order.
+
+        :param op: '=', '^=' (prefix), '<', '<=', '>', '>=' or '..' (inclusive range).
+        :param value: The value, or a (low, high) tuple for a range.
+        :return: A list of (value, key) pairs, sorted by value.
+        """
+        low, high = self.__span(op, value)
+        return self.__entries[low:high]
+
+    def distinct(self, op, value, limit):
+        """
+        Get the first entry of each distinct value matching a lookup, skipping the
+        other entries of a value with a binary search.
+
+        :param op: '=', '^=' (prefix), '<', '<=', '>', '>=' or '..' (inclusive range).
+        :param value: The value, or a (low, high) tuple for a range.
+        :param limit: The maximum number of entries.
+        :return: A list of (value, key) pairs, sorted by value.
+        """
+        low, high = self.__span(op, value)
+        entries = []
+        while low < high and len(entries) < limit:
+            entry = self.__entries[low]
+            entries.append(entry)
+            low = bisect_right(self.__entries, entry[0], low, high, key=lambda item: item[0])
+        return entries
+
+    def last(self, count):
+        """
+        Get the entries with the greatest values.
+
+        :param count: The maximum number of entries.
+        :return: A list of (value, key) pairs, the greatest value first.
+        """
+        return self.__entries[:-count - 1:-1] if count > 0 else []
+
+    def __span(self, op, value):
+        entries = self.__entries
+
+        def first(entry):
+            return entry[0]
+
+        if op == "=":
+            return (bisect_left(entries, value, key=first),
+                    bisect_right(entries, value, key=first))
+        if op == "^=":
+            if not value:
+                return 0, len(entries)
+            # The smallest string greater than all strings with the prefix
+            upper = value[:-1] + chr(ord(value[-1]) + 1)
+            return (bisect_left(entries, value, key=first),
+                    bisect_left(entries, upper, key=first))
+        if op == "<":
+            return 0, bisect_left(entries, value, key=first)
+        if op == "<=":
+            return 0, bisect_right(entries, value, key=first)
+        if op == ">":
+            return bisect_right(entries, value, key=first), len(entries)
+        if op == ">=":
+            return bisect_left(entries, value, key=first), len(entries)
+        if op == "..":
+            return (bisect_left(entries, value[0], key=first),
+                    bisect_right(entries, value[1], key=first))
+        raise ValueError(f"Unsupported lookup: {op}")
+
+
+class RecordIndexes:
+    """
+    The secondary indexes of a book, one SortedIndex per field.
+
+    An index is built from the data the first time its field is looked up and is
+    then maintained on every change. The values indexed for each key are kept,
+    so that a record changed in place can still be removed from the indexes.
+    """
+
+    def __init__(self, fields=None):
+        """
+        Initialize the RecordIndexes without any index built.
+
+        :param fields: A mapping of field names to functions giving the list of
+            values of a value in the book, FIELDS of contact records by default.
+        """
+        self.__fields = FIELDS if fields is None else fields
+        self.__indexes = {}
+        self.__values = {}
+
+    def index(self, field, data):
+        """
+        Get the index of a field, building it if needed.
+
+        :param field: One of the fields.
+        :param data: The mapping of keys to records to build the index from.
+        :return: The SortedIndex.
+        """
+        index = self.__indexes.get(field)
+        if index is None:
+            values_of = self.__fields[field]
+            values = {key: values_of(record) for key, record in data.items()}
+            index = SortedIndex((value, key) for key, key_values in values.items()
+                                for value in key_values)
+            self.__indexes[field] = index
+            self.__values[field] = values
+        return index
+
+    def update(self, key, record):
+        """
+        Reindex a key after its record was set or deleted.
+
+        :param key: The key of the record.
+        :param record: The new record, or None if it was deleted.
+        """
+        for field, index in self.__indexes.items():
+            values = self.__values[field]
+            for value in values.pop(key, ()):
+                index.remove(key, value)
+            if record is not None:
+                values[key] = self.__fields[field](record)
+                for value in values[key]:
+                    index.add(key, value)
+
+    def clear(self):
+        """
+        Drop all indexes, e.g. after the whole data was replaced.
+        """
+        self.__indexes = {}
+        self.__values = {}
+
+
+# The spellings address words are normalized to
+ABBREVIATIONS = {
+    "street": "st", "str": "st", "avenue": "ave", "av": "ave", "road": "rd",
+    "drive": "dr", "lane": "ln", "boulevard": "blvd", "square": "sq",
+    "place": "pl", "court": "ct", "highway": "hwy", "apartment": "apt",
+    "building": "bldg", "north": "n", "south": "s", "east": "e", "west": "w",
+}
+_ADDRESS_WORD = re.compile(r"[^\W_]+")
+
+
+def address_tokens(address):
+    """
+    Split an address into normalized words: lower-cased, without punctuation,
+    with the common abbreviations of street types and house numbers without
+    leading zeros.
+
+    :param address: The address text.
+    :return: A list of words.
+    """
+    tokens = []
+    for token in _ADDRESS_WORD.findall(address.lower()):
+        if token.isdigit():
+            token = token.lstrip("0") or "0"
+        tokens.append(ABBREVIATIONS.get(token, token))
+    return tokens
+
+
+def record_address_tokens(record):
+    """
+    Get the normalized words of the address of a record.
+
+    :param record: The contact record.
+    :return: A list of words, empty if the record has no address.
+    """
+    return address_tokens(record.address.value) if record.address else []
+
+
+class TokenIndex:
+    """
+    An inverted index of the words of a field: a set of keys per word.
+
+    A lookup intersects the sets of its words, the smallest first, so it costs
+    about the size of the rarest word's set. Like RecordIndexes, the index is
+    built on first use and then maintained on every change.
+    """
+
+    def __init__(self, tokens_of):
+        """
+        Initialize the TokenIndex without building it.
+
+        :param tokens_of: A function giving the words of a value of the book.
+        """
+        self.__tokens_of = tokens_of
+        self.__postings = None
+        self.__tokens = {}
+
+    def build(self, data):
+        """
+        Build the index if it was not built yet.
+
+        :param data: The mapping of keys to values to index.
+        """
+        if self.__postings is not None:
+            return
+        self.__postings = {}
+        for key, value in data.items():
+            self.__add(key, value)
+
+    def update(self, key, value):
+        """
+        Reindex a key after its value was set or deleted.
+
+        :param key: The key of the value.
+        :param value: The new value, or None if it was deleted.
+        """
+        if self.__postings is None:
+            return
+        for token in self.__tokens.pop(key, ()):
+            keys = self.__postings[token]
+            keys.discard(key)
+            if not keys:
+                del self.__postings[token]
+        if value is not None:
+            self.__add(key, value)
+
+    def clear(self):
+        """
+        Drop the index, e.g. after the whole data was replaced.
+        """
+        self.__postings = None
+        self.__tokens = {}
+
+    def keys(self, tokens):
+        """
+        Get the keys of the values that have all the words.
+
+        :param tokens: The normalized words.
+        :return: A set of keys.
+        """
+        postings = sorted((self.__postings.get(token, set()) for token in set(tokens)), key=len)
+        if not postings:
+            return set()
+        keys = set(postings[0])
+        for other in postings[1:]:
+            if not keys:
+                break
+            keys &= other
+        return keys
+
+    def __add(self, key, value):
+        tokens = set(self.__tokens_of(value))
+        for token in tokens:
+            self.__postings.setdefault(token, set()).add(key)
+        self.__tokens[key] = tuple(tokens)
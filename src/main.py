@@ -1,6 +1,6 @@
 """
 This module implements a cross-platform command-line interface (CLI) bot with
-support for command autocompletion.
+support for the autocompletion of commands and of their arguments.
 
 Modules:
 - constants: Contains messages and other constant values.
@@ -9,35 +9,69 @@ Modules:
 Usage:
 - Run the script and follow the prompts to execute commands.
 """
+import signal
+import sys
 from prompt_toolkit import PromptSession
-from prompt_toolkit.completion import WordCompleter
-from constants import Messages
+from prompt_toolkit.completion import ThreadedCompleter
+from completion import CommandCompleter
+from constants import Diagnostics, Messages, Persistence
 from parser import parse_input
 import command_registry as command_service
 
 
+def handle_signal(signum, frame):
+    # Leave the command loop so that pending changes are persisted on the way out
+    sys.exit(128 + signum)
+
+
 def main():
     print(Messages.Welcome)
 
+    for name in ("SIGTERM", "SIGHUP"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), handle_signal)
+
+    if Diagnostics.stats:
+        command_service.enable_metrics(Diagnostics.stats_file, Diagnostics.stats_interval)
+    if Diagnostics.profile_dir:
+        command_service.enable_profiling(
+            Diagnostics.profile_dir, Diagnostics.profile_commands, Diagnostics.profile_every,
+            Diagnostics.profile_cpu, Diagnostics.profile_memory)
+
+    if Persistence.change_log:
+        command_service.enable_change_log(Persistence.change_log)
+
     # Setup command executor and prompt session
     command_executor = command_service.create_command_executor()
-    completer = WordCompleter(command_service.get_commands(), ignore_case=True)
+    # Arguments are completed from the book indexes on a background thread
+    completer = ThreadedCompleter(CommandCompleter(
+        command_service.get_commands(), command_service.complete_argument))
     session = PromptSession(completer=completer)
 
     # Main command loop
-    while True:
-        user_input = session.prompt(Messages.EnterACommand)
-        if not user_input:
-            print(Messages.NoCommandEntered)
-            continue
-        command, *args = parse_input(user_input)
-        if command == "exit" or command == "close":
-            print(Messages.GoodBye)
-
-            break
-        # Execute the command and print the result
-        result = command_executor(command, *args)
-        print(result)
+    try:
+        while True:
+            reminders = command_service.birthday_reminders()
+            if reminders:
+                print(reminders)
+            try:
+                user_input = session.prompt(Messages.EnterACommand)
+            except (KeyboardInterrupt, EOFError):
+                print(Messages.GoodBye)
+                break
+            if not user_input:
+                print(Messages.NoCommandEntered)
+                continue
+            command, *args = parse_input(user_input)
+            if command == "exit" or command == "close":
+                print(Messages.GoodBye)
+
+                break
+            # Execute the command and print the result
+            result = command_executor(command, *args)
+            print(result)
+    finally:
+        command_service.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+"""
+This module estimates how much memory the books hold. A deep-size walk follows
+containers and object attributes from a root, counts every object once and keeps
+track of equal strings stored as separate objects and of memory-mapped files, which
+are not on the heap. Large books can be sampled instead of walked entirely.
+"""
+
+import mmap
+import random
+import sys
+import types
+from blob_storage import BlobStore, BlobText
+from models import Note, Record
+
+RECORD_FIELDS = ("name", "phones", "email", "address", "birthday")
+NOTE_FIELDS = ("key", "text", "create_date", "tags")
+# Shared by the whole process, not owned by the walked objects
+_SKIPPED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+            types.MethodType, BlobStore)
+
+
+class MemoryWalker:
+    """
+    Measures the deep size of objects. Objects reached from several roots are
+    counted for the first root only.
+    """
+
+    def __init__(self):
+        """
+        Initialize the MemoryWalker.
+        """
+        self.__seen = set()
+        self.__strings = {}
+        self.duplicated_strings = 0
+        self.mapped = 0
+
+    def size(self, root):
+        """
+        Get the size of an object and of everything it references that was not
+        measured yet.
+
+        :param root: The object to measure.
+        :return: The size in bytes.
+        """
+        total = 0
+        stack = [root]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in self.__seen or isinstance(obj, _SKIPPED):
+                continue
+            self.__seen.add(id(obj))
+            total += sys.getsizeof(obj)
+            if isinstance(obj, str):
+                self.__count_string(obj)
+            elif isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                stack.extend(obj)
+            elif isinstance(obj, mmap.mmap):
+                self.mapped += len(obj) if not obj.closed else 0
+            elif isinstance(obj, BlobText):
+                # The text itself stays in the mapped blob file
+                continue
+            else:
+                if hasattr(obj, "__dict__"):
+                    stack.append(obj.__dict__)
+                for cls in type(obj).__mro__:
+                    for slot in getattr(cls, "__slots__", ()):
+                        if hasattr(obj, slot):
+                            stack.append(getattr(obj, slot))
+        return total
+
+    def __count_string(self, text):
+        first = self.__strings.setdefault(text, id(text))
+        if first != id(text):
+            self.duplicated_strings += sys.getsizeof(text)
+
+
+def book_memory(book, sample=None):
+    """
+    Estimate the memory held by a book.
+
+    :param book: An AddressBook or a NotesBook.
+    :param sample: The number of values to walk, or None to walk all of them. The
+        sizes of the values are extrapolated from the sample.
+    :return: A dict with the total size, the number of values and of those held
+        in memory (the rest stays in a mapped file), the size of each
+        field type, the size of the duplicated strings, of the indexes and caches
+        held by the book and of the memory-mapped files, all in bytes.
+    """
+    walker = MemoryWalker()
+    data = book.data
+    resident = data.resident() if hasattr(data, "resident") else data
+    values = list(resident.values())
+    scale = 1.0
+    if sample is not None and len(values) > sample:
+        values = random.sample(values, sample)
+        scale = len(resident) / sample
+
+    fields = {}
+    for value in values:
+        if isinstance(value, Record):
+            names = RECORD_FIELDS
+        elif isinstance(value, Note):
+            names = NOTE_FIELDS
+        else:
+            names = ()
+        for name in names:
+            fields[name] = fields.get(name, 0) + walker.size(getattr(value, "_" + name))
+    values_size = sum(walker.size(value) for value in values) + sum(fields.values())
+    fields = {name: int(size * scale) for name, size in fields.items()}
+    duplicated = int(walker.duplicated_strings * scale)
+
+    # The containers of the data, without the values walked above
+    containers = 0
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            containers += sys.getsizeof(obj) + sum(walker.size(key) for key in obj)
+        elif isinstance(obj, (set, frozenset)):
+            containers += walker.size(obj)
+        elif hasattr(obj, "__dict__"):
+            containers += sys.getsizeof(obj)
+            stack.extend(obj.__dict__.values())
+        elif isinstance(obj, mmap.mmap):
+            walker.size(obj)
+
+    # Everything else the book holds: indexes, caches and bookkeeping
+    extras = {key: value for key, value in vars(book).items()
+              if key not in ("data", "_Book__saver", "_lock", "_latest", "_feed")}
+    indexes = walker.size(extras)
+
+    total = containers + int(values_size * scale)
+    return {
+        "total": total,
+        "values": len(data),
+        "resident": len(resident),
+        "per_value": total // len(resident) if resident else 0,
+        "fields": fields,
+        "duplicated_strings": duplicated,
+        "indexes": indexes,
+        "mapped": walker.mapped,
+    }
+
+
+def format_size(size):
+    """
+    Format a number of bytes for humans.
+
+    :param size: The number of bytes.
+    :return: A string such as '1.5 MiB'.
+    """
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def memory_report(books, sample=None):
+    """
+    Get a human readable memory report of several books.
+
+    :param books: A dict of names to books.
+    :param sample: The number of values to walk per book, or None for all.
+    :return: A string with the memory use of each book.
+    """
+    lines = []
+    for name, book in books.items():
+        stats = book_memory(book, sample)
+        lines.append(f"{name}: {format_size(stats['total'])} for {stats['resident']} of "
+                     f"{stats['values']} values in memory "
+                     f"({format_size(stats['per_value'])} each)")
+        for field, size in sorted(stats["fields"].items(), key=lambda item: -item[1]):
+            lines.append(f"  {field}: {format_size(size)}")
+        lines.append(f"  duplicated strings: {format_size(stats['duplicated_strings'])}")
+        lines.append(f"  indexes and caches: {format_size(stats['indexes'])}")
+        if stats["mapped"]:
+            lines.append(f"  mapped files: {format_size(stats['mapped'])}")
+    return "\n".join(lines)
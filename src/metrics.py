@@ -0,0 +1,351 @@
+"""
+This module provides the instrumentation of the command executor: per-command call
+counts and latency histograms, the time spent in validation, in the repositories and
+in saving, and the number of bytes written by the savers.
+
+The executor only pays for it when it is enabled: the validator, the books and their
+savers are then wrapped in proxies that time every call, otherwise nothing changes.
+"""
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+PHASES = ("validation", "repository", "save")
+
+
+class Histogram:
+    """
+    A log-linear latency histogram. Buckets grow by 10%, so the reported
+    percentiles are within 5% of the exact values.
+    """
+
+    GROWTH = 1.1
+    MIN_VALUE = 1e-6
+
+    def __init__(self):
+        """
+        Initialize an empty Histogram.
+        """
+        self.__buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        """
+        Add a value to the histogram.
+
+        :param value: The value, e.g. a duration in seconds.
+        """
+        bucket = 0
+        if value > self.MIN_VALUE:
+            bucket = int(math.log(value / self.MIN_VALUE, self.GROWTH)) + 1
+        self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """
+        Add the values recorded by another histogram, e.g. from another process.
+
+        :param other: The other Histogram.
+        """
+        for bucket, count in other.__buckets.items():
+            self.__buckets[bucket] = self.__buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        Get an approximate percentile of the recorded values.
+
+        :param percent: The percentile, from 0 to 100.
+        :return: The value below which the given percent of values fall.
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.__buckets):
+            seen += self.__buckets[bucket]
+            if seen >= rank:
+                if bucket == 0:
+                    return self.MIN_VALUE
+                # The middle of the bucket
+                return min(self.max, self.MIN_VALUE * self.GROWTH ** (bucket - 0.5))
+        return self.max
+
+    def to_dict(self):
+        """
+        Get a summary of the histogram.
+
+        :return: A dict with the count, mean, max and main percentiles.
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class CommandStats:
+    """
+    The statistics of a single command.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty CommandStats.
+        """
+        self.latency = Histogram()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.bytes_written = 0
+        self.errors = 0
+
+    def to_dict(self):
+        """
+        Get the statistics as a dict.
+
+        :return: A dict with the latency summary, phase times and bytes written.
+        """
+        result = self.latency.to_dict()
+        result["phases"] = dict(self.phases)
+        result["bytes_written"] = self.bytes_written
+        result["errors"] = self.errors
+        return result
+
+
+class Metrics:
+    """
+    Collects the statistics of the commands run by the executor.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty Metrics.
+        """
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__commands = {}
+        self.__saves = Histogram()
+        self.__save_bytes = 0
+        self.__started = time.time()
+        self.__dumper = None
+        self.__dump_path = None
+        self.__stop = threading.Event()
+
+    @contextmanager
+    def command(self, name):
+        """
+        Time a command. Phases entered meanwhile on the same thread are
+        attributed to it.
+
+        :param name: The name of the command.
+        """
+        frame = [None, time.perf_counter(), 0.0, dict.fromkeys(PHASES, 0.0), 0]
+        self.__local.command = frame
+        self.__local.stack = []
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            elapsed = time.perf_counter() - frame[1]
+            self.__local.command = None
+            with self.__lock:
+                stats = self.__commands.setdefault(name, CommandStats())
+                stats.latency.record(elapsed)
+                for phase, spent in frame[3].items():
+                    stats.phases[phase] += spent
+                stats.bytes_written += frame[4]
+                stats.errors += failed
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase of the current command. Time spent in nested phases is only
+        counted for the innermost one.
+
+        :param name: One of PHASES.
+        """
+        stack = getattr(self.__local, "stack", None)
+        if stack is None:
+            stack = self.__local.stack = []
+        frame = [name, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            if stack:
+                stack[-1][2] += elapsed
+            command = getattr(self.__local, "command", None)
+            if command is not None:
+                command[3][name] += elapsed - frame[2]
+
+    def record_save(self, seconds, written):
+        """
+        Record a save made by a saver.
+
+        :param seconds: The duration of the save.
+        :param written: The number of bytes written.
+        """
+        with self.__lock:
+            self.__saves.record(seconds)
+            self.__save_bytes += written
+        command = getattr(self.__local, "command", None)
+        if command is not None:
+            command[4] += written
+
+    def to_dict(self):
+        """
+        Get all statistics as a dict.
+
+        :return: A dict with the statistics of every command and of saving.
+        """
+        with self.__lock:
+            return {
+                "uptime": time.time() - self.__started,
+                "commands": {name: stats.to_dict()
+                             for name, stats in sorted(self.__commands.items())},
+                "saves": dict(self.__saves.to_dict(), bytes_written=self.__save_bytes),
+            }
+
+    def report(self):
+        """
+        Get a human readable report of the statistics.
+
+        :return: A string with a line per command and a line for saving.
+        """
+        stats = self.to_dict()
+        lines = [f"{'command':24} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                 f"{'valid ms':>9} {'repo ms':>9} {'save ms':>9} {'bytes':>10}"]
+        for name, command in stats["commands"].items():
+            phases = command["phases"]
+            lines.append(
+                f"{name:24} {command['count']:>6} {command['p50'] * 1000:>8.2f} "
+                f"{command['p95'] * 1000:>8.2f} {command['p99'] * 1000:>8.2f} "
+                f"{phases['validation'] * 1000:>9.2f} {phases['repository'] * 1000:>9.2f} "
+                f"{phases['save'] * 1000:>9.2f} {command['bytes_written']:>10}")
+        saves = stats["saves"]
+        lines.append(f"saves: {saves['count']}, p95 {saves['p95'] * 1000:.2f} ms, "
+                     f"{saves['bytes_written']} bytes written")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """
+        Write the statistics to a JSON file.
+
+        :param path: The path to the file.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def start_dumping(self, path, interval):
+        """
+        Dump the statistics to a file periodically in a background thread.
+
+        :param path: The path to the file.
+        :param interval: The number of seconds between dumps.
+        """
+        def run():
+            while not self.__stop.wait(interval):
+                self.dump(path)
+        self.__dump_path = path
+        self.__dumper = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        self.__dumper.start()
+
+    def stop_dumping(self):
+        """
+        Stop the periodic dumps and write the final statistics.
+        """
+        self.__stop.set()
+        if self.__dumper is not None:
+            self.__dumper.join()
+            self.__dumper = None
+            self.dump(self.__dump_path)
+
+
+class TimedProxy:
+    """
+    A proxy timing every method call of the wrapped object as a phase.
+    """
+
+    def __init__(self, target, metrics, phase):
+        """
+        Initialize the TimedProxy.
+
+        :param target: The wrapped object.
+        :param metrics: The Metrics to record to.
+        :param phase: The phase the calls are attributed to.
+        """
+        self.__dict__["target"] = target
+        self.__dict__["_metrics"] = metrics
+        self.__dict__["_phase"] = phase
+
+    def __getattr__(self, name):
+        value = getattr(self.target, name)
+        if not callable(value):
+            return value
+        metrics, phase = self._metrics, self._phase
+
+        def timed(*args, **kwargs):
+            with metrics.phase(phase):
+                return value(*args, **kwargs)
+        return timed
+
+    def __setattr__(self, name, value):
+        setattr(self.target, name, value)
+
+    def __contains__(self, key):
+        return key in self.target
+
+    def __iter__(self):
+        return iter(self.target)
+
+    def __len__(self):
+        return len(self.target)
+
+    def __getitem__(self, key):
+        return self.target[key]
+
+
+class TimedSaver(TimedProxy):
+    """
+    A proxy of a Saver that records every save with the bytes it wrote.
+    """
+
+    def __init__(self, target, metrics):
+        """
+        Initialize the TimedSaver.
+
+        :param target: The wrapped Saver.
+        :param metrics: The Metrics to record to.
+        """
+        super().__init__(target, metrics, "save")
+
+    def save(self, data):
+        self.__timed(self.target.save, data)
+
+    def save_change(self, data, key):
+        self.__timed(self.target.save_change, data, key)
+
+    def save_changes(self, data, keys):
+        self.__timed(self.target.save_changes, data, keys)
+
+    def __timed(self, save, *args):
+        written = self.target.bytes_written
+        start = time.perf_counter()
+        with self._metrics.phase("save"):
+            save(*args)
+        self._metrics.record_save(time.perf_counter() - start,
+                                  self.target.bytes_written - written)
@@ -4,6 +4,8 @@ It includes `Note` and `Record` classes to handle data, as well as
 supporting field classes like `Field`, `NameField`, `PhoneField`,
 `AddressField`, `EmailField`, and `BirthdayField`
 """
+import copy
+from blob_storage import BlobText
 
 
 class Note:
@@ -22,6 +24,7 @@ class Note:
         self._key = key
         self._text = text
         self._create_date = create_date
+        self._modify_date = create_date
         self._tags = []
 
     def __str__(self):
@@ -31,11 +34,19 @@ class Note:
         :return: A string representing the note.
         """
         str = f"Key: {self._key}  Text: {
-            self._text}  Created: {self._create_date}"
+            self.text}  Created: {self._create_date}"
         if len(self._tags) > 0:
             str += f"\nTags: {','.join(self._tags)}"
         return str
 
+    def copy(self):
+        """
+        Return a copy of the note that can be changed without affecting this one.
+
+        :return: A new Note with the same content.
+        """
+        return copy.deepcopy(self)
+
     @property
     def key(self):
         """
@@ -54,13 +65,43 @@ class Note:
         """
         self._key = key
 
+    @property
+    def create_date(self):
+        """
+        Get the date when the note was created.
+
+        :return: The creation date.
+        """
+        return self._create_date
+
+    @property
+    def modify_date(self):
+        """
+        Get the date when the note was last changed. Notes saved before it was
+        tracked were last changed when they were created.
+
+        :return: The last modification date.
+        """
+        return getattr(self, "_modify_date", self._create_date)
+
+    @modify_date.setter
+    def modify_date(self, modify_date):
+        """
+        Set the date when the note was last changed.
+
+        :param modify_date: The last modification date.
+        """
+        self._modify_date = modify_date
+
     @property
     def text(self):
         """
-        Get the text of the note.
+        Get the text of the note. A text kept in a blob store is read on every access.
 
         :return: The text of the note.
         """
+        if isinstance(self._text, BlobText):
+            return self._text.read()
         return self._text
 
     @text.setter
@@ -165,6 +206,14 @@ class Record:
 
         return str.strip()
 
+    def copy(self):
+        """
+        Return a copy of the record that can be changed without affecting this one.
+
+        :return: A new Record with the same content.
+        """
+        return copy.deepcopy(self)
+
     @property
     def name(self):
         """
@@ -0,0 +1,119 @@
+"""
+This module provides opt-in profiling of the commands run by the executor. Selected
+commands, or every Nth call of them, run under cProfile and/or tracemalloc, and a
+report is written to a directory for each profiled call:
+
+- `<command>-<call>.prof`: the cProfile statistics, readable with `pstats`;
+- `<command>-<call>.txt`: the hottest functions and the top allocation sites.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+
+class Profiler:
+    """
+    Profiles the selected calls of commands and writes the reports to a directory.
+    """
+
+    def __init__(self, directory, commands=(), every=1, cpu=True, memory=False):
+        """
+        Initialize the Profiler.
+
+        :param directory: The directory for the reports. It is created if missing.
+        :param commands: The names of the commands to profile, all if empty.
+        :param every: Profile every Nth call of each selected command.
+        :param cpu: Whether to run the calls under cProfile.
+        :param memory: Whether to trace the allocations with tracemalloc.
+        """
+        self.__directory = directory
+        self.__commands = {command.lower() for command in commands}
+        self.__every = max(1, every)
+        self.__cpu = cpu
+        self.__memory = memory
+        self.__calls = {}
+        self.__profiled = 0
+        self.__lock = threading.Lock()
+        self.__session = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        """
+        Get the directory the reports are written to.
+
+        :return: The path to the directory.
+        """
+        return self.__directory
+
+    def selects(self, name):
+        """
+        Count a call of a command and tell whether it is to be profiled.
+
+        :param name: The name of the command.
+        :return: True if the call is to be profiled.
+        """
+        if self.__commands and name not in self.__commands:
+            return False
+        with self.__lock:
+            calls = self.__calls[name] = self.__calls.get(name, 0) + 1
+        return calls % self.__every == 0
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Profile the enclosed call of a command and write its report. Only one
+        call is profiled at a time; concurrent calls run unprofiled.
+
+        :param name: The name of the command.
+        """
+        if not self.__session.acquire(blocking=False):
+            yield
+            return
+        try:
+            with self.__lock:
+                self.__profiled += 1
+                call = self.__profiled
+            profiler = cProfile.Profile() if self.__cpu else None
+            started_tracing = False
+            before = None
+            if self.__memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    started_tracing = True
+                before = tracemalloc.take_snapshot()
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                after = tracemalloc.take_snapshot() if before is not None else None
+                if started_tracing:
+                    tracemalloc.stop()
+                self.__write_report(f"{name}-{call:05d}", profiler, before, after)
+        finally:
+            self.__session.release()
+
+    def __write_report(self, base_name, profiler, before, after):
+        base_path = os.path.join(self.__directory, base_name)
+        report = io.StringIO()
+        if profiler is not None:
+            profiler.dump_stats(base_path + ".prof")
+            stats = pstats.Stats(profiler, stream=report)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        if after is not None:
+            report.write("Top allocation sites:\n")
+            for difference in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+                report.write(f"{difference}\n")
+        with open(base_path + ".txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
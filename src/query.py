@@ -0,0 +1,299 @@
+"""
+This module implements a small query language over the fields of contact records
+and an index-aware planner for it.
+
+A query is made of terms combined with AND, OR, NOT and parentheses; adjacent
+terms are joined with AND. A term is `field op value`:
+
+- fields: name, phone, email, domain (the part of the email after @), address,
+  birthday (DD.MM.YYYY or YYYY-MM-DD) and month (1-12 or a month name);
+- operators: `=`, `!=`, `^=` (starts with), `~=` (contains), `<`, `<=`, `>`, `>=`,
+  and `=low..high` for an inclusive range. Texts compare case-insensitively and
+  values with spaces go in double quotes.
+
+Example:
+    domain=example.com AND month=mar AND phone^=+38067
+    (name^=an OR address~="main st") AND NOT birthday<1990-01-01
+
+The planner asks every indexable term how many keys its index lookup yields and
+only reads the keys of the most selective one under an AND; the remaining terms
+are checked on those records only. Without an applicable index it falls back to
+a full scan.
+"""
+
+import re
+from indexes import FIELDS, field_values, normalize
+
+ALIASES = {"email.domain": "domain", "birthday.month": "month"}
+INDEXED_OPERATORS = ("=", "^=", "<", "<=", ">", ">=", "..")
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<paren>[()])
+  | (?P<field>[A-Za-z_.]+)\s*(?P<op>!=|\^=|~=|<=|>=|=|<|>)\s*
+    (?P<value>"(?:[^"\\]|\\.)*"|[^\s()"]+)
+  | (?P<word>[^\s()]+)
+)""", re.VERBOSE)
+
+
+class QuerySyntaxError(ValueError):
+    """
+    Raised when a query cannot be parsed.
+    """
+
+
+class Term:
+    """
+    A condition on a single field.
+    """
+
+    def __init__(self, field, op, value):
+        """
+        Initialize the Term.
+
+        :param field: One of indexes.FIELDS.
+        :param op: The operator.
+        :param value: The normalized value, or a (low, high) tuple for '..'.
+        """
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def matches(self, record):
+        """
+        Check whether a record satisfies the term.
+
+        :param record: The contact record.
+        :return: True if any value of the field satisfies it.
+        """
+        values = field_values(record, self.field)
+        if self.op == "!=":
+            return self.value not in values
+        return any(self.__compare(value) for value in values)
+
+    def estimate(self, index_of):
+        """
+        Get the number of keys an index lookup for the term yields.
+
+        :param index_of: A function giving the SortedIndex of a field.
+        :return: The number of keys, or None if no index applies.
+        """
+        if self.op not in INDEXED_OPERATORS:
+            return None
+        if self.op == "^=" and not isinstance(self.value, str):
+            return None
+        return index_of(self.field).count(self.op, self.value)
+
+    def candidates(self, index_of):
+        """
+        Get the keys of the records that may satisfy the term.
+
+        :param index_of: A function giving the SortedIndex of a field.
+        :return: A set of keys, or None if all records have to be checked.
+        """
+        if self.estimate(index_of) is None:
+            return None
+        return index_of(self.field).keys(self.op, self.value)
+
+    def __compare(self, value):
+        op, expected = self.op, self.value
+        if op == "=":
+            return value == expected
+        if op == "^=":
+            return isinstance(value, str) and value.startswith(expected)
+        if op == "~=":
+            return isinstance(value, str) and expected in value
+        if op == "<":
+            return value < expected
+        if op == "<=":
+            return value <= expected
+        if op == ">":
+            return value > expected
+        if op == ">=":
+            return value >= expected
+        return expected[0] <= value <= expected[1]
+
+    def __repr__(self):
+        return f"Term({self.field!r}, {self.op!r}, {self.value!r})"
+
+
+class And:
+    """
+    A conjunction of conditions.
+    """
+
+    def __init__(self, children):
+        self.children = children
+
+    def matches(self, record):
+        return all(child.matches(record) for child in self.children)
+
+    def estimate(self, index_of):
+        estimates = [child.estimate(index_of) for child in self.children]
+        estimates = [estimate for estimate in estimates if estimate is not None]
+        return min(estimates) if estimates else None
+
+    def candidates(self, index_of):
+        # Only the most selective child is read from its index
+        best, best_estimate = None, None
+        for child in self.children:
+            estimate = child.estimate(index_of)
+            if estimate is not None and (best_estimate is None or estimate < best_estimate):
+                best, best_estimate = child, estimate
+        return best.candidates(index_of) if best is not None else None
+
+
+class Or:
+    """
+    A disjunction of conditions.
+    """
+
+    def __init__(self, children):
+        self.children = children
+
+    def matches(self, record):
+        return any(child.matches(record) for child in self.children)
+
+    def estimate(self, index_of):
+        estimates = [child.estimate(index_of) for child in self.children]
+        if any(estimate is None for estimate in estimates):
+            return None
+        return sum(estimates)
+
+    def candidates(self, index_of):
+        keys = set()
+        for child in self.children:
+            child_keys = child.candidates(index_of)
+            if child_keys is None:
+                return None
+            keys |= child_keys
+        return keys
+
+
+class Not:
+    """
+    A negated condition.
+    """
+
+    def __init__(self, child):
+        self.child = child
+
+    def matches(self, record):
+        return not self.child.matches(record)
+
+    def estimate(self, index_of):
+        return None
+
+    def candidates(self, index_of):
+        return None
+
+
+def parse(text):
+    """
+    Parse a query.
+
+    :param text: The query text.
+    :return: The root condition: a Term, And, Or or Not.
+    :raise QuerySyntaxError: If the query is not valid.
+    """
+    tokens = _tokenize(text)
+    if not tokens:
+        raise QuerySyntaxError("Empty query")
+    parser = _Parser(tokens)
+    node = parser.parse_or()
+    if parser.peek() is not None:
+        raise QuerySyntaxError(f"Unexpected {parser.peek()[1]!r}")
+    return node
+
+
+def plan(query, index_of):
+    """
+    Get the keys of the records that have to be checked against a query.
+
+    :param query: The parsed query.
+    :param index_of: A function giving the SortedIndex of a field.
+    :return: A set of keys that includes all matching records, or None if there is
+        no applicable index and every record has to be checked.
+    """
+    return query.candidates(index_of)
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise QuerySyntaxError(f"Unexpected {text[position:]!r}")
+        position = match.end()
+        if match.group("paren"):
+            tokens.append(("paren", match.group("paren")))
+        elif match.group("field"):
+            tokens.append(("term", _term(match)))
+        else:
+            word = match.group("word").upper()
+            if word not in ("AND", "OR", "NOT"):
+                raise QuerySyntaxError(f"Expected field, operator and value at {match.group('word')!r}")
+            tokens.append(("word", word))
+    return tokens
+
+
+def _term(match):
+    field = match.group("field").lower()
+    field = ALIASES.get(field, field)
+    if field not in FIELDS:
+        raise QuerySyntaxError(f"Unknown field {field!r}, use one of: {', '.join(FIELDS)}")
+    op, value = match.group("op"), match.group("value")
+    if value.startswith('"'):
+        value = re.sub(r"\\(.)", r"\1", value[1:-1])
+    try:
+        if op == "=" and ".." in value:
+            low, high = value.split("..", 1)
+            return Term(field, "..", (normalize(field, low), normalize(field, high)))
+        return Term(field, op, normalize(field, value))
+    except ValueError as error:
+        raise QuerySyntaxError(str(error)) from error
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError("Unexpected end of query")
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == ("word", "OR"):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() is not None and self.peek() not in (("word", "OR"), ("paren", ")")):
+            if self.peek() == ("word", "AND"):
+                self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.peek() == ("word", "NOT"):
+            self.take()
+            return Not(self.parse_not())
+        kind, value = self.take()
+        if kind == "term":
+            return value
+        if (kind, value) == ("paren", "("):
+            node = self.parse_or()
+            if self.take() != ("paren", ")"):
+                raise QuerySyntaxError("Missing ')'")
+            return node
+        raise QuerySyntaxError(f"Unexpected {value!r}")
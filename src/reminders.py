@@ -0,0 +1,150 @@
+"""
+This module provides a scheduler of birthday reminders. It keeps the next birthday
+of every contact in a min-heap, so that finding the due birthdays only looks at
+the top of the heap, and a changed or deleted birthday costs a push instead of a
+rebuild.
+"""
+
+import heapq
+from datetime import date, timedelta
+
+
+def next_occurrence(birthday, after):
+    """
+    Get the next date a birthday is celebrated on.
+
+    :param birthday: The birthday as DD.MM.YYYY.
+    :param after: The first date that may be returned.
+    :return: The date, or None if the birthday is not valid. Birthdays on the 29th
+        of February are celebrated on the 28th in common years.
+    """
+    try:
+        day, month = int(birthday[:2]), int(birthday[3:5])
+        for year in (after.year, after.year + 1):
+            try:
+                occurrence = date(year, month, day)
+            except ValueError:
+                if (month, day) != (2, 29):
+                    raise
+                occurrence = date(year, 2, 28)
+            if occurrence >= after:
+                return occurrence
+    except ValueError:
+        return None
+
+
+class BirthdayScheduler:
+    """
+    A min-heap of the next birthday of each contact.
+
+    Changed and deleted birthdays are not removed from the heap: the current date
+    of each key is kept aside and the heap entries that do not match it anymore
+    are dropped when they reach the top. Like the other indexes of the books, the
+    heap is built from the data on first use and then maintained on every change.
+    """
+
+    def __init__(self):
+        """
+        Initialize the BirthdayScheduler without building it.
+        """
+        self.__heap = []
+        self.__next = {}
+        self.__birthdays = {}
+        self.__built_on = None
+
+    def __len__(self):
+        return len(self.__next)
+
+    def build(self, data, today):
+        """
+        Build the heap if it was not built yet.
+
+        :param data: The mapping of keys to records to build the heap from.
+        :param today: The date the next birthdays are counted from.
+        """
+        if self.__built_on is not None:
+            return
+        self.__built_on = today
+        for key, record in data.items():
+            self.__schedule(key, record)
+        self.__heap = [(occurrence, key) for key, occurrence in self.__next.items()]
+        heapq.heapify(self.__heap)
+
+    def update(self, key, record):
+        """
+        Reschedule a key after its record was set or deleted.
+
+        :param key: The key of the record.
+        :param record: The new record, or None if it was deleted.
+        """
+        if self.__built_on is None:
+            return
+        birthday = record.birthday.value if record is not None and record.birthday else None
+        if birthday == self.__birthdays.get(key):
+            return
+        self.__next.pop(key, None)
+        self.__birthdays.pop(key, None)
+        if self.__schedule(key, record):
+            heapq.heappush(self.__heap, (self.__next[key], key))
+        if len(self.__heap) > 2 * len(self.__next) + 16:
+            self.__heap = [(occurrence, key) for key, occurrence in self.__next.items()]
+            heapq.heapify(self.__heap)
+
+    def clear(self):
+        """
+        Drop the heap, e.g. after the whole data was replaced.
+        """
+        self.__heap = []
+        self.__next = {}
+        self.__birthdays = {}
+        self.__built_on = None
+
+    def peek(self):
+        """
+        Get the nearest scheduled birthday.
+
+        :return: A (date, key) pair, or None if no birthday is scheduled.
+        """
+        self.__drop_stale()
+        return self.__heap[0] if self.__heap else None
+
+    def due(self, today, days=0):
+        """
+        Take the birthdays falling within a number of days. Each of them is
+        rolled forward to its next year, so that it is reported only once, and the
+        birthdays that passed unreported are rolled forward silently.
+
+        :param today: The current date.
+        :param days: How many days ahead a birthday is due.
+        :return: A list of (date, key) pairs, the nearest first.
+        """
+        due = []
+        if self.__built_on is None:
+            return due
+        self.__built_on = max(self.__built_on, today)
+        while True:
+            self.__drop_stale()
+            if not self.__heap or (self.__heap[0][0] - today).days > days:
+                return due
+            occurrence, key = heapq.heappop(self.__heap)
+            if occurrence >= today:
+                due.append((occurrence, key))
+                following = next_occurrence(self.__birthdays[key], occurrence + timedelta(days=1))
+            else:
+                following = next_occurrence(self.__birthdays[key], today)
+            self.__next[key] = following
+            heapq.heappush(self.__heap, (following, key))
+
+    def __drop_stale(self):
+        heap = self.__heap
+        while heap and self.__next.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def __schedule(self, key, record):
+        birthday = record.birthday if record is not None else None
+        occurrence = next_occurrence(birthday.value, self.__built_on) if birthday else None
+        if occurrence is None:
+            return False
+        self.__next[key] = occurrence
+        self.__birthdays[key] = birthday.value
+        return True
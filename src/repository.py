@@ -1,14 +1,30 @@
 """
 This module provides classes for saving, updating, and managing records in files.
-It includes `Saver`, `AddressBook`, and `NotesBook` classes for handling persistent
-storage and retrieval of address book and note data.
+It includes `Saver`, `WriteBehindSaver`, `AddressBook`, and `NotesBook` classes for
+handling persistent storage and retrieval of address book and note data.
 """
 
 from collections import UserDict
+from collections.abc import ItemsView, Mapping, ValuesView
+import itertools
+import os
 import pickle
+import threading
+import time
+import weakref
 from datetime import datetime, timedelta
+from aggregates import CONTACT_AGGREGATES, NOTE_AGGREGATES, Aggregates
+from compression import reader, writer
+from change_feed import ChangeFeed, note_fields, record_fields
+from dedupe import find_clusters, merge
+from indexes import (FIELDS, NOTE_DATES, NOTE_KEYS, RecordIndexes, TokenIndex, address_tokens,
+                     normalize, record_address_tokens, record_matches)
 from models import Note
-from constants import Messages
+from constants import Caching, Messages, Persistence
+from query import parse, plan
+from reminders import BirthdayScheduler
+from sync import MerkleTree
+from text_search import TextIndex
 
 
 class Saver:
@@ -16,13 +32,43 @@ class Saver:
     Class responsible for saving and loading data to and from a file using pickle.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, compression=None):
         """
         Initialize the Saver with a file path.
 
         :param path: The path to the file where data will be saved and loaded.
+        :param compression: None, 'gzip' or 'lzma' to compress the saved data.
+            Compressed files are recognized on load whatever this setting is.
         """
         self.__file_name = path
+        self.__compression = compression
+        self.__bytes_written = 0
+
+    @property
+    def compression(self):
+        """
+        Get the compression used for the saved data.
+
+        :return: None, 'gzip' or 'lzma'.
+        """
+        return self.__compression
+
+    @property
+    def bytes_written(self):
+        """
+        Get the number of bytes written by the Saver so far.
+
+        :return: The number of bytes.
+        """
+        return self.__bytes_written
+
+    def _count_written(self, count):
+        """
+        Add to the number of bytes written by the Saver.
+
+        :param count: The number of bytes just written.
+        """
+        self.__bytes_written += count
 
     def save(self, data):
         """
@@ -30,8 +76,12 @@ class Saver:
 
         :param data: The data to be saved.
         """
+        if isinstance(data, Snapshot):
+            data = data._data
         with open(self.__file_name, "wb") as f:
-            pickle.dump(data, f)
+            with writer(f, self.__compression) as stream:
+                pickle.dump(data, stream)
+            self._count_written(f.tell())
 
     def load(self) -> list:
         """
@@ -40,33 +90,786 @@ class Saver:
         :return: The loaded data or an empty list if the file does not exist.
         """
         try:
-            with open(self.__file_name, "rb") as f:
-                return pickle.load(f)
+            f = open(self.__file_name, "rb")
         except OSError:
             return {}
+        with f, reader(f) as stream:
+            return pickle.load(stream)
+
+    def save_change(self, data, key):
+        """
+        Save the data after the value under the key was set or deleted. Savers that
+        can write a single change override it, by default the whole data is saved.
+
+        :param data: The data to be saved.
+        :param key: The key of the changed value.
+        """
+        self.save(data)
+
+    def save_changes(self, data, keys):
+        """
+        Save the data after the values under several keys were set or deleted at
+        once. By default the whole data is saved a single time.
+
+        :param data: The data to be saved.
+        :param keys: The keys of the changed values.
+        """
+        self.save(data)
+
+    def refresh(self):
+        """
+        Get the changes written to the file by other processes since the last load
+        or refresh.
+
+        :return: None if nothing changed, otherwise a tuple of the new full data
+            (or None if only some values changed) and a list of changed
+            (key, value) pairs, where value is None for deleted keys.
+        """
+        return None
 
+    @property
+    def pending(self):
+        """
+        Get the number of changes that are not written to the file yet.
+
+        :return: The number of unsaved changes.
+        """
+        return 0
+
+    def flush(self):
+        """
+        Write all pending changes to the file.
+        """
+
+    def close(self):
+        """
+        Write all pending changes and release the resources held by the Saver.
+        """
+        self.flush()
 
-class AddressBook(UserDict):
+
+class WriteBehindSaver(Saver):
     """
-    A class that manages contact records in an address book and persists them using a Saver.
+    A Saver that writes the data in a background thread.
+
+    A save only marks the data dirty. Bursts of changes are coalesced into a single
+    write of the latest data once `delay` seconds passed since the first unsaved
+    change, or as soon as `max_pending` changes are waiting. The snapshot of a
+    book is not kept until then, as the book copies its storage on write while
+    one is alive; a snapshot of the latest version is taken for the write. The
+    write does not hold the lock of the book: stored values are only replaced,
+    never changed in place (see `Book._checkout`), so it never sees an edit
+    half-made.
+    """
+
+    def __init__(self, path, delay=1.0, max_pending=100, compression=None):
+        """
+        Initialize the WriteBehindSaver with a file path and coalescing limits.
+
+        :param path: The path to the file where data will be saved and loaded.
+        :param delay: The maximum age in seconds of an unsaved change.
+        :param max_pending: The number of unsaved changes that triggers a write at once.
+        :param compression: None, 'gzip' or 'lzma' to compress the saved data.
+        """
+        super().__init__(path, compression)
+        self.__delay = delay
+        self.__max_pending = max_pending
+        self.__condition = threading.Condition()
+        self.__data = None
+        self.__pending = 0
+        self.__dirty_since = None
+        self.__writing = False
+        self.__closed = False
+        self.__thread = None
+
+    @property
+    def pending(self):
+        """
+        Get the number of changes that are not written to the file yet.
+
+        :return: The number of unsaved changes.
+        """
+        return self.__pending
+
+    @property
+    def pending_age(self):
+        """
+        Get the age of the oldest unsaved change.
+
+        :return: The age in seconds, or 0 if there is nothing to save.
+        """
+        dirty_since = self.__dirty_since
+        return time.monotonic() - dirty_since if dirty_since is not None else 0
+
+    def save(self, data):
+        """
+        Mark the data dirty. It is written by the background thread later.
+
+        :param data: The data to be saved.
+        """
+        with self.__condition:
+            if self.__closed:
+                raise ValueError("Saver is closed")
+            if self.__pending == 0:
+                self.__dirty_since = time.monotonic()
+            if isinstance(data, Snapshot) and data._latest is not None:
+                data = data._latest
+            self.__data = data
+            self.__pending += 1
+            if self.__thread is None:
+                self.__thread = threading.Thread(
+                    target=self.__run, name="write-behind", daemon=True)
+                self.__thread.start()
+            self.__condition.notify_all()
+
+    def flush(self):
+        """
+        Write all pending changes to the file on the calling thread.
+        """
+        data = self.__take(wait=False)
+        if data is not None:
+            self.__write(data)
+
+    def close(self):
+        """
+        Write all pending changes and stop the background thread.
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.flush()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __take(self, wait):
+        """
+        Take the latest dirty data for writing.
+
+        :param wait: Whether to wait until the delay or the threshold is reached.
+        :return: The data to be written, or None if there is nothing to write.
+        """
+        with self.__condition:
+            while self.__writing:
+                self.__condition.wait()
+            while wait and not self.__closed:
+                if self.__pending == 0:
+                    self.__condition.wait()
+                    continue
+                remaining = self.__dirty_since + self.__delay - time.monotonic()
+                if self.__pending >= self.__max_pending or remaining <= 0:
+                    break
+                self.__condition.wait(remaining)
+            if self.__pending == 0:
+                return None
+            data = self.__data
+            self.__data = None
+            self.__pending = 0
+            self.__dirty_since = None
+            self.__writing = True
+            return data
+
+    def __write(self, data):
+        try:
+            super().save(data() if callable(data) else data)
+        finally:
+            with self.__condition:
+                self.__writing = False
+                self.__condition.notify_all()
+
+    def __run(self):
+        while not self.__closed:
+            data = self.__take(wait=True)
+            if data is not None:
+                self.__write(data)
+
+
+def create_saver(path, shard_directory=None, snapshot_path=None):
+    """
+    Create a Saver for the file according to the persistence settings.
+
+    :param path: The path to the file where data will be saved and loaded.
+    :param shard_directory: The directory for sharded storage, if the data may be sharded.
+    :param snapshot_path: The path to a binary snapshot, if the data may be kept in one.
+    :return: A SharedSaver if the storage is shared between processes, a
+        WriteBehindSaver if the write-behind mode is on, a ShardedSaver if a
+        shard directory is given and sharding is on, a BinarySaver if a snapshot
+        path is given and binary snapshots are on, a Saver otherwise.
+    """
+    compression = Persistence.compression
+    if Persistence.shared_storage:
+        from shared_storage import SharedSaver
+        return SharedSaver(path, Persistence.journal_compact_every, compression)
+    if Persistence.write_behind:
+        return WriteBehindSaver(path, Persistence.write_behind_delay,
+                                Persistence.write_behind_max_pending, compression)
+    if Persistence.disk_storage:
+        from disk_storage import DiskSaver
+        return DiskSaver(os.path.splitext(path)[0] + ".db", Caching.record_cache_entries,
+                         Persistence.disk_flush_every, legacy_path=path)
+    if shard_directory and Persistence.shards:
+        from sharded_storage import ShardedSaver
+        return ShardedSaver(shard_directory, Persistence.shards, legacy_path=path,
+                            blobs=Persistence.blobs, compression=compression)
+    if snapshot_path and Persistence.binary_snapshots:
+        from binary_snapshot import BinarySaver
+        return BinarySaver(snapshot_path, legacy_path=path,
+                           compact_every=Persistence.journal_compact_every,
+                           compression=compression)
+    return Saver(path, compression)
+
+
+class Snapshot(Mapping):
+    """
+    An immutable point-in-time view of a book, returned by `Book.snapshot`.
+
+    The snapshot shares its storage with the book until the next write, so taking
+    one is O(1). Writes made after that go to a new version of the book and are
+    never visible through the snapshot. The first write while a snapshot is alive
+    copies the table of keys of the book, which is O(n) but shares the values; a
+    value is copied only when it is changed in place. Later writes copy nothing
+    until another snapshot is taken and kept alive.
+    """
+
+    def __init__(self, data, version, latest=None):
+        """
+        Initialize the Snapshot over the book storage of a given version.
+
+        :param data: The mapping that holds the book data of this version.
+        :param version: The version of the book the snapshot was taken at.
+        :param latest: A function taking a snapshot of the latest version of the
+            book, for the savers that write later than they are asked to.
+        """
+        self._data = data
+        self._version = version
+        self._latest = latest
+
+    @property
+    def version(self):
+        """
+        Get the version of the book the snapshot was taken at.
+
+        :return: The version number.
+        """
+        return self._version
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        # A generator holds the snapshot until it is exhausted, so the storage is
+        # copied on write while the keys are iterated
+        snapshot = self
+        yield from snapshot._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        return _SnapshotItems(self)
+
+    def values(self):
+        return _SnapshotValues(self)
+
+
+class _SnapshotItems(ItemsView):
+    # The views use the views of the storage, which may stream the values instead
+    # of looking up each key. Their iterators hold the snapshot until they are
+    # exhausted, as the book copies its storage on write only while it is alive
+    def __iter__(self):
+        snapshot = self._mapping
+        yield from snapshot._data.items()
+
+
+class _SnapshotValues(ValuesView):
+    def __iter__(self):
+        snapshot = self._mapping
+        yield from snapshot._data.values()
+
+
+# Generations are unique across all books, so (book, version) pairs never collide
+_generations = itertools.count(1)
+
+
+class Book(UserDict):
     """
+    A base class for the books persisted by a Saver.
+
+    Every change creates a new version of the book. Readers can grab an immutable
+    `Snapshot` of the current version and walk it while writes continue: the
+    storage and the records shared with live snapshots are copied on write.
+    """
+
+    # The fields `complete` completes, to whether their index holds the lower-cased
+    # keys, which are completed, or the values themselves
+    _completions = {}
 
     def __init__(self, saver: Saver):
         """
-        Initialize the AddressBook with a Saver instance.
+        Initialize the Book with a Saver instance.
 
         :param saver: An instance of the Saver class for file operations.
         """
         self.__saver = saver
         self.data = self.__saver.load()
+        self._lock = threading.RLock()
+        self._version = 0
+        self._generation = next(_generations)
+        self._latest = None
+        self._live_snapshots = 0
+        # The live snapshots sharing the current storage, which is replaced by a
+        # copy and gets a new number when it is written while they are alive
+        self._sharing_snapshots = 0
+        self._storage = 0
+        self._indexes = RecordIndexes({})
+        self._aggregates = Aggregates({})
+        self._feed = None
+        self._feed_name = None
+        self._fingerprints = {}
+        self._merkle = MerkleTree(self._fields)
+
+    @property
+    def saver(self):
+        """
+        Get the Saver persisting the book.
+
+        :return: The Saver.
+        """
+        return self.__saver
+
+    @saver.setter
+    def saver(self, saver):
+        """
+        Replace the Saver persisting the book, e.g. with a wrapper around it.
+
+        :param saver: The new Saver.
+        """
+        self.__saver = saver
+
+    @property
+    def pending_changes(self):
+        """
+        Get the number of changes that are not persisted yet.
+
+        :return: The number of unsaved changes.
+        """
+        return self.__saver.pending
+
+    def flush(self):
+        """
+        Persist all pending changes.
+        """
+        self.__saver.flush()
+
+    def close(self):
+        """
+        Persist all pending changes and release the Saver.
+        """
+        self.__saver.close()
+
+    def refresh(self):
+        """
+        Apply the changes persisted by other processes since the last refresh.
+
+        :return: True if the book changed, False otherwise.
+        """
+        with self._lock:
+            # Under the lock, as the saver keeps its position in the other
+            # processes' changes, and the changes it returns are applied in order
+            changes = self.__saver.refresh()
+            if changes is None:
+                return False
+            data, updates = changes
+            if data is not None:
+                self.data = data
+                self._storage += 1
+                self._sharing_snapshots = 0
+                self._merkle.clear()
+                self._reloaded()
+            else:
+                self._prepare_write()
+            for key, value in updates:
+                if value is None:
+                    self.data.pop(key, None)
+                else:
+                    self.data[key] = value
+                self.__changed(key, value)
+            if data is not None:
+                self.__publish_all()
+            self._version += 1
+            self._generation = next(_generations)
+            return True
+
+    @property
+    def version(self):
+        """
+        Get the current version of the book. It grows with every change.
+
+        :return: The version number.
+        """
+        return self._version
+
+    @property
+    def generation(self):
+        """
+        Get the generation of the book. It changes with every change, and no two
+        books, not even a book and its replacement, ever share a generation, so it
+        is a cheap key for results computed from the book.
+
+        :return: The generation number.
+        """
+        return self._generation
+
+    def snapshot(self) -> Snapshot:
+        """
+        Get an immutable view of the current version of the book in O(1).
+
+        :return: A Snapshot of the book.
+        """
+        with self._lock:
+            snapshot = self._latest() if self._latest else None
+            if snapshot is None or snapshot.version != self._version:
+                snapshot = Snapshot(self.data, self._version, self.snapshot)
+                self._latest = weakref.ref(snapshot)
+                self._live_snapshots += 1
+                self._sharing_snapshots += 1
+                weakref.finalize(snapshot, self._release_snapshot, self._storage)
+            return snapshot
+
+    def summary(self):
+        """
+        Get the counts the book maintains on every change, e.g. the contacts per
+        email domain or the notes per tag.
+
+        :return: A dict of aggregate names to Counters, and 'total' to the number
+            of values in the book.
+        """
+        with self._lock:
+            self._aggregates.build(self.data)
+            counters = self._aggregates.counters()
+            counters["total"] = len(self.data)
+        return counters
+
+    def attach_feed(self, feed, name):
+        """
+        Publish every change of the book to a change feed from now on.
+
+        :param feed: The ChangeFeed.
+        :param name: The name of the book in the events.
+        """
+        with self._lock:
+            self._fingerprints = {key: self.__fingerprint(self._fields(value))
+                                  for key, value in self.data.items()}
+            self._feed = feed
+            self._feed_name = name
+
+    def subscribe(self, callback):
+        """
+        Call a function with a ChangeEvent after every change of the book. A feed
+        of its own is attached to the book first if it has none.
+
+        :param callback: A function taking a ChangeEvent.
+        """
+        with self._lock:
+            if self._feed is None:
+                self.attach_feed(ChangeFeed(), type(self).__name__.lower())
+            self._feed.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling a subscribed function.
+
+        :param callback: The subscribed function.
+        """
+        if self._feed is not None:
+            self._feed.unsubscribe(callback)
+
+    def complete(self, field, prefix, limit=20):
+        """
+        Complete a prefix with the values of an indexed field, e.g. the names of
+        the contacts, with binary searches over the index of the field.
+
+        :param field: One of the fields in `_completions`.
+        :param prefix: The typed prefix.
+        :param limit: The maximum number of completions.
+        :return: A sorted list of distinct completions.
+        """
+        by_key = self._completions[field]
+        with self._lock:
+            index = self._indexes.index(field, self.data)
+            entries = index.distinct("^=", prefix.lower() if by_key else prefix, limit)
+        return [key if by_key else value for value, key in entries]
+
+    def merkle_hashes(self, prefixes):
+        """
+        Get the hashes of nodes of the Merkle tree of the book, see sync.MerkleTree.
+
+        :param prefixes: The prefixes of the nodes, the empty one for the root.
+        :return: A dict of prefixes to node hashes.
+        """
+        with self._lock:
+            self._merkle.build(self.data)
+            return {prefix: self._merkle.hash(prefix) for prefix in prefixes}
+
+    def merkle_entries(self, prefixes):
+        """
+        Get the content hashes of the values in leaves of the Merkle tree of the book.
+
+        :param prefixes: The prefixes of the leaves.
+        :return: A dict of keys to content hashes.
+        """
+        with self._lock:
+            self._merkle.build(self.data)
+            entries = {}
+            for prefix in prefixes:
+                entries.update(self._merkle.entries(prefix))
+            return entries
+
+    def get_many(self, keys):
+        """
+        Get several values from the same version of the book.
+
+        :param keys: The keys of the values.
+        :return: A dict of the keys found to their values.
+        """
+        snapshot = self.snapshot()
+        return {key: snapshot[key] for key in keys if key in snapshot}
+
+    def put_many(self, changes):
+        """
+        Store and delete several values as a single new version of the book.
+
+        :param changes: A mapping of keys to the values to be stored, or to None
+            for the keys to be deleted.
+        """
+        self._apply(changes)
+
+    def _fields(self, value):
+        """
+        Get the fields of a value the change feed reports. Subclasses override it.
+
+        :param value: A value of the book.
+        :return: A dict of field names to JSON-friendly values.
+        """
+        return {}
+
+    def __fingerprint(self, fields):
+        # Hashes rather than values, so that the feed does not keep a second copy
+        return {field: hash(value) for field, value in fields.items()}
+
+    def __changed(self, key, value):
+        self._merkle.update(key, value)
+        self._changed(key, value)
+        if self._feed is not None:
+            self.__publish(key, value)
+
+    def __publish(self, key, value):
+        old = self._fingerprints.pop(key, None)
+        if value is None:
+            if old is not None:
+                self._feed.publish(self._feed_name, "delete", key, {})
+            return
+        fields = self._fields(value)
+        new = self._fingerprints[key] = self.__fingerprint(fields)
+        if old is None:
+            self._feed.publish(self._feed_name, "add", key, fields)
+            return
+        fields = {field: field_value for field, field_value in fields.items()
+                  if old.get(field) != new[field]}
+        if fields:
+            self._feed.publish(self._feed_name, "update", key, fields)
+
+    def __publish_all(self):
+        # After the whole data was replaced, every key is compared
+        if self._feed is None:
+            return
+        for key in [key for key in self._fingerprints if key not in self.data]:
+            self.__publish(key, None)
+        for key, value in self.data.items():
+            self.__publish(key, value)
+
+    def _changed(self, key, value):
+        """
+        Called under the lock after the value under the key was set or deleted, so
+        that subclasses can maintain their indexes.
+
+        :param key: The key of the changed value.
+        :param value: The new value, or None if it was deleted.
+        """
+
+    def _reloaded(self):
+        """
+        Called under the lock after the whole data was replaced.
+        """
+
+    def _release_snapshot(self, storage):
+        with self._lock:
+            self._live_snapshots -= 1
+            if storage == self._storage:
+                self._sharing_snapshots -= 1
+
+    def _prepare_write(self):
+        """
+        Make sure the storage is not shared with a live snapshot before changing it.
+        """
+        if self._sharing_snapshots:
+            self.data = self.data.copy()
+            self._storage += 1
+            self._sharing_snapshots = 0
+
+    def _get(self, key):
+        """
+        Get a value for reading. The value is shared with the snapshots of the
+        book and must not be changed, see `_checkout`.
+
+        :param key: The key associated with the value.
+        :return: The value, or None if not found.
+        """
+        with self._lock:
+            return self.data.get(key)
+
+    def _checkout(self, key):
+        """
+        Get a private copy of a value for changing. Stored values are never changed
+        in place, the copy replaces the value once it is stored with `_set`, so that
+        no snapshot and no background save sees a change half-made.
+
+        :param key: The key associated with the value.
+        :return: A copy of the value, or None if not found.
+        """
+        value = self._get(key)
+        return value.copy() if value is not None else None
+
+    def _set(self, key, value):
+        """
+        Store a value under the key as a new version and persist the book.
+
+        :param key: The key associated with the value.
+        :param value: The value to be stored.
+        """
+        with self._lock:
+            self._prepare_write()
+            self.data[key] = value
+            self._version += 1
+            self._generation = next(_generations)
+            self.__changed(key, value)
+            self.__saver.save_change(self.snapshot(), key)
+
+    def _delete(self, key):
+        """
+        Delete the value stored under the key as a new version and persist the book.
+
+        :param key: The key associated with the value to be deleted.
+        """
+        with self._lock:
+            self._prepare_write()
+            del self.data[key]
+            self._version += 1
+            self._generation = next(_generations)
+            self.__changed(key, None)
+            self.__saver.save_change(self.snapshot(), key)
+
+    def _apply(self, changes):
+        """
+        Store and delete several values as a single new version, persisted with a
+        single save.
+
+        :param changes: A mapping of keys to the values to be stored, or to None
+            for the keys to be deleted.
+        """
+        if not changes:
+            return
+        with self._lock:
+            self._prepare_write()
+            for key, value in changes.items():
+                if value is None:
+                    self.data.pop(key, None)
+                else:
+                    self.data[key] = value
+            self._version += 1
+            self._generation = next(_generations)
+            for key, value in changes.items():
+                self.__changed(key, value)
+            self.__saver.save_changes(self.snapshot(), list(changes))
+
+
+class AddressBook(Book):
+    """
+    A class that manages contact records in an address book and persists them using a Saver.
+    """
+
+    _completions = {"name": True, "phone": False}
+
+    def __init__(self, saver: Saver):
+        """
+        Initialize the AddressBook with a Saver instance.
+
+        :param saver: An instance of the Saver class for file operations.
+        """
+        super().__init__(saver)
+        self._indexes = RecordIndexes()
+        self._birthdays = BirthdayScheduler()
+        self._aggregates = Aggregates(CONTACT_AGGREGATES)
+        self._address_index = TokenIndex(record_address_tokens)
+
+    def _fields(self, value):
+        return record_fields(value)
+
+    def _changed(self, key, value):
+        self._indexes.update(key, value)
+        self._birthdays.update(key, value)
+        self._aggregates.update(key, value)
+        self._address_index.update(key, value)
+
+    def _reloaded(self):
+        self._indexes.clear()
+        self._birthdays.clear()
+        self._aggregates.clear()
+        self._address_index.clear()
+
+    def query(self, query):
+        """
+        Find the contact records matching a query. The most selective index the
+        query allows narrows the records down before they are checked.
+
+        :param query: The query text (see the `query` module) or a parsed query.
+        :return: A list of matching records, sorted by name.
+        :raise QuerySyntaxError: If the query text is not valid.
+        """
+        if isinstance(query, str):
+            query = parse(query)
+        with self._lock:
+            keys = plan(query, lambda field: self._indexes.index(field, self.data))
+            snapshot = self.snapshot()
+        if keys is None:
+            keys = snapshot
+        return [snapshot[key] for key in sorted(keys)
+                if key in snapshot and query.matches(snapshot[key])]
+
+    def find_by_address(self, text):
+        """
+        Find the contact records whose address has all the words of a text, e.g.
+        a street or a city. Case, punctuation and abbreviations like 'street'
+        for 'st' do not matter.
+
+        :param text: The words to look for.
+        :return: A list of matching records, sorted by name.
+        """
+        tokens = address_tokens(text)
+        if not tokens:
+            return []
+        with self._lock:
+            self._address_index.build(self.data)
+            keys = self._address_index.keys(tokens)
+            snapshot = self.snapshot()
+        return [snapshot[key] for key in sorted(keys)]
 
     def get_all(self):
         """
         Get all contact records.
 
-        :return: A list of all contact records.
+        :return: A point-in-time view of all contact records.
         """
-        return list(self.data.values())
+        return self.snapshot().values()
 
     def add_record(self, name, record):
         """
@@ -75,8 +878,7 @@ class AddressBook(UserDict):
         :param name: The name associated with the record.
         :param record: The contact record to be added.
         """
-        self.data[name] = record
-        self.__saver.save(self.data)
+        self._set(name, record)
 
     def update_record(self, name, record):
         """
@@ -85,8 +887,7 @@ class AddressBook(UserDict):
         :param name: The name associated with the record.
         :param record: The updated contact record.
         """
-        self.data[name] = record
-        self.__saver.save(self.data)
+        self._set(name, record)
 
     def get_upcoming_birthday(self, days):
         """
@@ -99,7 +900,7 @@ class AddressBook(UserDict):
         today = datetime.today().date()
         next_date = today + timedelta(days=int(days))
 
-        for record in self.data.values():
+        for record in self.snapshot().values():
             if record.birthday:
                 birthday_in_datetime = datetime.strptime(
                     record.birthday.value, "%d.%m.%Y").date()
@@ -116,23 +917,78 @@ class AddressBook(UserDict):
 
         return upcoming_birthdays
 
+    def due_birthdays(self, days=0, today=None):
+        """
+        Take the birthdays falling within a number of days that were not taken yet.
+        Each birthday is reported once a year, and only the nearest birthdays are
+        looked at, so calling it between every two commands is cheap.
+
+        :param days: How many days ahead a birthday is due.
+        :param today: The current date, today by default.
+        :return: A list of (record, date) pairs, the nearest first.
+        """
+        today = today or datetime.today().date()
+        with self._lock:
+            self._birthdays.build(self.data, today)
+            due = self._birthdays.due(today, days)
+            if not due:
+                return []
+            snapshot = self.snapshot()
+        return [(snapshot[key], occurrence) for occurrence, key in due]
+
+    def find_duplicates(self):
+        """
+        Find the clusters of records that are likely the same contact.
+
+        :return: A list of (keys, reasons) pairs, see dedupe.find_clusters.
+        """
+        return find_clusters(self.snapshot())
+
+    def merge_duplicates(self):
+        """
+        Merge every cluster of duplicate records into one record, as a single new
+        version of the book saved once.
+
+        :return: A list of (keys, merged record) pairs, one per cluster.
+        """
+        with self._lock:
+            snapshot = self.snapshot()
+            merged = []
+            changes = {}
+            for keys, _ in find_clusters(snapshot):
+                record = merge([snapshot[key] for key in keys])
+                changes.update(dict.fromkeys(keys))
+                changes[record.name.value] = record
+                merged.append((keys, record))
+            self._apply(changes)
+        return merged
+
     def delete_record(self, name):
         """
         Delete a contact record from the address book.
 
         :param name: The name associated with the record to be deleted.
         """
-        del self.data[name]
-        self.__saver.save(self.data)
+        self._delete(name)
 
     def find_by_name(self, name):
         """
-        Find and return a contact record by name.
+        Find and return a contact record by name, for changing and storing back
+        with `update_record`.
+
+        :param name: The name associated with the record.
+        :return: A copy of the contact record, or None if not found.
+        """
+        return self._checkout(name)
+
+    def get_record(self, name):
+        """
+        Get a contact record by name for reading. The record must not be changed.
 
         :param name: The name associated with the record.
         :return: The contact record, or None if not found.
         """
-        return self.data.get(name)
+        return self._get(name)
 
     def find(self, field_name, value):
         """
@@ -142,7 +998,26 @@ class AddressBook(UserDict):
         :param value: The value to search for.
         :return: The contact record, or None if not found.
         """
-        for record in self.data.values():
+        with self._lock:
+            find_keys = getattr(self.data, "find_keys", None)
+            keys = find_keys(field_name, value) if find_keys else None
+            if keys is not None:
+                return self.data.get(keys[0]) if keys else None
+            if field_name in FIELDS:
+                try:
+                    lookup = normalize(field_name, value)
+                except ValueError:
+                    return None
+                keys = self._indexes.index(field_name, self.data).keys("=", lookup)
+                snapshot = self.snapshot()
+        if keys is not None:
+            # The index compares normalized values, the exact match is checked here
+            for key in sorted(keys):
+                record = snapshot.get(key)
+                if record is not None and record_matches(record, field_name, value):
+                    return record
+            return None
+        for record in self.snapshot().values():
             if field_name == "phone":
                 if record.has_phone(value):
                     return record
@@ -153,45 +1028,117 @@ class AddressBook(UserDict):
         return None
 
 
-class NotesBook(UserDict):
+class NotesBook(Book):
     """
     A class that manages notes and persists them using a Saver.
     """
 
+    _completions = {"key": True, "tag": False}
+
     def __init__(self, saver: Saver):
         """
         Initialize the NotesBook with a Saver instance.
 
         :param saver: An instance of the Saver class for file operations.
         """
-        self.__saver = saver
-        self.data = self.__saver.load()
+        super().__init__(saver)
+        self._text_index = TextIndex()
+        self._indexes = RecordIndexes({**NOTE_DATES, **NOTE_KEYS})
+        self._aggregates = Aggregates(NOTE_AGGREGATES)
+
+    def _fields(self, value):
+        return note_fields(value)
+
+    def _changed(self, key, value):
+        self._text_index.update(key, value)
+        self._indexes.update(key, value)
+        self._aggregates.update(key, value)
+
+    def _reloaded(self):
+        self._text_index.clear()
+        self._indexes.clear()
+        self._aggregates.clear()
+
+    def search(self, text, limit=10):
+        """
+        Find the notes most relevant to a text, ranked with BM25.
+
+        :param text: The words to look for.
+        :param limit: The maximum number of notes.
+        :return: A list of (note, score) pairs, the most relevant first.
+        """
+        with self._lock:
+            self._text_index.build(self.data)
+            ranked = self._text_index.search(text, limit)
+            snapshot = self.snapshot()
+        return [(snapshot[key], score) for key, score in ranked]
+
+    def find_by_date(self, start, end, field="created"):
+        """
+        Find the notes created or last changed within a time range.
+
+        :param start: The start of the range, inclusive.
+        :param end: The end of the range, inclusive.
+        :param field: 'created' or 'modified'.
+        :return: A list of notes, the oldest first.
+        """
+        with self._lock:
+            entries = self._indexes.index(field, self.data).entries("..", (start, end))
+            snapshot = self.snapshot()
+        return [snapshot[key] for _, key in entries]
+
+    def latest(self, count, field="modified"):
+        """
+        Get the notes created or last changed most recently.
+
+        :param count: The maximum number of notes.
+        :param field: 'created' or 'modified'.
+        :return: A list of notes, the newest first.
+        """
+        with self._lock:
+            entries = self._indexes.index(field, self.data).last(count)
+            snapshot = self.snapshot()
+        return [snapshot[key] for _, key in entries]
 
     def get_all(self):
         """
         Get all notes.
 
-        :return: A list of all notes.
+        :return: A point-in-time view of all notes.
         """
-        return list(self.data.values())
+        return self.snapshot().values()
 
     def find_by_key(self, key) -> Note:
         """
-        Find and return a note by its key.
+        Find and return a note by its key, for changing and storing back with
+        `update_note`.
+
+        :param key: The key associated with the note.
+        :return: A copy of the note, or None if not found.
+        """
+        return self._checkout(key)
+
+    def get_note(self, key) -> Note:
+        """
+        Get a note by its key for reading. The note must not be changed.
 
         :param key: The key associated with the note.
         :return: The note, or None if not found.
         """
-        return self.data.get(key)
+        return self._get(key)
 
     def find_by_tag(self, tag):
         """
-        Find and return notes that contain a specific tag.
+        Find and return notes that contain a specific tag, with a binary search
+        over the tag index.
 
         :param tag: The tag to search for.
-        :return: A list of notes containing the tag.
+        :return: A list of notes containing the tag, ordered by key.
         """
-        return [n for n in self.get_all() if tag in n.tags]
+        with self._lock:
+            entries = self._indexes.index("tag", self.data).entries("=", tag)
+            snapshot = self.snapshot()
+        return [snapshot[key] for _, key in entries]
 
     def add(self, key, note: Note):
         """
@@ -200,8 +1147,7 @@ class NotesBook(UserDict):
         :param key: The key associated with the note.
         :param note: The note to be added.
         """
-        self.data[key] = note
-        self.__saver.save(self.data)
+        self._set(key, note)
 
     def update_note(self, key, note: Note):
         """
@@ -210,8 +1156,8 @@ class NotesBook(UserDict):
         :param key: The key associated with the note.
         :param note: The updated note.
         """
-        self.data[key] = note
-        self.__saver.save(self.data)
+        note.modify_date = datetime.now()
+        self._set(key, note)
 
     def delete_note(self, key):
         """
@@ -219,5 +1165,4 @@ class NotesBook(UserDict):
 
         :param key: The key associated with the note to be deleted.
         """
-        del self.data[key]
-        self.__saver.save(self.data)
+        self._delete(key)
@@ -0,0 +1,490 @@
+"""
+This module provides `ShardedSaver`, a Saver that spreads the data over several
+shard files in a directory, so that a change rewrites only the shard holding the
+changed key instead of the whole book. Shards are read on first access, and note
+texts can be kept out of the shards in a memory-mapped blob file and read lazily.
+"""
+
+import json
+import os
+import pickle
+import threading
+import weakref
+import zlib
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from blob_storage import BlobStore, BlobText
+from compression import reader, writer
+from models import Note
+from repository import Saver, Snapshot
+
+MANIFEST_FORMAT = 1
+# Unused bytes in the blob file that are tolerated before it is rewritten
+BLOB_GARBAGE_ALLOWANCE = 1 << 20
+
+
+def shard_of(key, shards):
+    """
+    Get the number of the shard a key belongs to. The hash is stable between runs.
+
+    :param key: The key of a value.
+    :param shards: The number of shards.
+    :return: The shard number.
+    """
+    return zlib.crc32(str(key).encode("utf-8")) % shards
+
+
+def _remove_blob_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # Still mapped on platforms that do not allow removing mapped files
+        pass
+
+
+class _ShardFiles:
+    """
+    The shards as they were in their files when the data was loaded. Each shard is
+    read the first time it is needed and never changes afterwards.
+    """
+
+    def __init__(self, shards, load_shard):
+        self.__parts = [None] * shards
+        self.__load_shard = load_shard
+        self.__lock = threading.Lock()
+
+    def part(self, shard):
+        part = self.__parts[shard]
+        if part is None:
+            with self.__lock:
+                part = self.__parts[shard]
+                if part is None:
+                    part = self.__parts[shard] = self.__load_shard(shard)
+        return part
+
+    def load_all(self):
+        """
+        Read all shards that were not read yet, in parallel.
+        """
+        missing = [shard for shard, part in enumerate(self.__parts) if part is None]
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=min(8, len(missing))) as executor:
+                list(executor.map(self.part, missing))
+        for shard in missing:
+            self.part(shard)
+
+    def loaded(self):
+        return [part for part in self.__parts if part is not None]
+
+
+class ShardedData(MutableMapping):
+    """
+    A mutable mapping over the shard files of a ShardedSaver.
+
+    Looking up, setting or deleting a key reads only its shard; iterating or
+    counting the data reads all of them. The shards changed since loading are
+    kept apart from the files, and copies share them until either side changes
+    one, so that a copy for a snapshot costs a shard rather than the whole data.
+    """
+
+    def __init__(self, files, shards, parts=None):
+        """
+        Initialize the ShardedData over the shard files.
+
+        :param files: The _ShardFiles to read the unchanged shards from.
+        :param shards: The number of shards.
+        :param parts: The changed shards by number, shared with another copy.
+        """
+        self.__files = files
+        self.__shards = shards
+        self.__parts = parts if parts is not None else {}
+        self.__shared = set(self.__parts)
+
+    def part(self, shard):
+        """
+        Get the values of a shard. The result must not be changed.
+
+        :param shard: The shard number.
+        :return: A dict of keys to values.
+        """
+        # The files go first, they are dropped after all shards were taken over
+        files = self.__files
+        part = self.__parts.get(shard)
+        return part if part is not None else files.part(shard)
+
+    def __writable(self, shard):
+        if shard not in self.__parts or shard in self.__shared:
+            self.__parts[shard] = dict(self.part(shard))
+            self.__shared.discard(shard)
+        return self.__parts[shard]
+
+    def __getitem__(self, key):
+        return self.part(shard_of(key, self.__shards))[key]
+
+    def __setitem__(self, key, value):
+        self.__writable(shard_of(key, self.__shards))[key] = value
+
+    def __delitem__(self, key):
+        shard = shard_of(key, self.__shards)
+        if key not in self.part(shard):
+            raise KeyError(key)
+        del self.__writable(shard)[key]
+
+    def __contains__(self, key):
+        return key in self.part(shard_of(key, self.__shards))
+
+    def __all_parts(self):
+        files = self.__files
+        if files is not None:
+            files.load_all()
+        return [self.part(shard) for shard in range(self.__shards)]
+
+    def __iter__(self):
+        # Bound once, so that later writes do not change the data under the iteration
+        for part in self.__all_parts():
+            yield from part
+
+    def __len__(self):
+        return sum(len(part) for part in self.__all_parts())
+
+    def resident(self):
+        """
+        Get the values held in memory, i.e. of the shards read so far.
+
+        :return: A dict of keys to values.
+        """
+        resident = {}
+        files = self.__files
+        for part in files.loaded() if files is not None else ():
+            resident.update(part)
+        for part in self.__parts.values():
+            resident.update(part)
+        return {key: value for key, value in resident.items() if key in self}
+
+    def detach(self):
+        """
+        Take over all shards and stop referring to the shard files, e.g. once the
+        files were rewritten, so that the values they were loaded with can go.
+        """
+        files = self.__files
+        if files is None:
+            return
+        for shard in range(self.__shards):
+            if shard not in self.__parts:
+                self.__parts[shard] = files.part(shard)
+                self.__shared.add(shard)
+        self.__files = None
+
+    def copy(self):
+        """
+        Return a copy sharing the shards. A shard is copied by the side that
+        changes it first.
+
+        :return: A new ShardedData.
+        """
+        self.__shared = set(self.__parts)
+        return ShardedData(self.__files, self.__shards, dict(self.__parts))
+
+
+class ShardedSaver(Saver):
+    """
+    A Saver that keeps the data in a directory of shard files.
+
+    Keys are hashed into a fixed number of shards. The directory holds a small
+    `manifest.json` with the number of shards and one pickle file per shard. The
+    data is loaded as a ShardedData, which reads a shard on first access. Data
+    saved by a plain Saver to `legacy_path` is picked up on the first load and
+    moved to the shards on the first save.
+
+    With `blobs` on, the texts of notes go to a blob file and the shards keep
+    only their offsets and lengths, so reading a shard does not read any text.
+    The blob file is rewritten once most of it holds texts that were replaced or
+    deleted.
+    """
+
+    def __init__(self, directory, shards=16, legacy_path=None, blobs=False,
+                 compression=None):
+        """
+        Initialize the ShardedSaver with a directory.
+
+        :param directory: The directory for the manifest and the shard files.
+        :param shards: The number of shards for a new directory. An existing
+            directory keeps the number of shards from its manifest.
+        :param legacy_path: The path to a single-file pickle to migrate from.
+        :param blobs: Whether to keep the texts of notes in a blob file.
+        :param compression: None, 'gzip' or 'lzma' to compress the shard files.
+        """
+        super().__init__(legacy_path, compression)
+        self.__legacy_path = legacy_path
+        self.__directory = directory
+        self.__manifest_path = os.path.join(directory, "manifest.json")
+        self.__shards = shards
+        self.__shard_keys = [set() for _ in range(shards)]
+        self.__migrate = False
+        self.__blobs = blobs
+        self.__files = None
+        self.__store = None
+        self.__blob_generation = 0
+        # The lengths of the texts in the blob file, known for the shards whose
+        # texts were counted; the garbage is exact once all of them are
+        self.__blob_lengths = {}
+        self.__blob_live = 0
+        self.__blob_garbage = 0
+        self.__counted = set(range(shards))
+
+    @property
+    def shards(self):
+        """
+        Get the number of shards.
+
+        :return: The number of shards.
+        """
+        return self.__shards
+
+    def load(self):
+        """
+        Open the shards. Only the manifest is read; the shards are read on first
+        access.
+
+        :return: A ShardedData over the shards, the data of the legacy file or an
+            empty dict if there is no data yet.
+        """
+        self.__files = None
+        self.__blob_lengths = {}
+        self.__blob_live = 0
+        self.__blob_garbage = 0
+        try:
+            with open(self.__manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except OSError:
+            data = super().load() if self.__legacy_path else {}
+            self.__migrate = bool(data)
+            self.__counted = set(range(self.__shards))
+            self.__index(data)
+            return data
+        self.__shards = manifest["shards"]
+        self.__shard_keys = [set() for _ in range(self.__shards)]
+        self.__store = None
+        if manifest.get("blobs"):
+            self.__blob_generation = manifest["blobs"]
+            self.__store = BlobStore(self.__blob_path(self.__blob_generation))
+        store = self.__store
+        self.__files = _ShardFiles(self.__shards,
+                                   lambda shard: self.__load_shard(shard, store))
+        self.__counted = set()
+        return ShardedData(self.__files, self.__shards)
+
+    @property
+    def blob_garbage(self):
+        """
+        Get the number of bytes in the blob file taken by replaced or deleted texts.
+        Texts replaced in earlier sessions are only counted once all shards were
+        read, which happens when the texts replaced since loading pass
+        BLOB_GARBAGE_ALLOWANCE.
+
+        :return: The number of unused bytes.
+        """
+        return self.__blob_garbage
+
+    def save(self, data):
+        """
+        Save the whole data to all shards.
+
+        :param data: The data to be saved.
+        """
+        if isinstance(data, Snapshot):
+            data = data._data
+        if isinstance(data, ShardedData):
+            self.__count_all()
+        else:
+            self.__index(data)
+        os.makedirs(self.__directory, exist_ok=True)
+        if self.__blobs and self.__store is None:
+            self.__open_new_store()
+        for shard in range(self.__shards):
+            self.__write_shard(data, shard)
+        # The manifest goes last: until it exists the shards are not used
+        self.__write_manifest()
+        self.__migrate = False
+
+    def save_change(self, data, key):
+        """
+        Save only the shard that holds the key.
+
+        :param data: The data after the change.
+        :param key: The key of the changed value.
+        """
+        self.save_changes(data, [key])
+
+    def save_changes(self, data, keys):
+        """
+        Save only the shards that hold the keys.
+
+        :param data: The data after the changes.
+        :param keys: The keys of the changed values.
+        """
+        if self.__migrate:
+            self.save(data)
+            return
+        if isinstance(data, Snapshot):
+            data = data._data
+        sharded = isinstance(data, ShardedData)
+        shards = set()
+        for key in keys:
+            shard = shard_of(key, self.__shards)
+            self.__count(shard)
+            shards.add(shard)
+            if key in data:
+                if not sharded:
+                    self.__shard_keys[shard].add(key)
+            else:
+                self.__shard_keys[shard].discard(key)
+                self.__drop_blob(key)
+        if not os.path.exists(self.__manifest_path) or \
+                (self.__blobs and self.__store is None):
+            os.makedirs(self.__directory, exist_ok=True)
+            self.__open_new_store()
+            self.__write_manifest()
+        for shard in sorted(shards):
+            self.__write_shard(data, shard)
+        if self.__blob_garbage > BLOB_GARBAGE_ALLOWANCE and \
+                (self.__blob_garbage > self.__blob_live or
+                 len(self.__counted) < self.__shards):
+            # The garbage left by earlier sessions is only known once all
+            # shards are counted
+            self.__count_all()
+            self.__blob_garbage = self.__store.size - self.__blob_live
+            if self.__blob_garbage > BLOB_GARBAGE_ALLOWANCE and \
+                    self.__blob_garbage > self.__blob_live:
+                self.__compact_blobs(data)
+
+    def __count(self, shard):
+        """
+        Count the lengths of the texts of a shard as it was loaded, before it is
+        written for the first time.
+        """
+        if shard in self.__counted:
+            return
+        self.__counted.add(shard)
+        for key, value in self.__files.part(shard).items():
+            if isinstance(value, Note) and self.__owns(value._text):
+                self.__set_blob(key, value._text.length)
+
+    def __count_all(self):
+        if len(self.__counted) < self.__shards:
+            self.__files.load_all()
+            for shard in range(self.__shards):
+                self.__count(shard)
+
+    def __set_blob(self, key, length):
+        self.__drop_blob(key)
+        self.__blob_lengths[key] = length
+        self.__blob_live += length
+
+    def __drop_blob(self, key):
+        length = self.__blob_lengths.pop(key, 0)
+        self.__blob_live -= length
+        self.__blob_garbage += length
+
+    def __open_new_store(self):
+        if not self.__blobs:
+            return
+        self.__blob_generation += 1
+        self.__store = BlobStore(self.__blob_path(self.__blob_generation))
+
+    def __compact_blobs(self, data):
+        """
+        Move the live texts to a new blob file and drop the old one.
+        """
+        # The shards are all read before the texts move to the new file
+        self.__count_all()
+        if isinstance(data, ShardedData):
+            data.detach()
+        self.__files = None
+        old_store = self.__store
+        self.__open_new_store()
+        self.__blob_lengths = {}
+        self.__blob_live = 0
+        self.__blob_garbage = 0
+        for shard in range(self.__shards):
+            self.__write_shard(data, shard)
+        self.__write_manifest()
+        # The notes of live snapshots that were replaced or deleted since may still
+        # read the old file, so it is removed once nothing refers to its store
+        old_store.close()
+        weakref.finalize(old_store, _remove_blob_file, old_store.path)
+
+    def __owns(self, text):
+        return isinstance(text, BlobText) and text.store is self.__store
+
+    def __blob_path(self, generation):
+        return os.path.join(self.__directory, f"bodies-{generation:04d}.blob")
+
+    def __index(self, data):
+        self.__shard_keys = [set() for _ in range(self.__shards)]
+        for key in data:
+            self.__shard_keys[shard_of(key, self.__shards)].add(key)
+
+    def __shard_path(self, shard):
+        return os.path.join(self.__directory, f"shard-{shard:04d}.pkl")
+
+    def __load_shard(self, shard, store):
+        try:
+            f = open(self.__shard_path(shard), "rb")
+        except OSError:
+            return {}
+        with f, reader(f) as stream:
+            unpickler = pickle.Unpickler(stream)
+            # The shard refers to the blob file it was written with
+            unpickler.persistent_load = lambda pid: BlobText(store, *pid)
+            return unpickler.load()
+
+    def __write_shard(self, data, shard):
+        if isinstance(data, Snapshot):
+            data = data._data
+        if isinstance(data, ShardedData):
+            part = dict(data.part(shard))
+        else:
+            part = {key: data[key] for key in self.__shard_keys[shard]}
+        if self.__store is not None:
+            self.__externalize(part)
+
+        def write(f):
+            with writer(f, self.compression) as stream:
+                pickler = pickle.Pickler(stream)
+                pickler.persistent_id = self.__persistent_id
+                pickler.dump(part)
+        self.__replace(self.__shard_path(shard), write)
+
+    def __externalize(self, part):
+        """
+        Move the texts of the notes that are not in the blob file yet there.
+        """
+        for key, value in part.items():
+            if not isinstance(value, Note) or self.__owns(value._text):
+                continue
+            # The text does not change, so it is safe to swap even for a note
+            # shared with a snapshot
+            value._text = self.__store.put(value.text)
+            self._count_written(value._text.length)
+            self.__set_blob(key, value._text.length)
+        self.__store.flush()
+
+    def __persistent_id(self, obj):
+        if self.__owns(obj):
+            return obj.offset, obj.length
+        return None
+
+    def __write_manifest(self):
+        manifest = {"format": MANIFEST_FORMAT, "shards": self.__shards}
+        if self.__store is not None:
+            manifest["blobs"] = self.__blob_generation
+        self.__replace(self.__manifest_path,
+                       lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+
+    def __replace(self, path, write):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            write(f)
+            self._count_written(f.tell())
+        os.replace(temp_path, path)
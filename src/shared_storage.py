@@ -0,0 +1,378 @@
+"""
+This module provides storage that several assistant processes can share safely.
+It includes `FileLock`, an advisory lock on a file, and `SharedSaver`, which keeps
+the data in a snapshot file plus an append-only journal of sequenced changes so
+that every process sees the changes of the others without reloading everything.
+"""
+
+import os
+import pickle
+import threading
+import time
+from compression import detect, reader, writer
+from repository import Saver
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    An advisory inter-process lock backed by a lock file. It counts its
+    acquisitions, how many of them had to wait for another process and how long.
+    Within a process it is held by one thread at a time and is re-entrant.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the FileLock with the path of the lock file.
+
+        :param path: The path to the lock file. It is created if it does not exist.
+        """
+        self.__path = path
+        self.__file = None
+        # Held with the file lock, so the depth and the counters are only changed
+        # by the thread holding it
+        self.__thread_lock = threading.RLock()
+        self.__depth = 0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def acquire(self, shared=False):
+        """
+        Block until the lock is acquired.
+
+        :param shared: Whether to take a shared (read) lock instead of an exclusive one.
+            Platforms without shared locks always take an exclusive lock.
+        """
+        self.__thread_lock.acquire()
+        if self.__depth:
+            self.__depth += 1
+            return
+        try:
+            self.__lock_file(shared)
+        except BaseException:
+            self.__thread_lock.release()
+            raise
+        self.__depth = 1
+
+    def release(self):
+        """
+        Release the lock.
+        """
+        try:
+            self.__depth -= 1
+            if self.__depth:
+                return
+            if fcntl is not None:
+                fcntl.flock(self.__file, fcntl.LOCK_UN)
+            else:
+                self.__file.seek(0)
+                msvcrt.locking(self.__file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.__file.close()
+            self.__file = None
+        finally:
+            self.__thread_lock.release()
+
+    def shared(self):
+        """
+        Get a context manager holding a shared lock.
+
+        :return: A context manager.
+        """
+        return _Held(self, True)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __lock_file(self, shared):
+        self.__file = open(self.__path, "a+b")
+        self.acquisitions += 1
+        if self.__try_lock(shared):
+            return
+        # Held by another process: count how long we wait for it
+        self.contended += 1
+        start = time.perf_counter()
+        if fcntl is not None:
+            fcntl.flock(self.__file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            self.__file.seek(0)
+            msvcrt.locking(self.__file.fileno(), msvcrt.LK_LOCK, 1)
+        self.wait_time += time.perf_counter() - start
+
+    def __try_lock(self, shared):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.__file, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                            | fcntl.LOCK_NB)
+            else:
+                self.__file.seek(0)
+                msvcrt.locking(self.__file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+
+class _Held:
+    def __init__(self, lock, shared):
+        self.__lock = lock
+        self.__shared = shared
+
+    def __enter__(self):
+        self.__lock.acquire(self.__shared)
+        return self.__lock
+
+    def __exit__(self, *exc_info):
+        self.__lock.release()
+
+
+class SharedSaver(Saver):
+    """
+    A Saver for data shared by several processes.
+
+    The data lives in a snapshot file in the usual pickle format and in a journal
+    next to it. Every change is appended to the journal as a (sequence number, key,
+    value) entry under an exclusive file lock. Other processes pick the new entries
+    up with `refresh`, which only reads the journal past the position it already
+    knows. Once the journal grows long it is compacted into a new snapshot.
+    """
+
+    def __init__(self, path, compact_every=1000, compression=None):
+        """
+        Initialize the SharedSaver with a file path.
+
+        :param path: The path to the snapshot file.
+        :param compact_every: The number of journal entries that triggers a compaction.
+        :param compression: None, 'gzip' or 'lzma' to compress the snapshot and the
+            journal. An existing journal keeps its compression until it is compacted.
+        """
+        super().__init__(path, compression)
+        self.__path = path
+        self.__journal_path = path + ".journal"
+        self.__lock = FileLock(path + ".lock")
+        self.__compact_every = compact_every
+        self.__seq = 0
+        self.__entries = 0
+        self.__offset = 0
+        self.__state = None
+        self.__reloaded = None
+        self.__unseen = {}
+
+    @property
+    def lock(self):
+        """
+        Get the file lock guarding the snapshot and the journal, e.g. to read its
+        contention counters.
+
+        :return: The FileLock.
+        """
+        return self.__lock
+
+    @property
+    def seq(self):
+        """
+        Get the sequence number of the last change known to this process.
+
+        :return: The sequence number.
+        """
+        return self.__seq
+
+    def load(self):
+        """
+        Load the snapshot file and apply the journal on top of it.
+
+        :return: The loaded data or an empty dict if there is no data yet.
+        """
+        with self.__lock.shared():
+            self.__reloaded = None
+            self.__unseen = {}
+            return self.__load()
+
+    def save(self, data):
+        """
+        Save the whole data as a new snapshot and start a new journal.
+
+        :param data: The data to be saved.
+        """
+        with self.__lock:
+            self.__catch_up()
+            self.__reloaded = None
+            self.__unseen = {}
+            self.__compact(data)
+
+    def save_change(self, data, key):
+        """
+        Append the change of the value under the key to the journal.
+
+        :param data: The data after the change.
+        :param key: The key of the changed value.
+        """
+        self.save_changes(data, [key])
+
+    def save_changes(self, data, keys):
+        """
+        Append the changes of the values under the keys to the journal in a single
+        write, so that other processes see all of them or none.
+
+        :param data: The data after the changes.
+        :param keys: The keys of the changed values.
+        """
+        with self.__lock:
+            self.__catch_up()
+            compression = detect(self.__journal_path, self.compression)
+            with open(self.__journal_path, "ab") as f:
+                start = f.tell()
+                for key in keys:
+                    value = data.get(key)
+                    # This write supersedes whatever other processes stored under the key
+                    self.__unseen.pop(key, None)
+                    if self.__reloaded is not None:
+                        self.__apply(self.__reloaded, key, value)
+                    self.__seq += 1
+                    with writer(f, compression) as stream:
+                        pickle.dump((self.__seq, key, value), stream)
+                f.flush()
+                os.fsync(f.fileno())
+                self.__offset = f.tell()
+            self._count_written(self.__offset - start)
+            self.__entries += len(keys)
+            self.__state = self.__stat()
+            if self.__entries >= self.__compact_every:
+                self.__compact(data)
+
+    def refresh(self):
+        """
+        Get the changes other processes made since the last load or refresh. Only
+        the new part of the journal is read, unless the journal was compacted
+        meanwhile and everything has to be loaded again.
+
+        :return: None if nothing changed, otherwise a tuple of the new full data
+            (or None) and a list of changed (key, value) pairs.
+        """
+        if self.__stat() == self.__state and not self.__unseen \
+                and self.__reloaded is None:
+            return None
+        with self.__lock.shared():
+            self.__catch_up()
+            data, self.__reloaded = self.__reloaded, None
+            updates, self.__unseen = self.__unseen, {}
+        if data is not None:
+            for key, value in updates.items():
+                self.__apply(data, key, value)
+            return data, []
+        return (None, list(updates.items())) if updates else None
+
+    def __stat(self):
+        """
+        Get the identity of the snapshot file and the journal. A compaction
+        replaces both files and so changes everything but the journal size.
+        """
+        state = []
+        for path in (self.__path, self.__journal_path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                state.append(None)
+                continue
+            state.append((stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                         if path == self.__path else (stat.st_ino, stat.st_size))
+        return tuple(state)
+
+    def __catch_up(self):
+        """
+        Collect the changes other processes persisted after our position.
+        """
+        state = self.__stat()
+        if state == self.__state:
+            return
+        if self.__state is None or state[0] != self.__state[0] or \
+                state[1] is None or self.__state[1] is None or \
+                state[1][0] != self.__state[1][0]:
+            # The files were replaced: only a full load gives the current data
+            self.__reloaded = self.__load()
+            self.__unseen = {}
+            return
+        for seq, key, value in self.__read_entries():
+            self.__unseen[key] = value
+        self.__state = self.__stat()
+
+    def __load(self):
+        try:
+            f = open(self.__path, "rb")
+        except OSError:
+            data = {}
+        else:
+            with f, reader(f) as stream:
+                data = pickle.load(stream)
+        self.__seq = 0
+        self.__entries = 0
+        self.__offset = 0
+        self.__state = self.__stat()
+        for seq, key, value in self.__read_entries():
+            self.__apply(data, key, value)
+        return data
+
+    def __read_entries(self):
+        try:
+            f = open(self.__journal_path, "rb")
+        except OSError:
+            return
+        with f:
+            f.seek(self.__offset)
+            stream = reader(f)
+            while True:
+                try:
+                    entry = pickle.load(stream)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                # Compressed entries are read ahead, so the position is only
+                # known for sure once the whole journal is read
+                self.__offset = f.tell() if stream is f else os.fstat(f.fileno()).st_size
+                if entry[0] == "journal":
+                    self.__seq = entry[1]
+                    continue
+                self.__seq = entry[0]
+                self.__entries += 1
+                yield entry
+
+    @staticmethod
+    def __apply(data, key, value):
+        if value is None:
+            data.pop(key, None)
+        else:
+            data[key] = value
+
+    def __compact(self, data):
+        """
+        Write the current data as the new snapshot and start an empty journal.
+        Both files are replaced atomically.
+        """
+        if self.__reloaded is not None:
+            merged = dict(self.__reloaded)
+        else:
+            merged = dict(data.items())
+        for key, value in self.__unseen.items():
+            self.__apply(merged, key, value)
+        self.__replace(self.__path, merged)
+        self.__replace(self.__journal_path, ("journal", self.__seq))
+        self.__entries = 0
+        self.__state = self.__stat()
+        self.__offset = self.__state[1][1]
+
+    def __replace(self, path, obj):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            with writer(f, self.compression) as stream:
+                pickle.dump(obj, stream)
+            f.flush()
+            os.fsync(f.fileno())
+            self._count_written(f.tell())
+        os.replace(temp_path, path)
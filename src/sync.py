@@ -0,0 +1,245 @@
+"""
+This module synchronizes two replicas of a book by exchanging hashes.
+
+Every value of a book has a content hash, and the hashes are arranged in a
+Merkle-style tree: the leaves group the keys by the first hex digits of the hash
+of the key, and every node hashes its children. Two replicas compare their roots,
+then only the children of the nodes that differ, down to the leaves, so replicas
+that differ in a few values exchange a few hashes per level and then transfer
+only the values that differ.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from dedupe import merge
+
+# The levels below the root, so 4096 leaves
+DEPTH = 3
+_DIGITS = "0123456789abcdef"
+
+
+def digest(data):
+    """
+    Get the hash of some bytes.
+
+    :param data: The bytes.
+    :return: A hex string.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def content_hash(fields):
+    """
+    Get the hash of the fields of a value, the same in every process.
+
+    :param fields: A dict of field names to JSON-friendly values.
+    :return: A hex string.
+    """
+    return digest(json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class MerkleTree:
+    """
+    The content hashes of the values of a book, arranged in a tree of 16-way nodes.
+
+    Like the indexes of the books, the tree is built on first use and then
+    maintained on every change. The hashes of the nodes above a changed value are
+    dropped and computed again when they are asked for.
+    """
+
+    def __init__(self, fields_of):
+        """
+        Initialize the MerkleTree without building it.
+
+        :param fields_of: A function giving the fields of a value of the book.
+        """
+        self.__fields_of = fields_of
+        self.__depth = DEPTH
+        self.__leaves = None
+        self.__counts = {}
+        self.__nodes = {}
+
+    def build(self, data):
+        """
+        Build the tree if it was not built yet.
+
+        :param data: The mapping of keys to values to hash.
+        """
+        if self.__leaves is not None:
+            return
+        self.__leaves = {}
+        for key, value in data.items():
+            self.__add(key, value)
+
+    def update(self, key, value):
+        """
+        Rehash a key after its value was set or deleted.
+
+        :param key: The key of the value.
+        :param value: The new value, or None if it was deleted.
+        """
+        if self.__leaves is None:
+            return
+        leaf = self.__leaf_of(key)
+        entries = self.__leaves.get(leaf)
+        if entries is not None and key in entries:
+            del entries[key]
+            for length in range(self.__depth + 1):
+                self.__counts[leaf[:length]] -= 1
+            self.__drop(leaf)
+        if value is not None:
+            self.__add(key, value)
+
+    def clear(self):
+        """
+        Drop the tree, e.g. after the whole data was replaced.
+        """
+        self.__leaves = None
+        self.__counts = {}
+        self.__nodes = {}
+
+    def hash(self, prefix=""):
+        """
+        Get the hash of a node.
+
+        :param prefix: The hex digits leading from the root to the node, empty for
+            the root.
+        :return: A hex string, empty for a node without values.
+        """
+        if not self.__counts.get(prefix):
+            return ""
+        node = self.__nodes.get(prefix)
+        if node is None:
+            if len(prefix) == self.__depth:
+                entries = sorted(self.__leaves[prefix].items())
+                node = digest(json.dumps(entries, ensure_ascii=False).encode("utf-8"))
+            else:
+                node = digest("".join(self.hash(prefix + digit) for digit in _DIGITS).encode())
+            self.__nodes[prefix] = node
+        return node
+
+    def entries(self, prefix):
+        """
+        Get the content hashes of the values in a leaf.
+
+        :param prefix: The hex digits of the leaf.
+        :return: A dict of keys to content hashes.
+        """
+        return dict(self.__leaves.get(prefix, {}))
+
+    def __leaf_of(self, key):
+        return digest(str(key).encode("utf-8"))[:self.__depth]
+
+    def __add(self, key, value):
+        leaf = self.__leaf_of(key)
+        self.__leaves.setdefault(leaf, {})[key] = content_hash(self.__fields_of(value))
+        for length in range(self.__depth + 1):
+            self.__counts[leaf[:length]] = self.__counts.get(leaf[:length], 0) + 1
+        self.__drop(leaf)
+
+    def __drop(self, leaf):
+        for length in range(self.__depth + 1):
+            self.__nodes.pop(leaf[:length], None)
+
+
+def resolve(key, left, right):
+    """
+    Choose the value both replicas keep when they changed the same key: the note
+    changed last, or the contact records merged into one.
+
+    :param key: The key of the value.
+    :param left: The value of the left replica.
+    :param right: The value of the right replica.
+    :return: The value to keep.
+    """
+    if hasattr(left, "modify_date"):
+        return right if right.modify_date > left.modify_date else left
+    return merge([left, right])
+
+
+def sync(left, right, resolve=resolve):
+    """
+    Make two books equal. Values only one of them has are copied to the other,
+    and values both have but that differ are resolved; deletions are not
+    propagated, as a replica cannot tell a deleted value from one it never had.
+
+    :param left: A book.
+    :param right: Another book of the same kind.
+    :param resolve: A function choosing the value to keep from two different ones.
+    :return: A dict with the number of hashes exchanged, of the values sent each
+        way and of the values resolved.
+    """
+    stats = {"hashes": 0, "to_left": 0, "to_right": 0, "resolved": 0}
+    frontier = [""]
+    while True:
+        left_hashes, right_hashes = left.merkle_hashes(frontier), right.merkle_hashes(frontier)
+        stats["hashes"] += len(left_hashes) + len(right_hashes)
+        frontier = [prefix for prefix in frontier if left_hashes[prefix] != right_hashes[prefix]]
+        if not frontier or len(frontier[0]) == DEPTH:
+            break
+        frontier = [prefix + digit for prefix in frontier for digit in _DIGITS]
+    if not frontier:
+        return stats
+
+    left_entries, right_entries = left.merkle_entries(frontier), right.merkle_entries(frontier)
+    stats["hashes"] += len(left_entries) + len(right_entries)
+    to_right = [key for key in left_entries if key not in right_entries]
+    to_left = [key for key in right_entries if key not in left_entries]
+    conflicts = [key for key in left_entries
+                 if key in right_entries and left_entries[key] != right_entries[key]]
+
+    # Values travel pickled, as they would between machines
+    left_values = pickle.loads(pickle.dumps(left.get_many(to_right + conflicts)))
+    right_values = pickle.loads(pickle.dumps(right.get_many(to_left + conflicts)))
+    left_changes = {key: right_values[key] for key in to_left}
+    right_changes = {key: left_values[key] for key in to_right}
+    for key in conflicts:
+        value = resolve(key, left_values[key], right_values[key])
+        if value is not left_values[key]:
+            left_changes[key] = value
+        if value is not right_values[key]:
+            right_changes[key] = value.copy() if key in left_changes else value
+    left.put_many(left_changes)
+    right.put_many(right_changes)
+    stats.update(to_left=len(to_left), to_right=len(to_right), resolved=len(conflicts))
+    return stats
+
+
+def open_books(directory):
+    """
+    Open the books of a store directory, laid out like the home directory: the
+    address book in addressbook.pkl and the notes book in notesbook.pkl or its
+    shards.
+
+    :param directory: The store directory.
+    :return: A dict with the 'addressbook' and the 'notesbook'.
+    """
+    from repository import AddressBook, NotesBook, create_saver
+
+    os.makedirs(directory, exist_ok=True)
+    return {
+        "addressbook": AddressBook(create_saver(
+            os.path.join(directory, "addressbook.pkl"),
+            snapshot_path=os.path.join(directory, "addressbook.snap"))),
+        "notesbook": NotesBook(create_saver(
+            os.path.join(directory, "notesbook.pkl"),
+            shard_directory=os.path.join(directory, "notesbook"))),
+    }
+
+
+def sync_directories(left, right):
+    """
+    Synchronize the books stored in two directories.
+
+    :param left: A store directory, see `open_books`.
+    :param right: Another store directory.
+    :return: A dict of book names to the stats of `sync`.
+    """
+    left_books, right_books = open_books(left), open_books(right)
+    try:
+        return {name: sync(left_books[name], right_books[name]) for name in left_books}
+    finally:
+        for book in list(left_books.values()) + list(right_books.values()):
+            book.close()
@@ -0,0 +1,184 @@
+"""
+This module provides a full-text index over the notes of a notes book, ranked with
+BM25. The index keeps a posting list per term with the term frequency in each note,
+the length of each note and the total length of all notes, so that adding, changing
+or deleting a note only touches the postings of its own terms. Searches for the top
+results skip the notes that cannot make it with MaxScore pruning.
+"""
+
+import heapq
+import math
+import re
+from collections import Counter
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Split a text into lower-cased words.
+
+    :param text: The text.
+    :return: A list of words.
+    """
+    return _WORD.findall(text.lower())
+
+
+class TextIndex:
+    """
+    An inverted index of note texts, ranking notes by BM25.
+
+    Like RecordIndexes, the index is built from the data on the first search and
+    is then maintained on every change. The terms indexed for each key are kept,
+    so that a note changed in place can still be removed from the postings.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        """
+        Initialize the TextIndex without building it.
+        """
+        self.__built = False
+        self.__postings = {}
+        self.__terms = {}
+        self.__lengths = {}
+        self.__total_length = 0
+        # The highest frequency of each term in a note. It is not lowered when the
+        # note goes, so it stays an upper bound
+        self.__max_frequency = {}
+
+    def __len__(self):
+        return len(self.__lengths)
+
+    def build(self, data):
+        """
+        Build the index if it was not built yet.
+
+        :param data: The mapping of keys to notes to build the index from.
+        """
+        if self.__built:
+            return
+        self.__built = True
+        for key, note in data.items():
+            self.__add(key, note)
+
+    def update(self, key, note):
+        """
+        Reindex a key after its note was set or deleted.
+
+        :param key: The key of the note.
+        :param note: The new note, or None if it was deleted.
+        """
+        if not self.__built:
+            return
+        self.__remove(key)
+        if note is not None:
+            self.__add(key, note)
+
+    def clear(self):
+        """
+        Drop the index, e.g. after the whole data was replaced.
+        """
+        self.__built = False
+        self.__postings = {}
+        self.__terms = {}
+        self.__lengths = {}
+        self.__total_length = 0
+        self.__max_frequency = {}
+
+    def document_frequency(self, term):
+        """
+        Get the number of notes containing a term.
+
+        :param term: The lower-cased term.
+        :return: The number of notes.
+        """
+        return len(self.__postings.get(term, ()))
+
+    def search(self, text, limit=10):
+        """
+        Find the notes most relevant to a text.
+
+        Only the posting lists of the words of the text are read, with MaxScore
+        pruning: every word has an upper bound of the score it adds to a note, and
+        the lists are read from the highest bound down. Once the bounds of the
+        lists left add up to less than the score of the last of the current top
+        results, the notes only found in them cannot make it and are never looked
+        at. The words a note is scored for are looked up in their lists, and its
+        scoring stops as soon as it cannot make it either.
+
+        :param text: The words to look for.
+        :param limit: The maximum number of results.
+        :return: A list of (key, score) pairs, the most relevant first.
+        """
+        if not self.__lengths or limit <= 0:
+            return []
+        count = len(self.__lengths)
+        average_length = self.__total_length / count or 1
+        lengths = self.__lengths
+        k1, b = self.K1, self.B
+        terms = []
+        for term in set(tokenize(text)):
+            postings = self.__postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            # The score grows with the frequency and falls with the length of the note
+            frequency = self.__max_frequency[term]
+            bound = idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b))
+            terms.append((bound, idf, postings))
+        terms.sort(key=lambda term: term[0])
+        # bounds[i] is the highest score of a note found in the first i lists only
+        bounds = [0.0]
+        for bound, _, _ in terms:
+            bounds.append(bounds[-1] + bound)
+
+        heap = []
+        seen = set()
+        for position in range(len(terms) - 1, -1, -1):
+            threshold = heap[0][0] if len(heap) == limit else 0.0
+            if bounds[position + 1] <= threshold:
+                break
+            for key, frequency in terms[position][2].items():
+                if key in seen:
+                    continue
+                # A note first found in this list is not in the lists read before
+                seen.add(key)
+                norm = k1 * (1 - b + b * lengths[key] / average_length)
+                score = terms[position][1] * frequency * (k1 + 1) / (frequency + norm)
+                for other in range(position - 1, -1, -1):
+                    if score + bounds[other + 1] <= threshold:
+                        break
+                    _, idf, postings = terms[other]
+                    frequency = postings.get(key)
+                    if frequency:
+                        score += idf * frequency * (k1 + 1) / (frequency + norm)
+                else:
+                    if len(heap) < limit:
+                        heapq.heappush(heap, (score, key))
+                    elif score > threshold:
+                        heapq.heapreplace(heap, (score, key))
+                    threshold = heap[0][0] if len(heap) == limit else 0.0
+        return [(key, score) for score, key in sorted(heap, key=lambda item: -item[0])]
+
+    def __add(self, key, note):
+        words = tokenize(note.text)
+        frequencies = Counter(words)
+        for term, frequency in frequencies.items():
+            self.__postings.setdefault(term, {})[key] = frequency
+            if frequency > self.__max_frequency.get(term, 0):
+                self.__max_frequency[term] = frequency
+        self.__terms[key] = tuple(frequencies)
+        self.__lengths[key] = len(words)
+        self.__total_length += len(words)
+
+    def __remove(self, key):
+        for term in self.__terms.pop(key, ()):
+            postings = self.__postings[term]
+            del postings[key]
+            if not postings:
+                del self.__postings[term]
+                del self.__max_frequency[term]
+        self.__total_length -= self.__lengths.pop(key, 0)
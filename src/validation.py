@@ -5,6 +5,11 @@ This module provides the `Validation` class, which includes methods for validati
 such as phone numbers, email addresses, birthdays, names, addresses, note keys, and note tags. The class uses
 regular expressions to match the input against predefined patterns.
 
+The patterns are compiled once, and `validate_batch` validates a whole column of
+values, returning a mask of the valid values and their normalized forms;
+`normalize_batch` normalizes a column without validating it, e.g. the stored
+phones of all contacts when looking for duplicates.
+
 Classes:
     - Validation: A class that provides methods for validating different types of input data.
 
@@ -14,8 +19,34 @@ Example usage:
         print("Valid phone number")
     else:
         print("Invalid phone number")
+
+    mask, phones = validator.validate_batch("phone", ["+38 050 123 45 67", "123"])
+    # mask == [True, False], phones == ["+380501234567", None]
 """
 import re
+from datetime import date
+
+_NOT_DIGIT = re.compile(r"\D")
+
+
+def normalize_phone(phone):
+    """
+    Get the canonical form of a phone number: +38 and ten digits without separators.
+
+    :param phone: The phone number as typed.
+    :return: The canonical phone number.
+    """
+    digits = _NOT_DIGIT.sub("", phone)
+    if len(digits) == 10 and digits.startswith("0"):
+        digits = "38" + digits
+    return "+" + digits
+
+
+# How the values of a kind are normalized by `validate_batch` and `normalize_batch`
+_NORMALIZE = {
+    "phone": normalize_phone,
+    "email": lambda email: email.strip().lower(),
+}
 
 
 class Validation:
@@ -27,49 +58,98 @@ class Validation:
     NotesKeyPattern = r"^[A-Za-z0-9_-]+$"
     NotesTagPattern = r"^[A-Za-z0-9_-]+$"
 
+    _Phone = re.compile(PhonePattern)
+    _Email = re.compile(EmailPattern)
+    _Birthday = re.compile(BirthdayPattern)
+    _Name = re.compile(NamePattern)
+    _Address = re.compile(AddressPattern)
+    _NotesKey = re.compile(NotesKeyPattern)
+    _NotesTag = re.compile(NotesTagPattern)
+    _Patterns = {"phone": _Phone, "email": _Email, "birthday": _Birthday, "name": _Name,
+                 "address": _Address, "key": _NotesKey, "tag": _NotesTag}
+
     def validate_phone(self, phone):
-        match = re.match(self.PhonePattern, phone)
-        if match:
-            return True
-        return False
+        return self._Phone.match(phone) is not None
 
     def validate_email(self, email):
-        match = re.match(self.EmailPattern, email)
-        if match:
-            return True
-        return False
+        return self._Email.match(email) is not None
 
     def validate_birthday(self, birthday):
-        match = re.match(self.BirthdayPattern, birthday)
-        if match:
-            return True
-        return False
+        return self._Birthday.match(birthday) is not None
 
     def validate_name(self, name):
-        match = re.match(self.NamePattern, name)
-        if match:
-            return True
-        return False
+        return self._Name.match(name) is not None
 
     def validate_address(self, address):
-        match = re.match(self.AddressPattern, address)
-        if match:
-            return True
-        return False
+        return self._Address.match(address) is not None
 
     def validate_key(self, key):
-        match = re.match(self.NotesKeyPattern, key)
-        if match:
-            return True
-        return False
+        return self._NotesKey.match(key) is not None
 
     def validate_text(self, text):
-        if len(text) > 0:
-            return True
-        return False
+        return len(text) > 0
 
     def validate_tag(self, tag):
-        match = re.match(self.NotesTagPattern, tag)
-        if match:
-            return True
-        return False
+        return self._NotesTag.match(tag) is not None
+
+    def validate_batch(self, kind, values):
+        """
+        Validate a column of values at once, e.g. the fields of imported contacts.
+
+        :param kind: 'phone', 'email', 'birthday', 'name', 'address', 'key', 'text'
+            or 'tag'.
+        :param values: A list of strings.
+        :return: A tuple of a list of booleans telling which values are valid and a
+            list of their normalized forms, None for the invalid ones: phones as
+            '+' and their digits, emails lower-cased, birthdays as dates (so
+            dates like 31.02.2000 are invalid), the other values unchanged.
+        :raise ValueError: If the kind is unknown.
+        """
+        if kind == "text":
+            normalized = [value or None for value in values]
+        elif kind in self._Patterns:
+            match = self._Patterns[kind].match
+            # Like the validate_* methods, a value may end with a line break, which
+            # is dropped
+            normalized = self.normalize_batch(
+                kind, [value.rstrip("\n") if match(value) else None for value in values])
+        else:
+            raise ValueError(f"Unknown kind of value: {kind}")
+        return [value is not None for value in normalized], normalized
+
+    def normalize_batch(self, kind, values):
+        """
+        Normalize a column of values without validating them, the way
+        `validate_batch` normalizes the valid ones.
+
+        :param kind: One of the kinds of `validate_batch`.
+        :param values: A list of strings, or None for missing values.
+        :return: The list of normalized values, None for the missing ones and
+            for birthdays that are not dates.
+        """
+        if kind == "birthday":
+            # Birthdays repeat a lot in a column, so every distinct one is parsed once
+            dates = {birthday: _parse_birthday(birthday) for birthday in set(values)}
+            return [dates[birthday] for birthday in values]
+        if kind in _NORMALIZE:
+            normalize = _NORMALIZE[kind]
+            return [normalize(value) if value is not None else None for value in values]
+        return list(values)
+
+    def validate_columns(self, columns):
+        """
+        Validate several columns of values at once.
+
+        :param columns: A dict of kinds to lists of strings, see `validate_batch`.
+        :return: A dict of kinds to (mask, normalized values) tuples.
+        """
+        return {kind: self.validate_batch(kind, values) for kind, values in columns.items()}
+
+
+def _parse_birthday(birthday):
+    if birthday is None:
+        return None
+    try:
+        return date(int(birthday[6:]), int(birthday[3:5]), int(birthday[:2]))
+    except ValueError:
+        return None
@@ -0,0 +1,68 @@
+"""test suit for the aggregate counters"""
+# flake8: noqa
+import conftest
+import unittest
+from collections import Counter
+from datetime import datetime
+from unittest.mock import MagicMock
+from aggregates import Aggregates, NOTE_AGGREGATES, summary_report
+from constants import Paths
+from models import Note, Record
+from repository import AddressBook, NotesBook, Saver
+
+
+def make_record(name, email=None, birthday=None, phones=1):
+    record = Record(name)
+    for number in range(phones):
+        record.add_phone(f"+38098117192{number}")
+    if email:
+        record.email = email
+    if birthday:
+        record.birthday = birthday
+    return record
+
+
+class TestAggregates(unittest.TestCase):
+
+    def setUp(self):
+        self.saver = Saver(Paths.addressbook_file)
+        self.saver.load = MagicMock(side_effect=dict)
+        self.saver.save = MagicMock()
+
+    def test_counts_follow_changes(self):
+        book = AddressBook(self.saver)
+        book.add_record("John", make_record("John", "john@example.com", "01.03.1990"))
+        self.assertEqual(book.summary()["domain"], Counter({"example.com": 1}))
+        book.add_record("Jane", make_record("Jane", "jane@example.com", "05.03.1991", phones=2))
+        record = book.find_by_name("John")
+        record.email = "john@other.org"
+        book.update_record("John", record)
+        summary = book.summary()
+        self.assertEqual(summary["total"], 2)
+        self.assertEqual(summary["domain"], Counter({"example.com": 1, "other.org": 1}))
+        self.assertEqual(summary["month"], Counter({3: 2}))
+        self.assertEqual(summary["phones"], Counter({1: 1, 2: 1}))
+        book.delete_record("Jane")
+        self.assertEqual(book.summary()["domain"], Counter({"other.org": 1}))
+
+    def test_tags_are_counted_once_per_note(self):
+        aggregates = Aggregates(NOTE_AGGREGATES)
+        note = Note("a", "text", datetime(2024, 1, 1))
+        note.tags = ["work", "work", "home"]
+        aggregates.build({"a": note})
+        self.assertEqual(aggregates.counters()["tag"], Counter({"work": 1, "home": 1}))
+        aggregates.update("a", None)
+        self.assertEqual(aggregates.counters()["tag"], Counter())
+
+    def test_report(self):
+        contacts = AddressBook(self.saver)
+        contacts.add_record("John", make_record("John", "john@example.com", "01.03.1990"))
+        report = summary_report(contacts.summary(), NotesBook(self.saver).summary())
+        self.assertIn("contacts: 1", report)
+        self.assertIn("example.com: 1", report)
+        self.assertIn("Mar: 1", report)
+        self.assertIn("tags: none", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
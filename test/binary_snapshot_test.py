@@ -0,0 +1,111 @@
+"""test suit for the binary snapshot format"""
+# flake8: noqa
+import conftest
+import os
+import tempfile
+import unittest
+from repository import AddressBook, Saver
+from binary_snapshot import BinarySaver, MappedRecords, OverlayData, write_snapshot
+from models import Record
+
+
+def make_record(name, phone, email=None, birthday=None):
+    record = Record(name)
+    record.add_phone(phone)
+    if email:
+        record.email = email
+    if birthday:
+        record.birthday = birthday
+    return record
+
+
+class TestBinarySnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "addressbook.snap")
+        self.legacy = os.path.join(self.directory.name, "addressbook.pkl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records_are_decoded_from_mapped_snapshot(self):
+        write_snapshot(self.path, {
+            "John": make_record("John", "+380981171922", "john@example.com", "01.01.2000"),
+            "Jane": make_record("Jane", "+380987654321"),
+        })
+        records = MappedRecords(self.path)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(list(records), ["Jane", "John"])
+        self.assertNotIn("Jack", records)
+        john = records["John"]
+        self.assertEqual(john.email.value, "john@example.com")
+        self.assertEqual(john.birthday.value, "01.01.2000")
+        self.assertTrue(john.has_phone("+380981171922"))
+
+    def test_indexes_find_keys(self):
+        write_snapshot(self.path, {
+            "John": make_record("John", "+380981171922", "same@example.com"),
+            "Jane": make_record("Jane", "+380987654321", "same@example.com"),
+        })
+        records = MappedRecords(self.path)
+        self.assertEqual(records.find_keys("phone", "+380987654321"), ["Jane"])
+        self.assertEqual(sorted(records.find_keys("email", "same@example.com")),
+                         ["Jane", "John"])
+        self.assertEqual(records.find_keys("birthday", "01.01.2000"), [])
+        self.assertIsNone(records.find_keys("address", "Main St"))
+
+    def test_overlay_keeps_changes_on_top_of_base(self):
+        write_snapshot(self.path, {"John": make_record("John", "+380981171922")})
+        data = OverlayData(MappedRecords(self.path))
+        data["Jane"] = make_record("Jane", "+380981171922")
+        copy = data.copy()
+        del data["John"]
+        self.assertEqual(list(data), ["Jane"])
+        self.assertEqual(len(copy), 2)
+        self.assertEqual(data.find_keys("phone", "+380981171922"), ["Jane"])
+
+    def test_book_survives_reload_and_compaction(self):
+        addressbook = AddressBook(BinarySaver(self.path, compact_every=3))
+        for name in ("John", "Jane", "Jack", "Jill"):
+            addressbook.add_record(name, make_record(name, "+380981171922"))
+        addressbook.delete_record("Jack")
+        record = addressbook.find_by_name("Jill")
+        record.email = "jill@example.com"
+        addressbook.update_record("Jill", record)
+        reloaded = AddressBook(BinarySaver(self.path, compact_every=3))
+        self.assertEqual(sorted(reloaded), ["Jane", "Jill", "John"])
+        self.assertEqual(str(reloaded.find("email", "jill@example.com").name),
+                         "Name: Jill")
+
+    def test_batch_changes_are_journaled(self):
+        addressbook = AddressBook(BinarySaver(self.path, compact_every=10))
+        addressbook.add_record("John", make_record("John", "+380981171922"))
+        addressbook.put_many({"Jane": make_record("Jane", "+380987654321"), "John": None})
+        # Only the journal was written, no snapshot
+        self.assertFalse(os.path.exists(self.path))
+        reloaded = AddressBook(BinarySaver(self.path, compact_every=10))
+        self.assertEqual(list(reloaded), ["Jane"])
+
+    def test_compaction_rebases_the_overlay(self):
+        addressbook = AddressBook(BinarySaver(self.path, compact_every=3))
+        snapshot = addressbook.snapshot()
+        for name in ("John", "Jane"):
+            addressbook.add_record(name, make_record(name, "+380981171922"))
+        self.assertEqual(len(addressbook.data.resident()), 2)
+        addressbook.add_record("Jack", make_record("Jack", "+380981171922"))
+        self.assertEqual(addressbook.data.resident(), {})
+        self.assertEqual(sorted(addressbook), ["Jack", "Jane", "John"])
+        self.assertEqual(addressbook.find_by_name("Jane").name.value, "Jane")
+        self.assertEqual(len(snapshot), 0)
+
+    def test_legacy_file_is_migrated_on_first_save(self):
+        AddressBook(Saver(self.legacy)).add_record(
+            "John", make_record("John", "+380981171922"))
+        addressbook = AddressBook(BinarySaver(self.path, legacy_path=self.legacy))
+        addressbook.add_record("Jane", make_record("Jane", "+380987654321"))
+        self.assertEqual(list(MappedRecords(self.path)), ["Jane", "John"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""test suit for the result cache"""
+# flake8: noqa
+import conftest
+import unittest
+from cache import MISS, ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_miss_then_hit(self):
+        cache = ResultCache()
+        self.assertIs(cache.get("key", 1), MISS)
+        cache.put("key", 1, "result")
+        self.assertEqual(cache.get("key", 1), "result")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_new_generation_invalidates(self):
+        cache = ResultCache()
+        cache.put("key", (1, 2), "result")
+        self.assertIs(cache.get("key", (1, 3)), MISS)
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", 1, "a")
+        cache.put("b", 1, "b")
+        cache.get("a", 1)
+        cache.put("c", 1, "c")
+        self.assertEqual(cache.get("a", 1), "a")
+        self.assertIs(cache.get("b", 1), MISS)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_bytes_are_limited(self):
+        cache = ResultCache(max_bytes=3000)
+        cache.put("a", 1, "a" * 1000)
+        cache.put("b", 1, "b" * 1000)
+        cache.put("c", 1, "c" * 1000)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.size, 3000)
+        cache.put("d", 1, "d" * 5000)
+        self.assertIs(cache.get("d", 1), MISS)
+
+    def test_disabled(self):
+        cache = ResultCache(max_entries=0)
+        cache.put("key", 1, "result")
+        self.assertIs(cache.get("key", 1), MISS)
+
+    def test_clear(self):
+        cache = ResultCache()
+        cache.put("key", 1, ["result"])
+        self.assertGreater(cache.size, 0)
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
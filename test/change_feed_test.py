@@ -0,0 +1,84 @@
+"""test suit for the change feed"""
+# flake8: noqa
+import conftest
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+from change_feed import ChangeFeed, EventLog
+from constants import Paths
+from models import Note, Record
+from repository import AddressBook, NotesBook, Saver
+
+
+class TestChangeFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.saver = Saver(Paths.addressbook_file)
+        self.saver.load = MagicMock(side_effect=dict)
+        self.saver.save = MagicMock()
+        self.events = []
+
+    def test_events_of_a_book(self):
+        book = AddressBook(self.saver)
+        book.subscribe(self.events.append)
+        book.add_record("John", Record("John"))
+        record = book.find_by_name("John")
+        record.email = "john@example.com"
+        book.update_record("John", record)
+        book.update_record("John", record)
+        book.delete_record("John")
+        self.assertEqual([(e.seq, e.op, e.key) for e in self.events],
+                         [(1, "add", "John"), (2, "update", "John"), (3, "delete", "John")])
+        self.assertEqual(self.events[1].fields, {"email": "john@example.com"})
+        self.assertEqual(self.events[0].fields["phones"], ())
+
+    def test_books_share_a_sequence(self):
+        feed = ChangeFeed(seq=10)
+        contacts, notes = AddressBook(self.saver), NotesBook(self.saver)
+        contacts.attach_feed(feed, "addressbook")
+        notes.attach_feed(feed, "notesbook")
+        feed.subscribe(self.events.append)
+        contacts.add_record("John", Record("John"))
+        notes.add("a", Note("a", "text", datetime(2024, 1, 1)))
+        self.assertEqual([(e.seq, e.book) for e in self.events],
+                         [(11, "addressbook"), (12, "notesbook")])
+        feed.unsubscribe(self.events.append)
+        contacts.delete_record("John")
+        self.assertEqual(len(self.events), 2)
+        self.assertEqual(feed.seq, 13)
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log = EventLog(os.path.join(self.directory.name, "changes.jsonl"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_from_a_sequence_number(self):
+        self.assertEqual(self.log.last_seq(), 0)
+        self.assertEqual(list(self.log.read()), [])
+        feed = ChangeFeed()
+        feed.subscribe(self.log.append)
+        for number in range(1, 301):
+            feed.publish("addressbook", "add", f"Contact{number}", {"text": "x" * (number % 7)})
+        self.assertEqual(self.log.last_seq(), 300)
+        for since in (0, 1, 150, 299, 300):
+            with self.subTest(since=since):
+                self.assertEqual([event["seq"] for event in self.log.read(since)],
+                                 list(range(since + 1, 301)))
+
+    def test_a_torn_last_line_is_ignored(self):
+        self.log.append(ChangeFeed().publish("notesbook", "delete", "a", {}))
+        with open(self.log.path, "ab") as f:
+            f.write(b'{"seq": 2, "bo')
+        self.assertEqual(self.log.last_seq(), 1)
+        self.assertEqual([event["seq"] for event in self.log.read()], [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
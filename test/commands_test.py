@@ -1,6 +1,8 @@
 """test suit for commands"""
 # flake8: noqa
 import conftest
+import os
+import tempfile
 from datetime import datetime
 import unittest
 from unittest.mock import MagicMock
@@ -14,7 +16,7 @@ class TestCommand(unittest.TestCase):
 
     def setUp(self):
         self.saver = Saver(Paths.addressbook_file)
-        self.saver.load = MagicMock(return_value={})
+        self.saver.load = MagicMock(side_effect=dict)
         self.saver.save = MagicMock()
         command_service._addressbook = AddressBook(self.saver)
         command_service._notesbook = NotesBook(self.saver)
@@ -169,6 +171,14 @@ class TestCommand(unittest.TestCase):
         result = self.command_executor("find_contact", "John")
         self.assertIn("John", str(result))
 
+    def test_find_contact_by_name_is_cached_as_text(self):
+        self.command_executor("add_contact", "John", "+380981171922")
+        hits = command_service._cache.hits
+        first = self.command_executor("find_contact", "John")
+        self.assertIsInstance(first, str)
+        self.assertIs(self.command_executor("find_contact", "John"), first)
+        self.assertEqual(command_service._cache.hits, hits + 1)
+
     def test_find_contact_by_phone(self):
         self.command_executor("add_contact", "John", "+380981171922")
         result = self.command_executor("find_contact", "+380981171922")
@@ -202,6 +212,155 @@ class TestCommand(unittest.TestCase):
     def test_get_commands_is_not_empty(self):
         self.assertNotEqual(len(command_service.get_commands()), 0)
 
+    def test_query_contacts(self):
+        self.command_executor("add_contact", "John", "+380981171922", "john@example.com")
+        self.command_executor("add_contact", "Jane", "+380671171922", "jane@other.org")
+        result = self.command_executor("query_contacts", "domain=example.com", "OR", "phone^=+38067")
+        self.assertIn("John", result)
+        self.assertIn("Jane", result)
+        result = self.command_executor("query_contacts", "domain=example.org")
+        self.assertEqual(result, Messages.NoContactsMatch)
+
+    def test_query_contacts_with_wrong_query(self):
+        result = self.command_executor("query_contacts", "nickname=john")
+        self.assertIn(Messages.WrongQuery, result)
+        result = self.command_executor("query_contacts")
+        self.assertIn(Messages.QueryUsage, result)
+
+    def test_find_results_are_cached_until_a_change(self):
+        self.command_executor("add_note", "Shopping", "buy", "milk")
+        hits = command_service._cache.hits
+        first = self.command_executor("find_in_notes_text", "milk")
+        second = self.command_executor("find_in_notes_text", "milk")
+        self.assertIs(first, second)
+        self.assertEqual(command_service._cache.hits, hits + 1)
+        self.command_executor("add_note", "Recipe", "warm", "milk")
+        result = self.command_executor("find_in_notes_text", "milk")
+        self.assertIn("Recipe", str(result))
+
+    def test_search_notes(self):
+        self.command_executor("add_note", "Shopping", "buy", "milk", "and", "bread")
+        self.command_executor("add_note", "Milk", "milk", "milk", "milk")
+        result = self.command_executor("search_notes", "milk")
+        self.assertLess(result.index("Key: Milk"), result.index("Key: Shopping"))
+        self.assertEqual(self.command_executor("search_notes", "tea"), Messages.NotesListEmpty)
+        self.assertIn(Messages.SearchNotesUsage, self.command_executor("search_notes"))
+
+    def test_notes_by_date(self):
+        self.command_executor("add_note", "Old", "first")
+        self.command_executor("add_note", "New", "second")
+        today = datetime.now().strftime("%d.%m.%Y")
+        result = self.command_executor("notes_between", today, today)
+        self.assertIn("Key: Old", result)
+        self.assertIn("Key: New", result)
+        result = self.command_executor("notes_between", "01.01.2000", "31.12.2000")
+        self.assertEqual(result, Messages.NotesListEmpty)
+        self.command_executor("update_note", "Old", "changed")
+        result = self.command_executor("latest_notes", "1")
+        self.assertIn("Key: Old", result)
+        self.assertNotIn("Key: New", result)
+        self.assertIn(Messages.NotesBetweenUsage, self.command_executor("notes_between", "yesterday", today))
+        self.assertIn(Messages.LatestNotesUsage, self.command_executor("latest_notes", "1", "updated"))
+
+    def test_birthday_reminders(self):
+        self.assertIsNone(command_service.birthday_reminders())
+        self.command_executor("add_contact", "John", "+380981171922", "john@example.com", "23 Main St",
+                              datetime.now().strftime("%d.%m.2000"))
+        result = command_service.birthday_reminders()
+        self.assertIn(Messages.BirthdayReminder, result)
+        self.assertIn("John", result)
+        self.assertIsNone(command_service.birthday_reminders())
+
+    def test_dedupe(self):
+        self.assertEqual(self.command_executor("dedupe"), Messages.NoDuplicates)
+        self.command_executor("add_contact", "John", "+380981171922")
+        self.command_executor("add_contact", "Jon", "+380981171922")
+        result = self.command_executor("dedupe")
+        self.assertIn("John, Jon (same name, phone)", result)
+        self.assertIn(Messages.DuplicatesPreview, result)
+        result = self.command_executor("dedupe", "apply")
+        self.assertIn(Messages.DuplicatesMerged, result)
+        self.assertEqual(self.command_executor("dedupe"), Messages.NoDuplicates)
+        self.assertIn(Messages.DedupeUsage, self.command_executor("dedupe", "now"))
+
+    def test_summary(self):
+        self.command_executor("add_contact", "John", "+380981171922", "john@example.com")
+        result = self.command_executor("summary")
+        self.assertIn("example.com: 1", result)
+        self.assertIn(Messages.SummaryUsage, self.command_executor("summary", "all"))
+
+    def test_find_by_address(self):
+        self.command_executor("add_contact", "John", "+380981171922", "john@example.com", "23 Main St")
+        self.command_executor("add_contact", "Jane", "+380671171922", "jane@example.com", "5 Oak Ave")
+        result = self.command_executor("find_by_address", "main", "street")
+        self.assertIn("John", result)
+        self.assertNotIn("Jane", result)
+        self.command_executor("update_address", "Jane", "7 Main St")
+        self.assertIn("Jane", self.command_executor("find_by_address", "Main", "St"))
+        self.assertEqual(self.command_executor("find_by_address", "Lake"), Messages.NoContactsMatch)
+
+    def test_changes(self):
+        self.assertEqual(self.command_executor("changes"), Messages.ChangeLogDisabled)
+        with tempfile.TemporaryDirectory() as directory:
+            command_service.enable_change_log(os.path.join(directory, "changes.jsonl"))
+            try:
+                self.command_executor("add_contact", "John", "+380981171922")
+                self.command_executor("update_email", "John", "john@example.com")
+                self.command_executor("add_note", "Shopping", "milk")
+                result = self.command_executor("changes", "1")
+            finally:
+                command_service.disable_change_log()
+        self.assertEqual(result.splitlines(),
+                         ["2 update addressbook John: email", "3 add notesbook Shopping"])
+
+    def test_cache_stats(self):
+        self.command_executor("find_contact", "John")
+        result = self.command_executor("cache_stats")
+        self.assertIn(Messages.CacheStats, result)
+        self.assertIn("hit ratio", result)
+
+    def test_show_unsaved(self):
+        result = self.command_executor("show_unsaved")
+        self.assertIn(Messages.UnsavedChanges, result)
+
+    def test_stats_when_disabled(self):
+        result = self.command_executor("stats")
+        self.assertEqual(result, Messages.StatsDisabled)
+
+    def test_stats(self):
+        command_service.enable_metrics()
+        try:
+            self.command_executor("add_contact", "John", "+380981171922")
+            self.command_executor("find_contact", "John")
+            result = self.command_executor("stats")
+        finally:
+            command_service.disable_metrics()
+        self.assertIn("add_contact", result)
+        self.assertIn("find_contact", result)
+        self.assertIsInstance(command_service._addressbook, AddressBook)
+
+    def test_profiling(self):
+        with tempfile.TemporaryDirectory() as directory:
+            command_service.enable_profiling(directory, ["find_contact"])
+            try:
+                self.command_executor("add_contact", "John", "+380981171922")
+                result = self.command_executor("find_contact", "John")
+            finally:
+                command_service.disable_profiling()
+            self.assertIn("Name: John", result)
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ["find_contact-00001.prof", "find_contact-00001.txt"])
+
+    def test_mem_stats(self):
+        self.command_executor("add_contact", "John", "+380981171922")
+        result = self.command_executor("mem_stats")
+        self.assertIn("addressbook", result)
+        self.assertIn("phones", result)
+
+    def test_mem_stats_with_wrong_sample(self):
+        result = self.command_executor("mem_stats", "many")
+        self.assertIn(Messages.MemStatsUsage, result)
+
     def test_add_note_with_empty_key(self):
         result = self.command_executor("add_note", "")
         self.assertEqual(result, Messages.WrongKey)
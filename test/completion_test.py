@@ -0,0 +1,65 @@
+"""test suit for the completion of commands and arguments"""
+# flake8: noqa
+import conftest
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+import command_registry as command_service
+from completion import CommandCompleter
+from constants import Paths
+from models import Note, Record
+from repository import AddressBook, NotesBook, Saver
+
+
+class TestCompletion(unittest.TestCase):
+
+    def setUp(self):
+        self.saver = Saver(Paths.addressbook_file)
+        self.saver.load = MagicMock(side_effect=dict)
+        self.saver.save = MagicMock()
+        command_service._addressbook = AddressBook(self.saver)
+        command_service._notesbook = NotesBook(self.saver)
+        for name, phones in (("John", ["+380981171922", "+380671111111"]),
+                             ("Johanna", ["+380987654321"]), ("Bill", ["+380501234567"])):
+            record = Record(name)
+            for phone in phones:
+                record.add_phone(phone)
+            command_service._addressbook.add_record(name, record)
+        for key, tags in (("Plan", ["work", "week"]), ("plot", ["work"]), ("Shop", ["home"])):
+            note = Note(key, "text", datetime.now())
+            note.tags = tags
+            command_service._notesbook.add(key, note)
+
+    def complete(self, text):
+        completer = CommandCompleter(command_service.get_commands(),
+                                     command_service.complete_argument)
+        return [completion.text for completion in
+                completer.get_completions(Document(text), CompleteEvent())]
+
+    def test_commands(self):
+        self.assertIn("add_contact", self.complete("ad"))
+        self.assertNotIn("delete", self.complete("ad"))
+        self.assertIn("show_birthday", self.complete(""))
+
+    def test_contact_arguments(self):
+        self.assertEqual(self.complete("show_birthday jo"), ["Johanna", "John"])
+        self.assertEqual(self.complete("update_phone John "), ["+380671111111", "+380981171922"])
+        self.assertEqual(self.complete("update_phone Nobody +38098"),
+                         ["+380981171922", "+380987654321"])
+        self.assertEqual(self.complete("update_phone John +380981171922 "), [])
+
+    def test_note_arguments(self):
+        self.assertEqual(self.complete("delete_note p"), ["Plan", "plot"])
+        self.assertEqual(self.complete("find_note_by_tag w"), ["week", "work"])
+        self.assertEqual(self.complete("delete_tag plot "), ["work"])
+        self.assertEqual(self.complete("latest_notes 5 c"), ["created"])
+
+    def test_completions_follow_changes(self):
+        command_service._addressbook.delete_record("John")
+        self.assertEqual(self.complete("delete jo"), ["Johanna"])
+
+
+if __name__ == '__main__':
+    unittest.main()
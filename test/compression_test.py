@@ -0,0 +1,71 @@
+"""test suit for compressed storage"""
+# flake8: noqa
+import conftest
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from compression import detect
+from repository import AddressBook, NotesBook, Saver
+from binary_snapshot import BinarySaver
+from shared_storage import SharedSaver
+from sharded_storage import ShardedSaver
+from models import Note, Record
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "addressbook.pkl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_saver_detects_compression_on_load(self):
+        for compression in ("gzip", "lzma", None):
+            with self.subTest(compression=compression):
+                Saver(self.path, compression).save({"John": Record("John")})
+                self.assertEqual(detect(self.path), compression)
+                self.assertIn("John", Saver(self.path).load())
+
+    def test_compressed_data_is_smaller(self):
+        data = {f"Name{i}": Record(f"Name{i}") for i in range(200)}
+        Saver(self.path).save(data)
+        plain_size = os.path.getsize(self.path)
+        Saver(self.path, "lzma").save(data)
+        self.assertLess(os.path.getsize(self.path), plain_size)
+
+    def test_shared_saver_with_compressed_journal(self):
+        first = AddressBook(SharedSaver(self.path, compact_every=3, compression="gzip"))
+        second = AddressBook(SharedSaver(self.path, compression="gzip"))
+        first.add_record("John", Record("John"))
+        self.assertEqual(detect(self.path + ".journal"), "gzip")
+        second.refresh()
+        self.assertIn("John", second)
+        first.add_record("Jane", Record("Jane"))
+        first.add_record("Jack", Record("Jack"))
+        second.add_record("Jill", Record("Jill"))
+        first.refresh()
+        self.assertEqual(sorted(first), ["Jack", "Jane", "Jill", "John"])
+        self.assertEqual(detect(self.path), "gzip")
+
+    def test_binary_saver_with_compressed_journal(self):
+        snapshot = os.path.join(self.directory.name, "addressbook.snap")
+        addressbook = AddressBook(BinarySaver(snapshot, compression="lzma"))
+        addressbook.add_record("John", Record("John"))
+        addressbook.add_record("Jane", Record("Jane"))
+        self.assertEqual(detect(snapshot + ".journal"), "lzma")
+        reloaded = AddressBook(BinarySaver(snapshot))
+        self.assertEqual(sorted(reloaded), ["Jane", "John"])
+
+    def test_sharded_saver_with_compressed_shards(self):
+        directory = os.path.join(self.directory.name, "notesbook")
+        notesbook = NotesBook(ShardedSaver(directory, 2, blobs=True, compression="gzip"))
+        notesbook.add("key", Note("key", "text", datetime.now()))
+        reloaded = NotesBook(ShardedSaver(directory, 2, blobs=True))
+        self.assertEqual(reloaded.find_by_key("key").text, "text")
+
+
+if __name__ == '__main__':
+    unittest.main()
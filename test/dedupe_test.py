@@ -0,0 +1,74 @@
+"""test suit for the duplicate contact detection"""
+# flake8: noqa
+import conftest
+import unittest
+from unittest.mock import MagicMock
+from constants import Paths
+from dedupe import find_clusters, merge, normalize_phone, within_one_edit
+from models import Record
+from repository import AddressBook, Saver
+
+
+def make_record(name, phone=None, email=None, birthday=None):
+    record = Record(name)
+    if phone:
+        record.add_phone(phone)
+    if email:
+        record.email = email
+    if birthday:
+        record.birthday = birthday
+    return record
+
+
+class TestDedupe(unittest.TestCase):
+
+    def test_normalize_phone(self):
+        self.assertEqual(normalize_phone("+38 (098) 117-19-22"), "+380981171922")
+        self.assertEqual(normalize_phone("0981171922"), "+380981171922")
+
+    def test_within_one_edit(self):
+        self.assertTrue(within_one_edit("john", "jon"))
+        self.assertTrue(within_one_edit("john", "joan"))
+        self.assertTrue(within_one_edit("jon", "john"))
+        self.assertFalse(within_one_edit("john", "jane"))
+        self.assertFalse(within_one_edit("jo", "john"))
+
+    def test_clusters_are_linked_by_any_key(self):
+        records = {
+            "John": make_record("John", "+380981171922"),
+            "Johnny": make_record("Johnny", "380981171922", "J@Example.com"),
+            "Jack": make_record("Jack", "+380671111111", "j@example.com"),
+            "Jane": make_record("Jane", "+380672222222"),
+            "Janne": make_record("Janne"),
+            "Bob": make_record("Bob", "+380673333333"),
+        }
+        clusters = find_clusters(records)
+        self.assertEqual(clusters, [(["Jack", "John", "Johnny"], {"phone", "email"}),
+                                    (["Jane", "Janne"], {"name"})])
+
+    def test_merge_keeps_all_values(self):
+        merged = merge([make_record("Jon", "+380981171922"),
+                        make_record("John", "+380981171922", "john@example.com", "01.01.2000"),
+                        make_record("Johnny", "+380671111111")])
+        self.assertEqual(merged.name.value, "John")
+        self.assertEqual([phone.value for phone in merged.phones], ["+380981171922", "+380671111111"])
+        self.assertEqual(merged.email.value, "john@example.com")
+
+    def test_merge_duplicates_saves_once(self):
+        saver = Saver(Paths.addressbook_file)
+        saver.load = MagicMock(return_value={})
+        saver.save = MagicMock()
+        book = AddressBook(saver)
+        book.add_record("John", make_record("John", "+380981171922", "john@example.com"))
+        book.add_record("Jon", make_record("Jon", "+380671111111", "JOHN@example.com"))
+        saver.save.reset_mock()
+        merged = book.merge_duplicates()
+        self.assertEqual(saver.save.call_count, 1)
+        self.assertEqual([keys for keys, _ in merged], [["John", "Jon"]])
+        self.assertEqual(list(book), ["John"])
+        self.assertEqual(len(book.find_by_name("John").phones), 2)
+        self.assertEqual(book.find_duplicates(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""test suit for the disk storage with an LRU record cache"""
+# flake8: noqa
+import conftest
+import os
+import tempfile
+import unittest
+from disk_storage import DiskRecords, DiskSaver, RecordStore
+from models import Record
+from repository import AddressBook, Saver
+
+
+def make_record(name, phone="0501234567"):
+    record = Record(name)
+    record.add_phone(phone)
+    return record
+
+
+class TestDiskStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "addressbook.db")
+        self.legacy = os.path.join(self.directory.name, "addressbook.pkl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lru_evicts_and_writes_back(self):
+        store = RecordStore(self.path, cache_entries=2)
+        for name in ("Ann", "Bob", "Cid"):
+            store.set(name, make_record(name))
+        stats = store.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["writebacks"], 1)
+        self.assertEqual(store.get("Ann").name.value, "Ann")
+        store.get("Ann")
+        stats = store.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(len(store), 3)
+        store.delete("Bob")
+        self.assertFalse(store.contains("Bob"))
+        self.assertEqual([key for key, _ in store.scan()], ["Ann", "Cid"])
+        store.close()
+
+    def test_book_persists_with_bounded_memory(self):
+        book = AddressBook(DiskSaver(self.path, cache_entries=10, flush_every=1000))
+        for i in range(100):
+            book.add_record(f"Name{i:03}", make_record(f"Name{i:03}"))
+        self.assertEqual(book.pending_changes, 100)
+        self.assertEqual(len(book.data.resident()), 10)
+        book.close()
+
+        book = AddressBook(DiskSaver(self.path, cache_entries=10))
+        self.assertEqual(len(book), 100)
+        self.assertEqual(len(list(book.get_all())), 100)
+        # Scans do not fill the cache
+        self.assertEqual(len(book.data.resident()), 0)
+        self.assertEqual(book.find_by_name("Name042").name.value, "Name042")
+        self.assertEqual(len(book.query("phone=0501234567")), 100)
+        self.assertEqual(len(book.data.resident()), 10)
+        book.close()
+
+    def test_snapshot_keeps_values_of_its_version(self):
+        book = AddressBook(DiskSaver(self.path, cache_entries=2))
+        book.add_record("Ann", make_record("Ann"))
+        book.add_record("Bob", make_record("Bob"))
+        snapshot = book.snapshot()
+        record = book.find_by_name("Ann")
+        record.add_phone("0509999999")
+        book.update_record("Ann", record)
+        book.delete_record("Bob")
+        book.add_record("Cid", make_record("Cid"))
+        self.assertEqual(sorted(snapshot), ["Ann", "Bob"])
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(len(snapshot["Ann"].phones), 1)
+        self.assertEqual(sorted(book), ["Ann", "Cid"])
+        self.assertEqual(len(book.find_by_name("Ann").phones), 2)
+        self.assertIsInstance(book.data, DiskRecords)
+        book.close()
+
+    def test_reads_do_not_dirty_values(self):
+        book = AddressBook(DiskSaver(self.path, cache_entries=10))
+        book.add_record("Ann", make_record("Ann"))
+        book.flush()
+        self.assertEqual(book.get_record("Ann").name.value, "Ann")
+        self.assertEqual(book.find_by_name("Ann").name.value, "Ann")
+        self.assertEqual(book.data.stats()["dirty"], 0)
+        book.close()
+
+    def test_legacy_pickle_is_imported(self):
+        Saver(self.legacy).save({"Ann": make_record("Ann")})
+        book = AddressBook(DiskSaver(self.path, legacy_path=self.legacy))
+        self.assertEqual(list(book), ["Ann"])
+        book.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""test suit for the memory accounting"""
+# flake8: noqa
+import conftest
+import sys
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+from constants import Paths
+from memory import MemoryWalker, book_memory, format_size
+from repository import AddressBook, NotesBook, Saver
+from models import Note, Record
+
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.saver = Saver(Paths.addressbook_file)
+        self.saver.load = MagicMock(side_effect=dict)
+        self.saver.save = MagicMock()
+
+    def test_objects_are_counted_once(self):
+        walker = MemoryWalker()
+        text = "x" * 1000
+        self.assertGreater(walker.size([text, text]), sys.getsizeof(text))
+        self.assertEqual(walker.size(text), 0)
+
+    def test_equal_strings_are_reported_as_duplicated(self):
+        walker = MemoryWalker()
+        walker.size(["".join(["a"] * 100), "".join(["a"] * 100)])
+        self.assertEqual(walker.duplicated_strings, sys.getsizeof("a" * 100))
+
+    def test_address_book_fields(self):
+        addressbook = AddressBook(self.saver)
+        for number in range(10):
+            record = Record(f"Name{number}")
+            record.add_phone(f"+3809811719{number:02d}")
+            record.address = "Main street " * 10
+            addressbook.add_record(record.name.value, record)
+        stats = book_memory(addressbook)
+        self.assertEqual(stats["values"], 10)
+        self.assertGreater(stats["fields"]["address"], stats["fields"]["phones"] / 2)
+        self.assertGreater(stats["total"], sum(stats["fields"].values()))
+        sampled = book_memory(addressbook, sample=5)
+        self.assertAlmostEqual(sampled["total"], stats["total"], delta=stats["total"] * 0.2)
+
+    def test_notes_book_tags(self):
+        notesbook = NotesBook(self.saver)
+        note = Note("key", "text", datetime.now())
+        note.add_tag("tag")
+        notesbook.add("key", note)
+        stats = book_memory(notesbook)
+        self.assertIn("tags", stats["fields"])
+        self.assertIn("text", stats["fields"])
+
+    def test_format_size(self):
+        self.assertEqual(format_size(10), "10 B")
+        self.assertEqual(format_size(1536), "1.5 KiB")
+
+
+if __name__ == '__main__':
+    unittest.main()
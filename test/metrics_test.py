@@ -0,0 +1,91 @@
+"""test suit for the command metrics"""
+# flake8: noqa
+import conftest
+import json
+import os
+import tempfile
+import time
+import unittest
+from metrics import Histogram, Metrics, TimedProxy, TimedSaver
+from repository import AddressBook, Saver
+from models import Record
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_percentiles_are_close_to_exact_values(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value / 1000)
+        self.assertEqual(histogram.count, 1000)
+        for percent in (50, 95, 99):
+            self.assertAlmostEqual(histogram.percentile(percent), percent / 100,
+                                   delta=percent / 100 * 0.1)
+
+    def test_merge(self):
+        first, second = Histogram(), Histogram()
+        for value in range(1, 101):
+            (first if value % 2 else second).record(value / 1000)
+        first.merge(second)
+        self.assertEqual(first.count, 100)
+        self.assertAlmostEqual(first.percentile(50), 0.05, delta=0.005)
+        self.assertEqual(first.max, 0.1)
+
+    def test_empty_histogram(self):
+        self.assertEqual(Histogram().percentile(99), 0.0)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.metrics = Metrics()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_nested_phases_are_counted_once(self):
+        with self.metrics.command("add"):
+            with self.metrics.phase("repository"):
+                time.sleep(0.01)
+                with self.metrics.phase("save"):
+                    time.sleep(0.02)
+        command = self.metrics.to_dict()["commands"]["add"]
+        self.assertEqual(command["count"], 1)
+        self.assertGreaterEqual(command["phases"]["save"], 0.02)
+        self.assertLess(command["phases"]["repository"], 0.02)
+        self.assertGreaterEqual(command["max"], 0.03)
+
+    def test_failed_commands_are_counted(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.command("add"):
+                raise ValueError
+        self.assertEqual(self.metrics.to_dict()["commands"]["add"]["errors"], 1)
+
+    def test_saves_record_bytes_written(self):
+        path = os.path.join(self.directory.name, "addressbook.pkl")
+        addressbook = AddressBook(Saver(path))
+        addressbook.saver = TimedSaver(addressbook.saver, self.metrics)
+        book = TimedProxy(addressbook, self.metrics, "repository")
+        with self.metrics.command("add_contact"):
+            book.add_record("John", Record("John"))
+        stats = self.metrics.to_dict()
+        self.assertEqual(stats["saves"]["count"], 1)
+        self.assertEqual(stats["saves"]["bytes_written"], os.path.getsize(path))
+        self.assertEqual(stats["commands"]["add_contact"]["bytes_written"],
+                         os.path.getsize(path))
+        self.assertIn("John", book)
+
+    def test_statistics_are_dumped(self):
+        path = os.path.join(self.directory.name, "stats.json")
+        with self.metrics.command("add"):
+            pass
+        self.metrics.start_dumping(path, 0.01)
+        time.sleep(0.05)
+        self.metrics.stop_dumping()
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["commands"]["add"]["count"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
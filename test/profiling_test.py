@@ -0,0 +1,37 @@
+"""test suit for the command profiling"""
+# flake8: noqa
+import conftest
+import os
+import pstats
+import tempfile
+import unittest
+from profiling import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_selects_every_nth_call_of_chosen_commands(self):
+        profiler = Profiler(self.directory.name, ["find_contact"], every=2)
+        self.assertFalse(profiler.selects("add_contact"))
+        self.assertEqual([profiler.selects("find_contact") for _ in range(4)],
+                         [False, True, False, True])
+
+    def test_reports_are_written(self):
+        profiler = Profiler(self.directory.name, memory=True)
+        with profiler.profile("list_notesbook"):
+            texts = [str(number) * 100 for number in range(1000)]
+        names = sorted(os.listdir(self.directory.name))
+        self.assertEqual(names, ["list_notesbook-00001.prof", "list_notesbook-00001.txt"])
+        pstats.Stats(os.path.join(self.directory.name, names[0]))
+        with open(os.path.join(self.directory.name, names[1]), encoding="utf-8") as f:
+            self.assertIn("Top allocation sites", f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""test suit for the contact queries and indexes"""
+# flake8: noqa
+import conftest
+import unittest
+from unittest.mock import MagicMock, patch
+from constants import Paths
+from indexes import SortedIndex, TokenIndex, address_tokens, record_address_tokens
+from query import And, Not, Or, QuerySyntaxError, Term, parse
+from repository import AddressBook, Saver
+from models import Record
+
+
+def make_record(name, phone, email=None, birthday=None, address=None):
+    record = Record(name)
+    record.add_phone(phone)
+    if email:
+        record.email = email
+    if birthday:
+        record.birthday = birthday
+    if address:
+        record.address = address
+    return record
+
+
+class TestParse(unittest.TestCase):
+
+    def test_precedence(self):
+        query = parse("name=john OR domain=example.com month=mar AND NOT phone^=+38067")
+        self.assertIsInstance(query, Or)
+        self.assertIsInstance(query.children[1], And)
+        self.assertIsInstance(query.children[1].children[2], Not)
+
+    def test_values_are_normalized(self):
+        self.assertEqual(parse("email.domain=Example.COM").value, "example.com")
+        self.assertEqual(parse("birthday.month=March").value, 3)
+        self.assertEqual(parse("birthday=01.01.1990..31.12.1990").value,
+                         ("1990-01-01", "1990-12-31"))
+        self.assertEqual(parse('address~="Main St"').value, "main st")
+
+    def test_errors(self):
+        for text in ("", "nickname=john", "name", "(name=john", "month=13", "name=john OR"):
+            with self.subTest(text=text):
+                with self.assertRaises(QuerySyntaxError):
+                    parse(text)
+
+
+class TestSortedIndex(unittest.TestCase):
+
+    def test_lookups(self):
+        index = SortedIndex([("+380671", "a"), ("+380672", "b"), ("+380931", "c")])
+        index.add("d", "+380671")
+        index.remove("b", "+380672")
+        self.assertEqual(index.keys("=", "+380671"), {"a", "d"})
+        self.assertEqual(index.keys("^=", "+38067"), {"a", "d"})
+        self.assertEqual(index.count("..", ("+380670", "+380999")), 3)
+        self.assertEqual(index.keys(">", "+380671"), {"c"})
+
+    def test_ordered_entries(self):
+        index = SortedIndex([(3, "c"), (1, "a"), (2, "b")])
+        self.assertEqual(index.entries(">=", 2), [(2, "b"), (3, "c")])
+        self.assertEqual(index.last(2), [(3, "c"), (2, "b")])
+        self.assertEqual(index.last(0), [])
+
+    def test_distinct_entries(self):
+        index = SortedIndex([("work", "a"), ("work", "b"), ("wiki", "c"), ("home", "d")])
+        self.assertEqual(index.distinct("^=", "w", 10), [("wiki", "c"), ("work", "a")])
+        self.assertEqual(index.distinct("^=", "", 2), [("home", "d"), ("wiki", "c")])
+
+
+class TestAddressIndex(unittest.TestCase):
+
+    def test_address_tokens(self):
+        self.assertEqual(address_tokens("012 Main Street, Kyiv"), ["12", "main", "st", "kyiv"])
+
+    def test_lookups_intersect_words(self):
+        index = TokenIndex(record_address_tokens)
+        index.build({"John": make_record("John", "+380981171922", address="12 Main St, Kyiv"),
+                     "Jane": make_record("Jane", "+380671171922", address="3 Main Street, Lviv"),
+                     "Jack": make_record("Jack", "+380931171922")})
+        self.assertEqual(index.keys(address_tokens("main street")), {"John", "Jane"})
+        self.assertEqual(index.keys(address_tokens("Main St Lviv")), {"Jane"})
+        index.update("Jane", make_record("Jane", "+380671171922", address="5 Oak Ave, Lviv"))
+        self.assertEqual(index.keys(address_tokens("main st")), {"John"})
+        index.update("John", None)
+        self.assertEqual(index.keys(["kyiv"]), set())
+
+
+class TestAddressBookQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.saver = Saver(Paths.addressbook_file)
+        self.saver.load = MagicMock(return_value={})
+        self.saver.save = MagicMock()
+        self.addressbook = AddressBook(self.saver)
+        self.addressbook.add_record("John", make_record(
+            "John", "+380671111111", "john@example.com", "15.03.1990", "1 Main St"))
+        self.addressbook.add_record("Jane", make_record(
+            "Jane", "+380931111111", "jane@example.com", "20.03.1985"))
+        self.addressbook.add_record("Bob", make_record(
+            "Bob", "+380672222222", "bob@other.org", "01.07.2000"))
+
+    def names(self, query):
+        return [record.name.value for record in self.addressbook.query(query)]
+
+    def test_query(self):
+        self.assertEqual(self.names("domain=example.com AND month=mar AND phone^=+38067"),
+                         ["John"])
+        self.assertEqual(self.names("phone^=+38067 OR birthday<01.01.1988"),
+                         ["Bob", "Jane", "John"])
+        self.assertEqual(self.names("month=3..7 AND NOT name=jane"), ["Bob", "John"])
+        self.assertEqual(self.names('address~="main st"'), ["John"])
+
+    def test_indexes_follow_changes(self):
+        self.names("domain=example.com")
+        record = self.addressbook.find_by_name("John")
+        record.email = "john@other.org"
+        self.addressbook.update_record("John", record)
+        self.addressbook.delete_record("Jane")
+        self.addressbook.add_record("Ann", make_record("Ann", "+380501111111", "ann@example.com"))
+        self.assertEqual(self.names("domain=example.com"), ["Ann"])
+        self.assertEqual(self.names("domain=other.org"), ["Bob", "John"])
+
+    def test_most_selective_index_is_read(self):
+        query = parse("domain=example.com AND name=bob")
+        with patch.object(Term, "candidates", autospec=True,
+                          side_effect=Term.candidates) as candidates:
+            self.assertEqual(self.addressbook.query(query), [])
+        self.assertEqual([call.args[0].field for call in candidates.call_args_list], ["name"])
+
+    def test_find_uses_exact_values(self):
+        self.assertEqual(self.addressbook.find("email", "bob@other.org").name.value, "Bob")
+        self.assertIsNone(self.addressbook.find("email", "BOB@other.org"))
+        self.assertEqual(self.addressbook.find("birthday", "20.03.1985").name.value, "Jane")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""test suit for the birthday reminders"""
+# flake8: noqa
+import conftest
+import unittest
+from datetime import date
+from unittest.mock import MagicMock
+from constants import Paths
+from models import Record
+from reminders import BirthdayScheduler, next_occurrence
+from repository import AddressBook, Saver
+
+
+def make_record(name, birthday=None):
+    record = Record(name)
+    if birthday:
+        record.birthday = birthday
+    return record
+
+
+class TestNextOccurrence(unittest.TestCase):
+
+    def test_this_or_next_year(self):
+        self.assertEqual(next_occurrence("10.03.1990", date(2025, 3, 10)), date(2025, 3, 10))
+        self.assertEqual(next_occurrence("10.03.1990", date(2025, 3, 11)), date(2026, 3, 10))
+
+    def test_leap_day(self):
+        self.assertEqual(next_occurrence("29.02.2000", date(2025, 1, 1)), date(2025, 2, 28))
+        self.assertEqual(next_occurrence("29.02.2000", date(2028, 1, 1)), date(2028, 2, 29))
+        self.assertIsNone(next_occurrence("31.02.2000", date(2025, 1, 1)))
+
+
+class TestBirthdayScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = BirthdayScheduler()
+        self.scheduler.build({
+            "John": make_record("John", "05.01.1990"),
+            "Jane": make_record("Jane", "02.01.1985"),
+            "Jack": make_record("Jack"),
+        }, date(2025, 1, 1))
+
+    def test_due_birthdays_are_reported_once(self):
+        self.assertEqual(self.scheduler.due(date(2025, 1, 1)), [])
+        self.assertEqual(self.scheduler.due(date(2025, 1, 1), days=1),
+                         [(date(2025, 1, 2), "Jane")])
+        self.assertEqual(self.scheduler.due(date(2025, 1, 2)), [])
+        self.assertEqual(self.scheduler.peek(), (date(2025, 1, 5), "John"))
+
+    def test_passed_birthdays_roll_forward(self):
+        self.assertEqual(self.scheduler.due(date(2025, 1, 4), days=1),
+                         [(date(2025, 1, 5), "John")])
+        self.assertEqual(self.scheduler.peek(), (date(2026, 1, 2), "Jane"))
+
+    def test_changes_reschedule(self):
+        self.scheduler.update("John", make_record("John", "01.01.1990"))
+        self.scheduler.update("Jane", None)
+        self.scheduler.update("Jack", make_record("Jack", "03.01.2000"))
+        self.assertEqual(self.scheduler.due(date(2025, 1, 1), days=7),
+                         [(date(2025, 1, 1), "John"), (date(2025, 1, 3), "Jack")])
+        self.assertEqual(len(self.scheduler), 2)
+
+
+class TestAddressBookReminders(unittest.TestCase):
+
+    def test_due_birthdays_follow_changes(self):
+        saver = Saver(Paths.addressbook_file)
+        saver.load = MagicMock(return_value={})
+        saver.save = MagicMock()
+        book = AddressBook(saver)
+        book.add_record("John", make_record("John", "05.01.1990"))
+        self.assertEqual(book.due_birthdays(0, date(2025, 1, 1)), [])
+        book.add_record("Jane", make_record("Jane", "01.01.1990"))
+        due = book.due_birthdays(0, date(2025, 1, 1))
+        self.assertEqual([(record.name.value, day) for record, day in due],
+                         [("Jane", date(2025, 1, 1))])
+        book.delete_record("John")
+        self.assertEqual(book.due_birthdays(7, date(2025, 1, 1)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+"""test suit for repositories"""
+# flake8: noqa
+import conftest
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+from constants import Paths
+from repository import AddressBook, NotesBook, Saver, WriteBehindSaver
+from models import Note, Record
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.saver = Saver(Paths.addressbook_file)
+        self.saver.load = MagicMock(return_value={})
+        self.saver.save = MagicMock()
+        self.addressbook = AddressBook(self.saver)
+        self.addressbook.add_record("John", Record("John"))
+
+    def test_snapshot_is_reused_while_book_is_unchanged(self):
+        snapshot = self.addressbook.snapshot()
+        self.assertIs(snapshot, self.addressbook.snapshot())
+        self.assertEqual(snapshot.version, self.addressbook.version)
+
+    def test_snapshot_does_not_see_later_writes(self):
+        snapshot = self.addressbook.snapshot()
+        self.addressbook.add_record("Jane", Record("Jane"))
+        self.addressbook.delete_record("John")
+        self.assertEqual(list(snapshot), ["John"])
+        self.assertEqual(list(self.addressbook.snapshot()), ["Jane"])
+
+    def test_snapshot_does_not_see_record_changes(self):
+        snapshot = self.addressbook.snapshot()
+        record = self.addressbook.find_by_name("John")
+        record.add_phone("+380981171922")
+        self.addressbook.update_record("John", record)
+        self.assertEqual(snapshot["John"].phones, [])
+        self.assertEqual(len(self.addressbook.find_by_name("John").phones), 1)
+
+    def test_snapshot_does_not_see_edits_of_earlier_checkout(self):
+        record = self.addressbook.find_by_name("John")
+        snapshot = self.addressbook.snapshot()
+        record.add_phone("+380981171922")
+        self.assertEqual(snapshot["John"].phones, [])
+        self.addressbook.update_record("John", record)
+        self.assertEqual(snapshot["John"].phones, [])
+        self.assertEqual(len(self.addressbook.get_record("John").phones), 1)
+
+    def test_saver_gets_snapshot_of_new_version(self):
+        self.addressbook.add_record("Jane", Record("Jane"))
+        saved = self.saver.save.call_args.args[0]
+        self.assertEqual(saved.version, self.addressbook.version)
+        self.assertIn("Jane", saved)
+
+
+class TestSnapshotIteration(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addressbook = AddressBook(Saver(os.path.join(self.directory.name, "addressbook.pkl")))
+        for name in ("Ann", "Bob", "Cid"):
+            self.addressbook.add_record(name, Record(name))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_writes_while_iterating_get_all(self):
+        records = iter(self.addressbook.get_all())
+        next(records)
+        self.addressbook.add_record("Dan", Record("Dan"))
+        self.addressbook.add_record("Eve", Record("Eve"))
+        self.assertEqual(len(list(records)), 2)
+        self.assertEqual(len(self.addressbook), 5)
+
+    def test_writes_while_iterating_snapshot(self):
+        names = iter(self.addressbook.snapshot())
+        next(names)
+        self.addressbook.add_record("Dan", Record("Dan"))
+        self.addressbook.add_record("Eve", Record("Eve"))
+        self.assertEqual(len(list(names)), 2)
+
+
+class CountingDict(dict):
+    copies = 0
+
+    def copy(self):
+        CountingDict.copies += 1
+        return CountingDict(self)
+
+
+class TestCopyOnWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        saver = Saver(os.path.join(self.directory.name, "addressbook.pkl"))
+        saver.load = MagicMock(return_value=CountingDict())
+        self.addressbook = AddressBook(saver)
+        CountingDict.copies = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_writes_copy_only_while_a_snapshot_is_alive(self):
+        for i in range(50):
+            self.addressbook.add_record(f"Name{i}", Record(f"Name{i}"))
+        self.assertEqual(CountingDict.copies, 0)
+        snapshot = self.addressbook.snapshot()
+        for i in range(50):
+            self.addressbook.delete_record(f"Name{i}")
+        # One copy of the keys for the first write, none for the others
+        self.assertEqual(CountingDict.copies, 1)
+        self.assertEqual(len(snapshot), 50)
+        self.assertEqual(len(self.addressbook), 0)
+
+
+class TestNoteDates(unittest.TestCase):
+
+    def setUp(self):
+        self.saver = Saver(Paths.notesbook_file)
+        self.saver.load = MagicMock(return_value={})
+        self.saver.save = MagicMock()
+        self.notesbook = NotesBook(self.saver)
+        for day in range(1, 6):
+            key = f"note{day}"
+            self.notesbook.add(key, Note(key, "text", datetime(2024, 1, day, 12)))
+
+    def test_find_by_creation_date(self):
+        notes = self.notesbook.find_by_date(datetime(2024, 1, 2), datetime(2024, 1, 4, 23, 59))
+        self.assertEqual([note.key for note in notes], ["note2", "note3", "note4"])
+
+    def test_latest_follows_updates(self):
+        note = self.notesbook.find_by_key("note1")
+        note.text = "changed"
+        self.notesbook.update_note("note1", note)
+        self.assertGreater(note.modify_date, note.create_date)
+        self.assertEqual([n.key for n in self.notesbook.latest(2)], ["note1", "note5"])
+        self.assertEqual([n.key for n in self.notesbook.latest(2, "created")], ["note5", "note4"])
+        self.notesbook.delete_note("note1")
+        self.assertEqual([n.key for n in self.notesbook.latest(1)], ["note5"])
+
+    def test_find_by_tag_follows_changes(self):
+        for key in ("note3", "note1"):
+            note = self.notesbook.find_by_key(key)
+            note.add_tag("work")
+            self.notesbook.update_note(key, note)
+        self.assertEqual([n.key for n in self.notesbook.find_by_tag("work")],
+                         ["note1", "note3"])
+        note = self.notesbook.find_by_key("note3")
+        note.remove_tag("work")
+        self.notesbook.update_note("note3", note)
+        self.notesbook.delete_note("note1")
+        self.assertEqual(self.notesbook.find_by_tag("work"), [])
+        self.assertEqual(self.notesbook.find_by_tag("Work"), [])
+
+
+class TestWriteBehindSaver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "addressbook.pkl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_changes_are_coalesced_until_flush(self):
+        saver = WriteBehindSaver(self.path, delay=60)
+        addressbook = AddressBook(saver)
+        addressbook.add_record("John", Record("John"))
+        addressbook.add_record("Jane", Record("Jane"))
+        self.assertEqual(addressbook.pending_changes, 2)
+        self.assertFalse(os.path.exists(self.path))
+        addressbook.close()
+        self.assertEqual(addressbook.pending_changes, 0)
+        self.assertEqual(sorted(Saver(self.path).load()), ["Jane", "John"])
+
+    def test_pending_write_does_not_hold_a_snapshot(self):
+        saver = WriteBehindSaver(self.path, delay=60)
+        saver.load = MagicMock(return_value=CountingDict())
+        addressbook = AddressBook(saver)
+        CountingDict.copies = 0
+        for i in range(20):
+            addressbook.add_record(f"Name{i}", Record(f"Name{i}"))
+        self.assertEqual(addressbook.pending_changes, 20)
+        self.assertEqual(addressbook._live_snapshots, 0)
+        self.assertEqual(CountingDict.copies, 0)
+        addressbook.close()
+        self.assertEqual(len(Saver(self.path).load()), 20)
+
+    def test_write_during_edit_persists_whole_values(self):
+        saver = WriteBehindSaver(self.path, delay=60)
+        addressbook = AddressBook(saver)
+        record = Record("John")
+        record.add_phone("+380981171922")
+        record.email = "old@example.com"
+        addressbook.add_record("John", record)
+        record = addressbook.find_by_name("John")
+        record.email = "new@example.com"
+        addressbook.add_record("Jane", Record("Jane"))
+        # The write lands between the two fields of the edit
+        saver.flush()
+        record.remove_phone("+380981171922")
+        record.add_phone("+380987654321")
+        saved = Saver(self.path).load()["John"]
+        self.assertEqual(saved.email.value, "old@example.com")
+        self.assertTrue(saved.has_phone("+380981171922"))
+        addressbook.update_record("John", record)
+        addressbook.close()
+        saved = Saver(self.path).load()["John"]
+        self.assertEqual(saved.email.value, "new@example.com")
+        self.assertEqual([phone.value for phone in saved.phones], ["+380987654321"])
+
+    def test_threshold_triggers_background_write(self):
+        saver = WriteBehindSaver(self.path, delay=60, max_pending=2)
+        addressbook = AddressBook(saver)
+        addressbook.add_record("John", Record("John"))
+        addressbook.add_record("Jane", Record("Jane"))
+        deadline = time.monotonic() + 5
+        while saver.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        saver.flush()
+        self.assertEqual(sorted(Saver(self.path).load()), ["Jane", "John"])
+        saver.close()
+
+    def test_delay_triggers_background_write(self):
+        saver = WriteBehindSaver(self.path, delay=0.01)
+        saver.save({"John": Record("John")})
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        saver.close()
+        self.assertIn("John", Saver(self.path).load())
+
+
+if __name__ == '__main__':
+    unittest.main()
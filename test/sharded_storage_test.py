@@ -0,0 +1,164 @@
+"""test suit for the sharded storage"""
+# flake8: noqa
+import conftest
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from repository import NotesBook, Saver
+import sharded_storage
+from blob_storage import BlobText
+from sharded_storage import ShardedSaver, shard_of
+from models import Note
+
+
+class TestShardedSaver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.shards = os.path.join(self.directory.name, "notesbook")
+        self.legacy = os.path.join(self.directory.name, "notesbook.pkl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_notes(self, notesbook, *keys):
+        for key in keys:
+            notesbook.add(key, Note(key, f"text of {key}", datetime.now()))
+
+    def test_notes_survive_reload(self):
+        notesbook = NotesBook(ShardedSaver(self.shards, shards=4))
+        self.add_notes(notesbook, "first", "second", "third")
+        notesbook.delete_note("second")
+        reloaded = NotesBook(ShardedSaver(self.shards, shards=4))
+        self.assertEqual(sorted(reloaded), ["first", "third"])
+        self.assertEqual(reloaded.find_by_key("third").text, "text of third")
+
+    def test_change_rewrites_only_its_shard(self):
+        notesbook = NotesBook(ShardedSaver(self.shards, shards=4))
+        self.add_notes(notesbook, "first", "second", "third")
+        note = notesbook.find_by_key("first")
+        note.add_tag("tag")
+        with patch("sharded_storage.os.replace") as replace:
+            notesbook.update_note("first", note)
+        replace.assert_called_once()
+        self.assertTrue(replace.call_args.args[1].endswith(
+            f"shard-{shard_of('first', 4):04d}.pkl"))
+
+    def test_existing_manifest_keeps_number_of_shards(self):
+        self.add_notes(NotesBook(ShardedSaver(self.shards, shards=4)), "first")
+        saver = ShardedSaver(self.shards, shards=32)
+        self.assertEqual(list(NotesBook(saver)), ["first"])
+        self.assertEqual(saver.shards, 4)
+
+    def test_shards_are_read_on_first_access(self):
+        keys = [f"note{i}" for i in range(20)]
+        self.add_notes(NotesBook(ShardedSaver(self.shards, shards=4)), *keys)
+        notesbook = NotesBook(ShardedSaver(self.shards, shards=4))
+        self.assertEqual(notesbook.data.resident(), {})
+        self.assertEqual(notesbook.find_by_key("note1").text, "text of note1")
+        shard = shard_of("note1", 4)
+        self.assertEqual(sorted(notesbook.data.resident()),
+                         sorted(key for key in keys if shard_of(key, 4) == shard))
+        self.assertEqual(len(notesbook), 20)
+        self.assertEqual(len(notesbook.data.resident()), 20)
+
+    def test_snapshot_shares_unchanged_shards(self):
+        keys = [f"note{i}" for i in range(20)]
+        self.add_notes(NotesBook(ShardedSaver(self.shards, shards=4)), *keys)
+        notesbook = NotesBook(ShardedSaver(self.shards, shards=4))
+        snapshot = notesbook.snapshot()
+        notesbook.update_note("note1", Note("note1", "new text", datetime.now()))
+        self.assertEqual(snapshot["note1"].text, "text of note1")
+        self.assertEqual(notesbook.find_by_key("note1").text, "new text")
+        changed = shard_of("note1", 4)
+        for shard in range(4):
+            shared = snapshot._data.part(shard) is notesbook.data.part(shard)
+            self.assertEqual(shared, shard != changed)
+
+    def test_legacy_file_is_migrated_on_first_save(self):
+        self.add_notes(NotesBook(Saver(self.legacy)), "first", "second")
+        notesbook = NotesBook(ShardedSaver(self.shards, 4, self.legacy))
+        self.assertEqual(sorted(notesbook), ["first", "second"])
+        self.add_notes(notesbook, "third")
+        reloaded = NotesBook(ShardedSaver(self.shards, 4))
+        self.assertEqual(sorted(reloaded), ["first", "second", "third"])
+
+
+class TestBlobs(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.shards = os.path.join(self.directory.name, "notesbook")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self):
+        return NotesBook(ShardedSaver(self.shards, shards=4, blobs=True))
+
+    def test_texts_are_loaded_lazily(self):
+        notesbook = self.load()
+        notesbook.add("first", Note("first", "Some text", datetime.now()))
+        note = self.load().find_by_key("first")
+        self.assertIsInstance(note._text, BlobText)
+        self.assertEqual(note.text, "Some text")
+        self.assertIn("Text: Some text", str(note))
+
+    def test_updated_text_is_stored(self):
+        notesbook = self.load()
+        notesbook.add("first", Note("first", "Old text", datetime.now()))
+        note = notesbook.find_by_key("first")
+        note.text = "New text"
+        notesbook.update_note("first", note)
+        note.add_tag("tag")
+        notesbook.update_note("first", note)
+        reloaded = self.load().find_by_key("first")
+        self.assertEqual(reloaded.text, "New text")
+        self.assertEqual(reloaded.tags, ["tag"])
+
+    def test_blob_file_is_compacted(self):
+        notesbook = self.load()
+        with patch.object(sharded_storage, "BLOB_GARBAGE_ALLOWANCE", 10):
+            for text in ("first text", "second text", "third text"):
+                note = Note("first", text, datetime.now())
+                notesbook.update_note("first", note)
+        blobs = [name for name in os.listdir(self.shards)
+                 if name.endswith(".blob")]
+        self.assertEqual(len(blobs), 1)
+        self.assertEqual(self.load().find_by_key("first").text, "third text")
+
+    def test_garbage_of_earlier_sessions_is_compacted(self):
+        notesbook = self.load()
+        for text in ("first text", "second text", "third text"):
+            notesbook.update_note("first", Note("first", text, datetime.now()))
+        notesbook.add("second", Note("second", "other text", datetime.now()))
+        notesbook = self.load()
+        # Only the text replaced now is over the allowance
+        with patch.object(sharded_storage, "BLOB_GARBAGE_ALLOWANCE", 5):
+            notesbook.update_note("first", Note("first", "fourth text", datetime.now()))
+        blobs = [name for name in os.listdir(self.shards) if name.endswith(".blob")]
+        self.assertEqual(blobs, ["bodies-0002.blob"])
+        reloaded = self.load()
+        self.assertEqual(reloaded.find_by_key("first").text, "fourth text")
+        self.assertEqual(reloaded.find_by_key("second").text, "other text")
+
+    def test_snapshot_reads_texts_after_compaction(self):
+        notesbook = self.load()
+        notesbook.add("first", Note("first", "first text", datetime.now()))
+        snapshot = notesbook.snapshot()
+        with patch.object(sharded_storage, "BLOB_GARBAGE_ALLOWANCE", 10):
+            for text in ("second text", "third text", "fourth text"):
+                notesbook.update_note("first", Note("first", text, datetime.now()))
+        # The old blob file is kept while the snapshot refers to it
+        blobs = [name for name in os.listdir(self.shards) if name.endswith(".blob")]
+        self.assertEqual(len(blobs), 2)
+        self.assertEqual(snapshot["first"].text, "first text")
+        del snapshot
+        blobs = [name for name in os.listdir(self.shards) if name.endswith(".blob")]
+        self.assertEqual(len(blobs), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""test suit for the storage shared between processes"""
+# flake8: noqa
+import conftest
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from repository import AddressBook
+from shared_storage import FileLock, SharedSaver
+from models import Record
+
+
+def add_contacts(path, prefix, count):
+    addressbook = AddressBook(SharedSaver(path, compact_every=7))
+    for i in range(count):
+        addressbook.refresh()
+        name = f"{prefix}{i}"
+        addressbook.add_record(name, Record(name))
+
+
+class TestSharedSaver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "addressbook.pkl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_refresh_applies_changes_of_other_process(self):
+        first = AddressBook(SharedSaver(self.path))
+        second = AddressBook(SharedSaver(self.path))
+        first.add_record("John", Record("John"))
+        self.assertTrue(second.refresh())
+        self.assertIn("John", second)
+        second.delete_record("John")
+        second.add_record("Jane", Record("Jane"))
+        self.assertTrue(first.refresh())
+        self.assertEqual(list(first), ["Jane"])
+        self.assertFalse(first.refresh())
+
+    def test_refresh_reloads_after_compaction(self):
+        first = AddressBook(SharedSaver(self.path, compact_every=2))
+        second = AddressBook(SharedSaver(self.path, compact_every=2))
+        second.add_record("Old", Record("Old"))
+        first.refresh()
+        for name in ("John", "Jane", "Jack"):
+            first.add_record(name, Record(name))
+        first.delete_record("Old")
+        self.assertTrue(second.refresh())
+        self.assertEqual(sorted(second), ["Jack", "Jane", "John"])
+        self.assertEqual(sorted(SharedSaver(self.path).load()),
+                         ["Jack", "Jane", "John"])
+
+    def test_write_keeps_changes_of_other_process(self):
+        first = AddressBook(SharedSaver(self.path))
+        second = AddressBook(SharedSaver(self.path))
+        first.add_record("John", Record("John"))
+        second.add_record("Jane", Record("Jane"))
+        self.assertEqual(sorted(SharedSaver(self.path).load()),
+                         ["Jane", "John"])
+        second.refresh()
+        self.assertEqual(sorted(second), ["Jane", "John"])
+
+    def test_batched_changes_are_journaled_together(self):
+        first = AddressBook(SharedSaver(self.path))
+        second = AddressBook(SharedSaver(self.path))
+        first.add_record("John", Record("John"))
+        second.refresh()
+        first._apply({"John": None, "Jane": Record("Jane"), "Jack": Record("Jack")})
+        self.assertTrue(second.refresh())
+        self.assertEqual(sorted(second), ["Jack", "Jane"])
+        self.assertEqual(sorted(SharedSaver(self.path).load()), ["Jack", "Jane"])
+
+    def test_concurrent_processes_do_not_lose_writes(self):
+        processes = [multiprocessing.Process(target=add_contacts,
+                                             args=(self.path, prefix, 20))
+                     for prefix in ("a", "b")]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(len(SharedSaver(self.path).load()), 40)
+
+
+class TestFileLock(unittest.TestCase):
+
+    def test_waits_are_counted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "book.lock")
+            holder, waiter = FileLock(path), FileLock(path)
+            holder.acquire()
+            thread = threading.Thread(target=lambda: (waiter.acquire(), waiter.release()))
+            thread.start()
+            time.sleep(0.05)
+            holder.release()
+            thread.join()
+            self.assertEqual((holder.acquisitions, holder.contended), (1, 0))
+            self.assertEqual((waiter.acquisitions, waiter.contended), (1, 1))
+            self.assertGreater(waiter.wait_time, 0.02)
+
+    def test_threads_of_a_process_take_turns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock = FileLock(os.path.join(directory, "book.lock"))
+            holders = []
+            overlaps = []
+
+            def hold():
+                for _ in range(50):
+                    with lock:
+                        with lock:
+                            holders.append(threading.get_ident())
+                            if len(holders) > 1:
+                                overlaps.append(list(holders))
+                            time.sleep(0.0001)
+                            holders.remove(threading.get_ident())
+
+            threads = [threading.Thread(target=hold) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(overlaps, [])
+            self.assertEqual(lock.acquisitions, 200)
+
+    def test_threads_refresh_a_shared_book(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "addressbook.pkl")
+            writer = AddressBook(SharedSaver(path))
+            reader = AddressBook(SharedSaver(path))
+
+            def refresh():
+                for _ in range(50):
+                    reader.refresh()
+
+            threads = [threading.Thread(target=refresh) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for i in range(50):
+                writer.add_record(f"Name{i}", Record(f"Name{i}"))
+            for thread in threads:
+                thread.join()
+            reader.refresh()
+            self.assertEqual(sorted(reader), sorted(writer))
+
+
+if __name__ == '__main__':
+    unittest.main()
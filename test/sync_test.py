@@ -0,0 +1,111 @@
+"""test suit for the synchronization of replicas"""
+# flake8: noqa
+import conftest
+import tempfile
+import unittest
+from datetime import datetime
+from change_feed import record_fields
+from models import Note, Record
+from sync import MerkleTree, open_books, sync, sync_directories
+
+
+def make_record(name, phone="0501234567", email=None):
+    record = Record(name)
+    record.add_phone(phone)
+    if email:
+        record.email = email
+    return record
+
+
+class TestMerkleTree(unittest.TestCase):
+
+    def test_equal_data_equal_root(self):
+        data = {f"Name{i}": make_record(f"Name{i}") for i in range(50)}
+        first, second = MerkleTree(record_fields), MerkleTree(record_fields)
+        first.build(data)
+        second.build(dict(reversed(list(data.items()))))
+        self.assertEqual(first.hash(), second.hash())
+        self.assertEqual(MerkleTree(record_fields).hash(), "")
+
+    def test_update_changes_path_only(self):
+        data = {f"Name{i}": make_record(f"Name{i}") for i in range(50)}
+        tree = MerkleTree(record_fields)
+        tree.build(data)
+        root = tree.hash()
+        tree.update("Name1", make_record("Name1", "0509999999"))
+        self.assertNotEqual(tree.hash(), root)
+        tree.update("Name1", data["Name1"])
+        self.assertEqual(tree.hash(), root)
+        for key in data:
+            tree.update(key, None)
+        self.assertEqual(tree.hash(), "")
+
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        self.left_directory = tempfile.TemporaryDirectory()
+        self.right_directory = tempfile.TemporaryDirectory()
+        self.left = open_books(self.left_directory.name)
+        self.right = open_books(self.right_directory.name)
+
+    def tearDown(self):
+        for book in list(self.left.values()) + list(self.right.values()):
+            book.close()
+        self.left_directory.cleanup()
+        self.right_directory.cleanup()
+
+    def test_sync_directories(self):
+        for books in (self.left, self.right):
+            books["addressbook"].add_record("Shared", make_record("Shared"))
+        self.left["addressbook"].add_record("Left", make_record("Left"))
+        self.right["addressbook"].add_record("Right", make_record("Right"))
+        self.left["addressbook"].update_record("Shared", make_record("Shared", email="s@example.com"))
+        self.right["addressbook"].update_record("Shared", make_record("Shared", "0507654321"))
+        self.right["notesbook"].add("idea", Note("idea", "sync the books", datetime.now()))
+        for books in (self.left, self.right):
+            for book in books.values():
+                book.close()
+
+        results = sync_directories(self.left_directory.name, self.right_directory.name)
+        self.assertEqual(results["addressbook"]["to_left"], 1)
+        self.assertEqual(results["addressbook"]["to_right"], 1)
+        self.assertEqual(results["addressbook"]["resolved"], 1)
+        self.assertEqual(results["notesbook"]["to_left"], 1)
+
+        self.left = open_books(self.left_directory.name)
+        self.right = open_books(self.right_directory.name)
+        for books in (self.left, self.right):
+            self.assertEqual(sorted(books["addressbook"]), ["Left", "Right", "Shared"])
+            shared = books["addressbook"].find_by_name("Shared")
+            self.assertEqual(shared.email.value, "s@example.com")
+            self.assertEqual(len(shared.phones), 2)
+            self.assertEqual(books["notesbook"].find_by_key("idea").text, "sync the books")
+        for name in ("addressbook", "notesbook"):
+            self.assertEqual(self.left[name].merkle_hashes([""]), self.right[name].merkle_hashes([""]))
+            self.assertEqual(sync(self.left[name], self.right[name]),
+                             {"hashes": 2, "to_left": 0, "to_right": 0, "resolved": 0})
+
+    def test_only_differences_are_exchanged(self):
+        changes = {f"Name{i}": make_record(f"Name{i}") for i in range(1000)}
+        self.left["addressbook"].put_many(changes)
+        self.right["addressbook"].put_many({key: record.copy() for key, record in changes.items()})
+        self.left["addressbook"].add_record("New", make_record("New"))
+        result = sync(self.left["addressbook"], self.right["addressbook"])
+        self.assertEqual(result["to_right"], 1)
+        self.assertEqual(result["to_left"], 0)
+        self.assertLess(result["hashes"], 200)
+        self.assertIn("New", self.right["addressbook"])
+
+    def test_newer_note_wins(self):
+        self.left["notesbook"].add("plan", Note("plan", "old text", datetime.now()))
+        note = Note("plan", "new text", datetime.now())
+        note.modify_date = datetime(2100, 1, 1)
+        self.right["notesbook"].add("plan", note)
+        result = sync(self.left["notesbook"], self.right["notesbook"])
+        self.assertEqual(result["resolved"], 1)
+        self.assertEqual(self.left["notesbook"].find_by_key("plan").text, "new text")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""test suit for the full-text note search"""
+# flake8: noqa
+import conftest
+import random
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+from constants import Paths
+from models import Note
+from repository import NotesBook, Saver
+from text_search import TextIndex, tokenize
+
+
+def note(key, text):
+    return Note(key, text, datetime(2024, 1, 1))
+
+
+class TestTextIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TextIndex()
+        self.index.build({
+            "a": note("a", "buy milk and bread"),
+            "b": note("b", "milk milk milk"),
+            "c": note("c", "call the bank about the loan"),
+        })
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Buy MILK, bread!"), ["buy", "milk", "bread"])
+
+    def test_rare_and_frequent_terms_rank_higher(self):
+        ranked = self.index.search("milk bread")
+        self.assertEqual([key for key, _ in ranked], ["a", "b"])
+        ranked = self.index.search("milk")
+        self.assertEqual([key for key, _ in ranked], ["b", "a"])
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.search("milk", limit=1)), 1)
+        self.assertEqual(self.index.search("nothing"), [])
+
+    def test_updates_are_incremental(self):
+        self.index.update("c", note("c", "bread recipe"))
+        self.assertEqual(self.index.document_frequency("bread"), 2)
+        self.assertEqual(self.index.document_frequency("bank"), 0)
+        self.index.update("a", None)
+        self.assertEqual(self.index.document_frequency("milk"), 1)
+        self.assertEqual(len(self.index), 2)
+
+    def test_pruned_top_results_match_full_ranking(self):
+        rng = random.Random(7)
+        words = [f"w{i}" for i in range(30)]
+        index = TextIndex()
+        index.build({
+            str(i): note(str(i), " ".join(rng.choices(words, weights=range(30, 0, -1),
+                                                      k=rng.randint(1, 20))))
+            for i in range(500)
+        })
+        # Deleted notes leave the frequency bounds of their terms behind
+        for i in range(20):
+            index.update(str(i), None)
+        for _ in range(50):
+            text = " ".join(rng.sample(words, rng.randint(1, 4)))
+            full = index.search(text, limit=len(index))
+            for limit in (1, 5, 20):
+                top = index.search(text, limit=limit)
+                self.assertEqual([round(score, 9) for _, score in top],
+                                 [round(score, 9) for _, score in full[:limit]])
+
+
+class TestNotesBookSearch(unittest.TestCase):
+
+    def setUp(self):
+        saver = Saver(Paths.notesbook_file)
+        saver.load = MagicMock(side_effect=dict)
+        saver.save = MagicMock()
+        self.book = NotesBook(saver)
+
+    def test_search_follows_changes(self):
+        self.book.add("a", note("a", "buy milk"))
+        self.assertEqual(self.book.search("milk")[0][0].key, "a")
+        self.book.add("b", note("b", "milk milk"))
+        self.book.update_note("a", note("a", "buy bread"))
+        self.assertEqual([n.key for n, _ in self.book.search("milk")], ["b"])
+        self.book.delete_note("b")
+        self.assertEqual(self.book.search("milk"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""test suit for the validation of single values and of columns of values"""
+# flake8: noqa
+import conftest
+import unittest
+from datetime import date
+from validation import Validation, normalize_phone
+
+
+class TestValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = Validation()
+
+    def test_single_values(self):
+        self.assertTrue(self.validator.validate_phone("+38 (050) 123-45-67"))
+        self.assertFalse(self.validator.validate_phone("123"))
+        self.assertTrue(self.validator.validate_email("ann@example.com"))
+        self.assertFalse(self.validator.validate_birthday("32.01.2000"))
+        self.assertFalse(self.validator.validate_text(""))
+
+    def test_batch_masks_and_normalized_values(self):
+        mask, phones = self.validator.validate_batch(
+            "phone", ["+38 050 123 45 67", "123", "380501234567", ""])
+        self.assertEqual(mask, [True, False, True, False])
+        self.assertEqual(phones, ["+380501234567", None, "+380501234567", None])
+        mask, emails = self.validator.validate_batch("email", ["Ann@Example.com", "ann"])
+        self.assertEqual((mask, emails), ([True, False], ["ann@example.com", None]))
+        mask, birthdays = self.validator.validate_batch(
+            "birthday", ["29.02.2000", "31.02.2000", "29.02.2001", "01.13.2000"])
+        self.assertEqual(mask, [True, False, False, False])
+        self.assertEqual(birthdays, [date(2000, 2, 29), None, None, None])
+        self.assertEqual(self.validator.validate_batch("text", ["a", ""]), ([True, False], ["a", None]))
+
+    def test_batch_agrees_with_single_values(self):
+        values = ["Ann", "ann-marie", "Ann1", "", "a\nb", "Ann\n", "Bob"] * 100
+        mask, names = self.validator.validate_batch("name", values)
+        self.assertEqual(mask, [self.validator.validate_name(value) for value in values])
+        self.assertEqual(names[:7], ["Ann", "ann-marie", None, None, None, "Ann", "Bob"])
+
+    def test_normalize_batch_does_not_validate(self):
+        phones = ["+38 (098) 117-19-22", "0981171922", "123", None]
+        self.assertEqual(self.validator.normalize_batch("phone", phones),
+                         ["+380981171922", "+380981171922", "+123", None])
+        self.assertEqual(self.validator.normalize_batch("phone", phones[:3]),
+                         [normalize_phone(phone) for phone in phones[:3]])
+        self.assertEqual(self.validator.normalize_batch("email", [" Ann@Example.com"]),
+                         ["ann@example.com"])
+        self.assertEqual(self.validator.normalize_batch("birthday", ["31.02.2000", "x"]),
+                         [None, None])
+        self.assertEqual(self.validator.normalize_batch("name", ["Ann"]), ["Ann"])
+
+    def test_batch_edge_cases(self):
+        self.assertEqual(self.validator.validate_batch("phone", []), ([], []))
+        with self.assertRaises(ValueError):
+            self.validator.validate_batch("color", ["red"])
+        columns = self.validator.validate_columns({"name": ["Ann"], "tag": ["a b"]})
+        self.assertEqual(columns, {"name": ([True], ["Ann"]), "tag": ([False], [None])})
+
+
+if __name__ == '__main__':
+    unittest.main()